@@ -3,13 +3,23 @@
 記事データ収集モジュール (NewsAPI)
 - NewsApiClient を使ってパンダに関する記事を取得
 - 画像はまず API の urlToImage を使い、なければ utils.py で補完
+  (タイトルで関連記事に絞ってから並列に補完する)
 """
 
-import time
+import os
+import hashlib
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
-from typing import Optional, List
+from typing import Dict, Iterator, Optional, List, Tuple
 # 共通ヘルパーをインポート
-from utils import parse_published, get_main_image, validate_image_url
+from utils import parse_published, get_main_image, validate_image_url, deadline_exceeded, SESSION
+from article_index import ArticleIndex, CLAIMED, DUPLICATE
+from url_canonical import canonical_article_url
+from keyword_matcher import get_matcher
+from rate_limiter import get_bucket
+from metrics import METRICS
+from high_water import get_mark, stage_mark
 
 # NewsAPI クライアントのインポート試行
 try:
@@ -17,21 +27,121 @@ try:
 except Exception:
     NewsApiClient = None
 
-def fetch_from_newsapi(newsapi_key: str, max_pages: int = 1, page_size: int = 100) -> List[dict]:
+# --- 設定 ---
+# NewsAPI へのリクエスト頻度 (APIキーごとのバケット。毎秒のリクエスト数 / 連続で送れる数)
+# 既定値はすべてのキーに同じものを使う。キーごとに変える場合は NEWSAPI_KEY_LIMITS に
+# "キーID=毎秒の数/連続で送れる数" をカンマ区切りで指定する (キーIDは実行時に表示する12桁)
+NEWSAPI_RATE_PER_SEC = float(os.environ.get("NEWSAPI_RATE_PER_SEC", 3.0))
+NEWSAPI_BURST = float(os.environ.get("NEWSAPI_BURST", 1))
+# 記事ごとの画像補完を同時に行う数
+NEWSAPI_ENRICH_WORKERS = 8
+# 差分取得: 前回の既読位置よりこの秒数だけ前から問い合わせる (APIへの反映の遅れを吸収する)
+NEWSAPI_FROM_OVERLAP_SEC = 3600
+
+
+def _parse_key_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """NEWSAPI_KEY_LIMITS ("キーID=3/1,キーID=0.5") を {キーID: (毎秒の数, 連続で送れる数)} にする"""
+    limits: Dict[str, Tuple[float, float]] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key_id, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            limits[key_id.strip()] = (float(rate), float(burst) if burst else NEWSAPI_BURST)
+        except ValueError:
+            print(f" [NewsAPI] NEWSAPI_KEY_LIMITS の指定を解釈できません: {item}")
+    return limits
+
+
+NEWSAPI_KEY_LIMITS = _parse_key_limits(os.environ.get("NEWSAPI_KEY_LIMITS", ""))
+
+
+def newsapi_key_id(newsapi_key: str) -> str:
+    """APIキーを表示・設定に使うためのID (キーのハッシュの先頭12桁)"""
+    return hashlib.sha1(newsapi_key.encode("utf-8")).hexdigest()[:12]
+
+
+def _published_timestamp(item: dict) -> Optional[float]:
+    """APIの publishedAt (例: 2024-01-01T00:00:00Z) を UNIX 秒にする"""
+    value = item.get("publishedAt")
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _from_param(published: Optional[float]) -> Optional[str]:
+    """既読位置の公開時刻から、API の from パラメーター (UTC) を作る"""
+    if published is None:
+        return None
+    start = datetime.fromtimestamp(published - NEWSAPI_FROM_OVERLAP_SEC, timezone.utc)
+    return start.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _build_article(item: dict, deadline: Optional[float]) -> dict:
+    """APIの記事1件を記事辞書に変換する (画像の検証とスクレイピングでの補完を含む)"""
+    url = item["url"].strip()
+    title = item.get("title") or "(無題)"
+    # ★ 共通ヘルパーを使用
+    published_dt = parse_published(item.get("publishedAt") or item.get("published"))
+    image_url = item.get("urlToImage") or item.get("image")
+    source_name = (item.get("source") or {}).get("name") or ""
+
+    # --- 画像検証＆補完 (共通ヘルパーを使用) ---
+    # 時間予算を超過している場合は画像なしで返す
+    if not deadline_exceeded(deadline):
+        # 画像の検証・スクレイピングにかかった時間だけを記録する (結果を返した後の待ち時間は含めない)
+        with METRICS.stage("enrich.newsapi"):
+            if image_url:
+                image_url = image_url.strip()
+                if not validate_image_url(image_url):
+                    print(f" [API画像無効] {image_url}")
+                    image_url = None
+
+            if not image_url:
+                print("   メイン画像を取得中 (スクレイピング fallback)...")
+                # ★ 共通ヘルパーを使用
+                scraped = get_main_image(url)
+                if scraped:
+                    image_url = scraped
+
+    return {
+        "title": title,
+        "article_url": url,
+        "published_at": published_dt.isoformat(),
+        "source_name": source_name or urlparse(url).netloc,
+        "image_url": image_url,
+    }
+
+
+def iter_from_newsapi(newsapi_key: str, max_pages: int = 1, page_size: int = 100,
+                      deadline: Optional[float] = None,
+                      article_index: Optional[ArticleIndex] = None) -> Iterator[dict]:
     """
-    NewsAPIからパンダ関連ニュースを収集し、処理済みの記事辞書のリストを返す。
-    (関数名を変更)
+    NewsAPIからパンダ関連ニュースを収集し、処理済みの記事辞書を順に返すジェネレーター。
+    deadline (time.monotonic() 基準) を超過した場合は、そこで終了する。
+    article_index を渡すと、既知URLの記事は画像取得の前にスキップする。
+    - リクエスト頻度は APIキーごとのトークンバケットで制限する
+    - タイトル判定を画像補完の前に行い、補完は記事ごとに並列で行う
+    - 前回の既読位置 (high_water) があれば from で期間を絞り、前回見た記事は読み飛ばす。
+      既読位置より古い記事を含むページまで来たら、それ以降のページは取得しない
     """
 
     if not NewsApiClient:
         print(" [NewsAPI] newsapi ライブラリが見つかりません。pip install newsapi-python を実行してください。")
-        return []
+        return
     
     if not newsapi_key:
         print(" [NewsAPI] NewsAPIキーが提供されていません。")
-        return []
+        return
 
-    client = NewsApiClient(api_key=newsapi_key)
+    # 共通の SESSION を渡し、ホスト単位の制御 (host_scheduler) を適用する
+    client = NewsApiClient(api_key=newsapi_key, session=SESSION)
+    matcher = get_matcher()
 
     # --- ★ 検索クエリをパンダに特化 ---
     query = (
@@ -44,67 +154,113 @@ def fetch_from_newsapi(newsapi_key: str, max_pages: int = 1, page_size: int = 10
     )
 
     languages = ["en"]
-    collected_articles = [] # 収集した記事を格納するリスト
+    known_skipped = duplicate_skipped = 0
+    seen_skipped = 0
+    # APIキーごとのトークンバケットで、リクエスト頻度を制限する
+    key_id = newsapi_key_id(newsapi_key)
+    rate, burst = NEWSAPI_KEY_LIMITS.get(key_id, (NEWSAPI_RATE_PER_SEC, NEWSAPI_BURST))
+    bucket = get_bucket("newsapi:" + key_id, rate, burst)
     
-    print(f"--- NewsAPI 実行中 (q={query}) ---")
+    print(f"--- NewsAPI 実行中 (キーID {key_id}: 毎秒 {rate:g} 回まで, q={query}) ---")
 
     for lang in languages:
+        mark_key = f"newsapi:{lang}:" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+        mark = get_mark(mark_key) or {}
+        mark_published = mark.get("published")
+        already_seen = set(mark.get("ids") or [])
+        from_param = _from_param(mark_published)
+        if from_param:
+            print(f" [NewsAPI] 差分取得: {from_param} (UTC) 以降の記事を問い合わせます")
+        visited_ids: List[str] = []
+        latest_published: Optional[float] = None
+
         for page in range(1, max_pages + 1):
+            if deadline_exceeded(deadline) or not bucket.acquire(deadline=deadline):
+                print(" [NewsAPI] 時間予算を超過したため、収集を打ち切ります。")
+                return
             try:
                 res = client.get_everything(
                     q=query,
                     language=lang,
                     page=page,
                     page_size=page_size,
-                    sort_by="publishedAt"
+                    sort_by="publishedAt",
+                    from_param=from_param,
                 )
             except Exception as e:
                 print(f" [NewsAPI 取得失敗] lang={lang} page={page} : {e}")
+                METRICS.error("newsapi.page")
                 break
 
             articles = res.get("articles") or []
             if not articles:
                 break
 
+            # 1) タイトル判定と既知URL判定を先に行い、画像補完の対象を絞る
+            candidates = []
+            reached_mark = False
             for item in articles:
                 url = (item.get("url") or "").strip()
                 if not url:
                     continue
 
+                # 既読位置との比較 (publishedAt の新しい順に並んでいる)
+                stamp = _published_timestamp(item)
+                if stamp is not None:
+                    if mark_published is not None and stamp <= mark_published:
+                        reached_mark = True
+                    if latest_published is None or stamp > latest_published:
+                        latest_published = stamp
+                visited_ids.append(url)
+                if url in already_seen:
+                    seen_skipped += 1
+                    continue
+
+                # タイトルに「パンダ」関連の単語が含まれるものだけを採用する
+                # (キーワードは全コレクター共通のリストを使う)
                 title = item.get("title") or "(無題)"
-                # ★ 共通ヘルパーを使用
-                published_dt = parse_published(item.get("publishedAt") or item.get("published"))
-                image_url = item.get("urlToImage") or item.get("image")
-                source_name = (item.get("source") or {}).get("name") or ""
-
-                # --- 画像検証＆補完 (共通ヘルパーを使用) ---
-                if image_url:
-                    image_url = image_url.strip()
-                    if not validate_image_url(image_url):
-                        print(f" [API画像無効] {image_url}")
-                        image_url = None
-
-                if not image_url:
-                    print("   メイン画像を取得中 (スクレイピング fallback)...")
-                    # ★ 共通ヘルパーを使用
-                    scraped = get_main_image(url)
-                    if scraped:
-                        image_url = scraped
-
-                article = {
-                    "title": title,
-                    "article_url": url,
-                    "published_at": published_dt.isoformat(),
-                    "source_name": source_name or urlparse(url).netloc,
-                    "image_url": image_url,
-                }
-                
-                # タイトルに「パンダ」関連の単語が含まれるものだけを最終的に採用する
-                if "panda" in title.lower() or "パンダ" in title or "香香" in title or "シャンシャン" in title:
-                    print(f" [NewsAPI] 新規記事候補: {article['title']}")
-                    collected_articles.append(article)
-                
-            # レート制限対策
-            time.sleep(0.3)
-
-    return collected_articles
\ No newline at end of file
+                matched_terms = matcher.find_terms(title)
+                if not matched_terms:
+                    continue
+
+                # 保存・重複判定は正規化したURLで行う (既読位置は API が返したURLのまま)
+                url = canonical_article_url(url)
+                if article_index is not None:
+                    claimed = article_index.claim_article(url, title)
+                    if claimed != CLAIMED:
+                        if claimed == DUPLICATE:
+                            duplicate_skipped += 1
+                        else:
+                            known_skipped += 1
+                        continue
+
+                print(f" [NewsAPI] 新規記事候補: {title} (一致: {', '.join(matched_terms)})")
+                candidates.append(dict(item, url=url))
+
+            # 2) 画像の検証＆補完は並列に行い、終わったものから順に返す (順序は API の順序のまま)
+            with ThreadPoolExecutor(max_workers=NEWSAPI_ENRICH_WORKERS, thread_name_prefix="newsapi") as executor:
+                yield from executor.map(lambda it: _build_article(it, deadline), candidates)
+            # このページまでを既読位置として仮登録する (保存の成功後に main が確定する)
+            # 締切後に終わったページは登録しない (打ち切られた収集の記事は保存されないことがある)
+            if not deadline_exceeded(deadline):
+                stage_mark(mark_key, latest_published, visited_ids)
+
+            if reached_mark:
+                print(" [NewsAPI] 前回の既読位置に到達したため、以降のページは取得しません。")
+                break
+            if deadline_exceeded(deadline):
+                print(" [NewsAPI] 時間予算を超過したため、収集を打ち切ります。")
+                return
+
+    if article_index is not None:
+        print(f" [NewsAPI] 既知URLのためスキップ: {known_skipped} 件 / 類似記事のためスキップ: {duplicate_skipped} 件")
+        METRICS.count("known_skipped.newsapi", known_skipped)
+        METRICS.count("near_duplicate.newsapi", duplicate_skipped)
+    if seen_skipped:
+        print(f" [NewsAPI] 前回までに処理済みのためスキップ: {seen_skipped} 件")
+    METRICS.count("incremental.seen_skipped.newsapi", seen_skipped)
+
+
+def fetch_from_newsapi(*args, **kwargs) -> List[dict]:
+    """iter_from_newsapi の結果をリストで返す (引数は iter_from_newsapi と同じ)"""
+    return list(iter_from_newsapi(*args, **kwargs))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+既知記事インデックスモジュール
+- DBに登録済みの記事URLと、今回の実行で処理を始めた記事URLを保持する
+- コレクターは画像検証やスクレイピングの前に claim_article() を呼び、
+  既知のURLなら重い処理をせずにスキップする
+- タイトルを渡すと、別URLの類似記事 (同じニュースの別媒体の記事) もスキップする
+  (near_duplicates.StoryIndex。最初に claim_article() した記事がクラスタの代表になる)
+- URLは url_canonical.canonical_key() で比較する (トラッキング用パラメータや
+  http/https の違いだけのURLは同じ記事とみなす)
+- NEAR_DUP_CLUSTER_COLUMN を指定すると、保存する記事にクラスタIDを記録する
+  (articles テーブルにその名前の列が必要)
+"""
+
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from near_duplicates import NEAR_DUP_ENABLED, StoryIndex, cluster_id_for
+from url_canonical import canonical_key
+
+# 保存する記事にクラスタIDを書き込む列名 (未指定なら書き込まない)
+NEAR_DUP_CLUSTER_COLUMN = os.environ.get("NEAR_DUP_CLUSTER_COLUMN") or None
+
+# claim_article() の結果
+CLAIMED = "claimed"
+KNOWN = "known"
+DUPLICATE = "duplicate"
+
+
+class ArticleIndex:
+    """スレッドセーフな既知記事URLの集合 (複数コレクターで共有する)"""
+
+    def __init__(self, urls: Iterable[str] = (), titles: Iterable[Tuple[str, str]] = ()):
+        """
+        urls: DB登録済みの記事URL
+        titles: DB登録済みの記事の (URL, タイトル)。これらと類似する記事もスキップする
+        """
+        self._urls = set(canonical_key(u) for u in urls if u)
+        self._lock = threading.Lock()
+        self._stories = StoryIndex() if NEAR_DUP_ENABLED else None
+        # 類似記事としてスキップした記事: (URL, タイトル, 代表のURL)
+        self._duplicates: List[Tuple[str, str, str]] = []
+        self._cluster_of: Dict[str, str] = {}
+        if self._stories is not None:
+            for url, title in titles:
+                if url and title:
+                    self._stories.add(url, title)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._urls)
+
+    def __contains__(self, url: str) -> bool:
+        key = canonical_key(url)
+        with self._lock:
+            return key in self._urls
+
+    def claim_article(self, url: str, title: Optional[str] = None) -> str:
+        """
+        未知のURLなら登録して CLAIMED を返す。既知 (DB登録済み or 他で処理中) なら KNOWN。
+        判定と登録を同時に行うため、同じURLを2つのコレクターが同時に処理することはない。
+        title を渡した場合、別URLの類似記事は DUPLICATE を返す
+        (コレクターがスキップの理由ごとに件数を数えるため、結果を3種類で返す)
+        """
+        if not url:
+            return KNOWN
+        key = canonical_key(url)
+        with self._lock:
+            if key in self._urls:
+                return KNOWN
+            if title and self._stories is not None:
+                representative = self._stories.find(title)
+                if representative is not None:
+                    self._duplicates.append((url, title, representative))
+                    return DUPLICATE
+                if self._stories.add(url, title):
+                    self._cluster_of[url] = cluster_id_for(url)
+            self._urls.add(key)
+            return CLAIMED
+
+    def release(self, url: str) -> None:
+        """claim_article() したが保存しないことになったURLを解放する (他のソースで再度処理できる)"""
+        key = canonical_key(url)
+        with self._lock:
+            self._urls.discard(key)
+            if self._stories is not None:
+                # 代表が保存されないなら、同じクラスタの別の記事を代表にできるようにする
+                self._stories.remove(url)
+            self._cluster_of.pop(url, None)
+
+    @property
+    def duplicates(self) -> List[Tuple[str, str, str]]:
+        """類似記事としてスキップした記事の一覧: [(URL, タイトル, 代表のURL), ...]"""
+        with self._lock:
+            return list(self._duplicates)
+
+    def annotate(self, article: dict) -> dict:
+        """NEAR_DUP_CLUSTER_COLUMN が指定されていれば、記事にクラスタIDを書き込む"""
+        if NEAR_DUP_CLUSTER_COLUMN:
+            with self._lock:
+                # 一括 upsert の各行の列をそろえるため、クラスタが無い記事にも None を入れる
+                article[NEAR_DUP_CLUSTER_COLUMN] = self._cluster_of.get(article.get("article_url"))
+        return article
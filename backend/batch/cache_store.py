@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+永続キャッシュ管理モジュール
+- バッチ実行をまたいで保持したいデータ (フィードの検証子など) を
+  キャッシュディレクトリ内の JSON ファイルに保存する
+- 保存先は環境変数 BATCH_CACHE_DIR で変更可能 (デフォルト: batch/.cache)
+"""
+
+import os
+import json
+import atexit
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# --- 定数 ---
+CACHE_DIR = os.environ.get("BATCH_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache"
+)
+
+
+def cache_path(*parts: str) -> str:
+    """キャッシュディレクトリ配下のパスを返す (親ディレクトリは作成済みにする)"""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+# 作成済みのストア (prune_all() の対象)
+_STORES: List["JsonStore"] = []
+
+
+def prune_all() -> int:
+    """
+    期限付きの全ストアから期限切れのエントリを捨てて保存し、捨てた件数を返す
+    (常駐モードで、二度と参照されないエントリがたまり続けないように定期的に呼ぶ)
+    """
+    pruned = 0
+    for store in list(_STORES):
+        pruned += store.prune()
+        store.save()
+    return pruned
+
+
+class JsonStore:
+    """
+    JSON ファイル1つに保存されるスレッドセーフなキーバリューストア
+    - 初回アクセス時にファイルを読み込む (壊れていれば空として扱う)
+    - 変更があればプロセス終了時に自動で保存する (save() で明示的に保存も可能)
+    - expire を渡すと、expire(key, value) が真のエントリを捨てる
+      (読み込み時に加えて get() / items() のたびに確かめるので、常駐プロセスでも期限が切れる)
+    """
+
+    def __init__(self, filename: str, expire: Optional[Callable[[str, Any], bool]] = None):
+        self.filename = filename
+        self._expire = expire
+        self._data: Optional[Dict[str, Any]] = None
+        self._dirty = False
+        self._lock = threading.RLock()
+        atexit.register(self.save)
+        _STORES.append(self)
+
+    @property
+    def path(self) -> str:
+        return cache_path(self.filename)
+
+    def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._data = data if isinstance(data, dict) else {}
+            except (OSError, ValueError):
+                self._data = {}
+            if self._expire:
+                expired = [k for k, v in self._data.items() if self._expire(k, v)]
+                for k in expired:
+                    del self._data[k]
+                self._dirty = bool(expired)
+        return self._data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            data = self._load()
+            if key not in data:
+                return default
+            value = data[key]
+            if self._expire and self._expire(key, value):
+                del data[key]
+                self._dirty = True
+                return default
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._load()[key] = value
+            self._dirty = True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if self._load().pop(key, None) is not None:
+                self._dirty = True
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """現在の内容のスナップショットを返す"""
+        with self._lock:
+            self.prune()
+            return list(self._load().items())
+
+    def prune(self) -> int:
+        """期限切れのエントリをすべて捨て、捨てた件数を返す"""
+        with self._lock:
+            data = self._load()
+            if not self._expire:
+                return 0
+            expired = [k for k, v in data.items() if self._expire(k, v)]
+            for k in expired:
+                del data[k]
+            self._dirty = self._dirty or bool(expired)
+            return len(expired)
+
+    def save(self) -> None:
+        """変更があればファイルに書き出す (一時ファイル経由で置き換える)"""
+        with self._lock:
+            if not self._dirty or self._data is None:
+                return
+            try:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                print(f" [キャッシュ保存エラー] {self.filename} : {e}")
@@ -2,16 +2,24 @@
 """
 データベース管理モジュール (Supabase)
 - Supabaseクライアントの初期化
+- 登録済みの記事URLとタイトルを一括取得 (収集時の既知URL・類似記事スキップ用)
 - 記事データのリストを受け取り、重複を無視してDBに保存 (Upsert)
-- 24時間以上経過した古い記事をDBから削除
+  (チャンク分割・並列送信・リトライ付き)
+- 収集中の記事を小さなバッチで順次保存するライター (ArticleWriter)
+- 保持期間 (デフォルト100時間) を過ぎた古い記事をDBからページ単位で削除
 """
 
 import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client, Client
 from dotenv import load_dotenv
-from typing import Optional, List
+from typing import Callable, Dict, Optional, List, Set, Tuple
 from datetime import datetime, timedelta, timezone  # ### 追加 ###
 
+from metrics import METRICS
+
 def init_supabase_client() -> Optional[Client]:
     """
     環境変数を読み込み、Supabaseクライアントを初期化して返す
@@ -27,9 +35,176 @@ def init_supabase_client() -> Optional[Client]:
         print("Supabase未設定: ローカル検証モード（DB保存はスキップ）")
         return None
 
+# 登録済みURLの一括取得で1回に取得する件数 (Supabase の上限 1000 件以内)
+KNOWN_URL_PAGE_SIZE = 1000
+
+# 一括 Upsert の設定 (チャンクサイズ / 同時送信数 / リトライ回数と待ち時間の基準)
+UPSERT_CHUNK_SIZE = int(os.environ.get("DB_UPSERT_CHUNK_SIZE", 200))
+UPSERT_MAX_WORKERS = int(os.environ.get("DB_UPSERT_MAX_WORKERS", 4))
+UPSERT_MAX_RETRIES = 3
+UPSERT_RETRY_BASE_SEC = 1.0
+# 行の内容が原因のエラー (Postgres の SQLSTATE のクラス: 22 データ例外 / 23 制約違反)。
+# このエラーのチャンクだけを分割して失敗行を切り分ける
+# (通信エラー・5xx・認証エラーなどは全行が失敗するので、分割して送り直さない)
+ROW_LEVEL_SQLSTATE_CLASSES = ("22", "23")
+
+# 収集中の逐次保存 (ArticleWriter): この件数たまるか、前回の保存からこの秒数が経ったら保存する
+WRITE_BATCH_SIZE = int(os.environ.get("DB_WRITE_BATCH_SIZE", 50))
+WRITE_FLUSH_SEC = float(os.environ.get("DB_WRITE_FLUSH_SEC", 10))
+
+# 古い記事の削除 (保持期間 / 1ページで削除する最大件数 / 1回の実行で処理する最大ページ数)
+RETENTION_HOURS = float(os.environ.get("ARTICLE_RETENTION_HOURS", 100))
+DELETE_PAGE_SIZE = int(os.environ.get("DB_DELETE_PAGE_SIZE", 500))
+DELETE_MAX_PAGES = 200
+
+
+def fetch_known_articles(supabase_client: Optional[Client]) -> Dict[str, str]:
+    """
+    DBに登録済みの全記事の URL (article_url) とタイトルをページ単位でまとめて取得する。
+    コレクターはこれらのURLと、タイトルが類似する記事の画像取得などをスキップする。
+    戻り値: {記事URL: タイトル}
+    """
+    if not supabase_client:
+        return {}
+
+    known: Dict[str, str] = {}
+    start = 0
+    try:
+        while True:
+            response = supabase_client.table("articles").select(
+                "article_url,title"
+            ).order(
+                "id"
+            ).range(
+                start, start + KNOWN_URL_PAGE_SIZE - 1
+            ).execute()
+
+            rows = response.data or []
+            known.update((r["article_url"], r.get("title") or "") for r in rows if r.get("article_url"))
+            if len(rows) < KNOWN_URL_PAGE_SIZE:
+                break
+            start += KNOWN_URL_PAGE_SIZE
+    except Exception as e:
+        # 取得に失敗しても収集は続ける (upsert 側で重複は無視される)
+        print(f" [Supabase 既知URL取得エラー]: {e}")
+        METRICS.error("db.known_urls")
+
+    print(f" [情報] DB登録済みの記事URL: {len(known)} 件")
+    return known
+
+
+def dedupe_articles(articles: List[dict], key: str = "article_url") -> List[dict]:
+    """
+    同じキー (article_url) の記事を1件にまとめる (最初に現れたものを残す)。
+    1回の upsert に同じキーが2回含まれると、Postgres が
+    "ON CONFLICT DO UPDATE command cannot affect row a second time" で失敗するため。
+    """
+    seen = set()
+    unique: List[dict] = []
+    for article in articles:
+        value = article.get(key)
+        if not value or value in seen:
+            continue
+        seen.add(value)
+        unique.append(article)
+    return unique
+
+
+def _upsert_rows(supabase_client: Client, rows: List[dict]) -> int:
+    """1回の upsert を実行し、新規挿入された件数を返す (失敗時は例外)"""
+    # `returning='representation'` を指定すると、
+    # *新規挿入されたレコード* のみがリストで返されます。
+    response = supabase_client.table("articles").upsert(
+        rows,
+        on_conflict='article_url',    # 重複をチェックするカラム
+        ignore_duplicates=True,     # 重複したら無視 (DO NOTHING)
+        returning='representation'  # 新規挿入されたデータだけを返す
+    ).execute()
+    return len(response.data or [])
+
+
+def _is_row_level_error(e: Exception) -> bool:
+    """特定の行が原因のエラー (制約違反・不正な値) か (PostgREST の APIError の code が SQLSTATE)"""
+    code = getattr(e, "code", None)
+    return isinstance(code, str) and len(code) == 5 and code[:2] in ROW_LEVEL_SQLSTATE_CLASSES
+
+
+def _upsert_isolating(supabase_client: Client, rows: List[dict]) -> Tuple[int, int]:
+    """
+    行が原因で失敗したチャンクを二分割しながら再送し、失敗行だけを切り分ける。
+    途中で行以外が原因のエラー (通信エラーなど) になった部分は、分割せずに全行を失敗とする。
+    戻り値: (挿入件数, 失敗件数)
+    """
+    try:
+        return _upsert_rows(supabase_client, rows), 0
+    except Exception as e:
+        if len(rows) == 1:
+            print(f"   [Upsert 失敗行] {rows[0].get('article_url')} : {e}")
+            return 0, 1
+        if not _is_row_level_error(e):
+            print(f"   [Upsert エラー] {len(rows)} 件の切り分けを中止します: {e}")
+            return 0, len(rows)
+    mid = len(rows) // 2
+    inserted_a, failed_a = _upsert_isolating(supabase_client, rows[:mid])
+    inserted_b, failed_b = _upsert_isolating(supabase_client, rows[mid:])
+    return inserted_a + inserted_b, failed_a + failed_b
+
+
+def _upsert_chunk(supabase_client: Client, chunk_no: int, rows: List[dict], max_retries: int) -> dict:
+    """
+    1チャンクをリトライ (指数バックオフ+ジッター) 付きで upsert し、結果を返す
+    - 行が原因のエラー (制約違反など) はリトライせず、分割して失敗行だけを特定する
+    - それ以外 (通信エラー・5xx・認証エラーなど) はリトライしても失敗したら、チャンク全体を失敗とする
+    """
+    result = {"chunk": chunk_no, "rows": len(rows), "inserted": 0, "failed": 0, "attempts": 0, "error": None}
+    for attempt in range(1, max_retries + 1):
+        result["attempts"] = attempt
+        try:
+            result["inserted"] = _upsert_rows(supabase_client, rows)
+            result["error"] = None
+            return result
+        except Exception as e:
+            result["error"] = str(e)
+            print(f" [Upsert エラー] チャンク {chunk_no} ({attempt}/{max_retries} 回目): {e}")
+            if _is_row_level_error(e):
+                result["inserted"], result["failed"] = _upsert_isolating(supabase_client, rows)
+                return result
+            if attempt < max_retries:
+                time.sleep(UPSERT_RETRY_BASE_SEC * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+    result["failed"] = len(rows)
+    return result
+
+
+def bulk_upsert_articles(
+    supabase_client: Client,
+    articles: List[dict],
+    chunk_size: int = UPSERT_CHUNK_SIZE,
+    max_workers: int = UPSERT_MAX_WORKERS,
+    max_retries: int = UPSERT_MAX_RETRIES,
+) -> List[dict]:
+    """
+    記事をキーで重複排除してからチャンクに分け、並列数を制限して upsert する。
+    戻り値はチャンクごとの結果 (rows / inserted / failed / attempts / error) のリスト。
+    """
+    rows = dedupe_articles(articles)
+    chunk_size = max(1, chunk_size)
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    if not chunks:
+        return []
+
+    workers = max(1, min(max_workers, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upsert") as executor:
+        return list(executor.map(
+            lambda numbered: _upsert_chunk(supabase_client, numbered[0], numbered[1], max_retries),
+            enumerate(chunks, start=1),
+        ))
+
+
 def save_articles_to_db(supabase_client: Optional[Client], articles: List[dict]) -> int:
     """
     記事データのリストを受け取り、DBに Upsert (挿入 or 無視) する。
+    重複排除・チャンク分割・リトライは bulk_upsert_articles が行う。
     """
     if not supabase_client:
         print("DBクライアント未設定のため、保存処理をスキップします。")
@@ -46,66 +221,175 @@ def save_articles_to_db(supabase_client: Optional[Client], articles: List[dict])
     # これが 23505 (重複キー) エラーの最も効率的で正しい解決策です。
 
     print(f"--- {len(articles)} 件の記事候補をDBに一括 Upsert (挿入/無視) します ---")
-    total_inserted = 0
-    try:
-        # `returning='representation'` を指定すると、
-        # *新規挿入されたレコード* のみがリストで返されます。
-        response = supabase_client.table("articles").upsert(
-            articles,
-            on_conflict='article_url',    # 重複をチェックするカラム
-            ignore_duplicates=True,     # 重複したら無視 (DO NOTHING)
-            returning='representation'  # 新規挿入されたデータだけを返す
-        ).execute()
-        
-        total_inserted = len(response.data)
-        
-        if total_inserted > 0:
-            print(f" [Supabase Upsert 成功] {total_inserted} 件の新規記事を挿入しました。")
-        else:
-            print(f" [情報] 新規に挿入された記事はありませんでした。")
-            
-    except Exception as e:
-        print(f" [Supabase一括 Upsert エラー]: {e}")
-            
+    results = bulk_upsert_articles(supabase_client, articles)
+    _record_upsert_results(results)
+    return _print_upsert_totals(results)
+
+
+def _record_upsert_results(results: List[dict], label: str = "チャンク") -> None:
+    """チャンクごとの結果を表示し、メトリクスに記録する"""
+    for r in results:
+        status = "OK" if r["failed"] == 0 else "一部失敗"
+        print(f" [{label} {r['chunk']}] {status}: {r['rows']} 件中 挿入 {r['inserted']} 件 / "
+              f"失敗 {r['failed']} 件 (試行 {r['attempts']} 回)")
+    total_failed = sum(r["failed"] for r in results)
+    METRICS.count("db.upsert_rows", sum(r["rows"] for r in results))
+    METRICS.count("db.inserted", sum(r["inserted"] for r in results))
+    METRICS.count("db.upsert_retries", sum(r["attempts"] - 1 for r in results))
+    if total_failed:
+        METRICS.error("db.upsert_rows", total_failed)
+
+
+def _print_upsert_totals(results: List[dict]) -> int:
+    """全体の挿入件数・失敗件数を表示し、挿入件数を返す"""
+    total_inserted = sum(r["inserted"] for r in results)
+    total_failed = sum(r["failed"] for r in results)
+    if total_inserted > 0:
+        print(f" [Supabase Upsert 成功] {total_inserted} 件の新規記事を挿入しました。")
+    else:
+        print(f" [情報] 新規に挿入された記事はありませんでした。")
+    if total_failed > 0:
+        print(f" [Supabase Upsert エラー] {total_failed} 件の記事を保存できませんでした。")
     return total_inserted
 
 
+class ArticleWriter:
+    """
+    収集中の記事を受け取り、小さなバッチ (batch_size 件、または flush_sec 秒ごと) で順次 upsert する。
+    - 全ソースの収集完了を待たずに保存するので、記事が早くアプリに表示され、
+      途中で異常終了しても保存済みの分は失われない
+    - 同じ article_url は実行中に1回だけ送る
+    - DBクライアントが未設定の場合は件数を数えるだけ
+    - prepare を渡すと、保存する前に各記事に適用する (クラスタIDの書き込みなど)
+    使い方: writer.add(article) を繰り返し、定期的に writer.flush_if_due()、最後に writer.close()
+    """
+
+    def __init__(self, supabase_client: Optional[Client], batch_size: int = WRITE_BATCH_SIZE,
+                 flush_sec: float = WRITE_FLUSH_SEC, prepare: Optional[Callable[[dict], dict]] = None):
+        self.client = supabase_client
+        self.prepare = prepare
+        self.batch_size = max(1, batch_size)
+        self.flush_sec = flush_sec
+        self.received = 0
+        self.results: List[dict] = []
+        self._pending: List[dict] = []
+        self._seen: Set[str] = set()
+        self._last_flush = time.monotonic()
+
+    @property
+    def failed(self) -> int:
+        """保存できなかった記事の件数"""
+        return sum(r["failed"] for r in self.results)
+
+    def add(self, article: dict) -> None:
+        url = article.get("article_url")
+        if not url or url in self._seen:
+            return
+        self._seen.add(url)
+        self.received += 1
+        self._pending.append(self.prepare(article) if self.prepare else article)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush_if_due(self) -> None:
+        """未保存の記事があり、前回の保存から flush_sec 秒経っていれば保存する"""
+        if self._pending and time.monotonic() - self._last_flush >= self.flush_sec:
+            self.flush()
+
+    def flush(self) -> None:
+        batch, self._pending = self._pending, []
+        self._last_flush = time.monotonic()
+        if not batch or not self.client:
+            return
+        with METRICS.stage("upsert"):
+            results = bulk_upsert_articles(self.client, batch)
+        # チャンク番号は実行全体での通し番号にする
+        for r in results:
+            r["chunk"] = len(self.results) + 1
+            self.results.append(r)
+        _record_upsert_results(results, label="バッチ")
+
+    def close(self) -> int:
+        """残りを保存して、全体の結果を表示し、新規に挿入した件数を返す"""
+        self.flush()
+        if not self.client:
+            print("DBクライアント未設定のため、保存処理をスキップしました。")
+            return 0
+        if not self.results:
+            print("保存対象の記事がありません。")
+            return 0
+        return _print_upsert_totals(self.results)
+
+
 # ### 追加: 古い記事を削除する関数 ###
-def delete_old_articles(supabase_client: Optional[Client]) -> int:
+def delete_old_articles(
+    supabase_client: Optional[Client],
+    retention_hours: float = RETENTION_HOURS,
+    page_size: int = DELETE_PAGE_SIZE,
+) -> int:
     """
-    DB内の古い（24時間以上経過した）記事を削除する
+    DB内の古い（保持期間 retention_hours を過ぎた）記事を削除する
     スキーマの 'created_at' (TIMESTAMPTZ) を基準にします
+    - 古い順に最大 page_size 件ずつの created_at 範囲に区切って削除する
+      (1回の巨大な DELETE でテーブルを長時間ロックしないため)
+    - 削除した行は返させず (returning='minimal')、件数 (count) だけを受け取る
     """
     if not supabase_client:
         print("DBクライアント未設定のため、削除処理をスキップします。")
         return 0
 
-    print("--- 24時間以上経過した古い記事の削除処理を開始します ---")
-    
+    print(f"--- {retention_hours:g}時間以上経過した古い記事の削除処理を開始します ---")
+
+    # カットオフ時刻をUTCで計算 (TIMESTAMPTZはUTC基準のため)
+    cutoff_time = datetime.now(timezone.utc) - timedelta(hours=retention_hours)
+    cutoff_iso = cutoff_time.isoformat()
+    print(f" [情報] 以下の時刻より古い記事 (created_at) を削除します: {cutoff_iso}")
+
+    page_size = max(1, page_size)
+    deleted_count = 0
+    started = time.monotonic()
     try:
-        # 24時間前のカットオフ時刻をUTCで計算 (TIMESTAMPTZはUTC基準のため)
-        cutoff_time = datetime.now(timezone.utc) - timedelta(hours=100)
-        cutoff_iso = cutoff_time.isoformat()
-        
-        print(f" [情報] 以下の時刻より古い記事 (created_at) を削除します: {cutoff_iso}")
-
-        # 'created_at' が cutoff_time より小さい (lt) ものを削除
-        # `returning='representation'` を指定すると、削除されたレコードが返る
-        response = supabase_client.table("articles").delete(
-            returning='representation'
-        ).lt(
-            "created_at", cutoff_iso
-        ).execute()
-        
-        deleted_count = len(response.data)
-        
-        if deleted_count > 0:
-            print(f" [Supabase削除成功] {deleted_count} 件の古い記事を削除しました。")
-        else:
-            print(f" [情報] 削除対象の古い記事はありませんでした。")
-            
-        return deleted_count
+        for page in range(1, DELETE_MAX_PAGES + 1):
+            page_started = time.monotonic()
+
+            # このページの上端 = カットオフより古い記事のうち page_size 番目の created_at
+            boundary = supabase_client.table("articles").select(
+                "created_at"
+            ).lt(
+                "created_at", cutoff_iso
+            ).order(
+                "created_at"
+            ).range(
+                page_size - 1, page_size - 1
+            ).execute()
+
+            query = supabase_client.table("articles").delete(
+                count="exact",
+                returning="minimal"
+            ).lt(
+                "created_at", cutoff_iso
+            )
+            is_last_page = not boundary.data
+            if not is_last_page:
+                query = query.lte("created_at", boundary.data[0]["created_at"])
+            response = query.execute()
 
+            page_deleted = response.count or 0
+            deleted_count += page_deleted
+            print(f" [削除ページ {page}] {page_deleted} 件 ({time.monotonic() - page_started:.2f} 秒)")
+            if is_last_page or page_deleted == 0:
+                break
+        else:
+            print(f" [情報] 1回の実行での上限 ({DELETE_MAX_PAGES} ページ) に達しました。残りは次回削除します。")
     except Exception as e:
         print(f" [Supabase削除エラー]: {e}")
-        return 0
\ No newline at end of file
+        METRICS.error("db.cleanup")
+
+    elapsed = time.monotonic() - started
+    METRICS.count("db.deleted", deleted_count)
+    if deleted_count > 0:
+        print(f" [Supabase削除成功] {deleted_count} 件の古い記事を削除しました。({elapsed:.2f} 秒)")
+    else:
+        print(f" [情報] 削除対象の古い記事はありませんでした。")
+
+    return deleted_count
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+RSSフィードごとの収穫 (キーワードに一致した記事の割合) の記録モジュール
+- 取得のたびに、新しく見た記事の数と、そのうちパンダ関連だった記事の数を記録する
+  (キャッシュディレクトリの feed_yield.json。直近 FEED_YIELD_HISTORY 回分)
+- 一般ニュースのフィードのように、十分な回数取得しても一致が1件も無いフィードは、
+  RSS_YIELD_SKIP_SEC のあいだ取得しない (取得・解析の帯域とCPUを節約する)
+- フィードは収穫の多い順に取得する (時間予算を超えた場合に後回しになるのは収穫の少ないフィード)
+- python batch/feed_yield.py で全フィードの収穫を一覧表示する
+"""
+
+import os
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from cache_store import JsonStore
+
+# --- 設定 ---
+# 一致の無いフィードを取得しない期間 (秒)。0 でスキップしない (順序の入れ替えだけ行う)
+YIELD_SKIP_SEC = float(os.environ.get("RSS_YIELD_SKIP_SEC", 6 * 3600))
+# 収穫を判断するのに必要な取得回数と記事数 (これ未満のフィードはスキップしない)
+YIELD_MIN_POLLS = 10
+YIELD_MIN_ENTRIES = 50
+# 記録する直近の取得回数
+FEED_YIELD_HISTORY = 30
+
+_STORE = JsonStore("feed_yield.json")
+
+
+def record(url: str, fetched: int, matched: int, now: Optional[float] = None) -> None:
+    """
+    フィード url の1回の取得結果 (新しく見た記事数, うちキーワードに一致した記事数) を記録する
+    新しい記事が無かった取得 (304 など) は、取得時刻だけを更新する
+    """
+    now = now or time.time()
+    state = dict(_STORE.get(url) or {})
+    if fetched:
+        history = list(state.get("history") or [])
+        history.append([round(now), fetched, matched])
+        state["history"] = history[-FEED_YIELD_HISTORY:]
+    state["polled_at"] = now
+    if matched:
+        state["last_match_at"] = now
+    _STORE.set(url, state)
+
+
+def totals(url: str) -> Tuple[int, int, int]:
+    """直近の記録の (取得回数, 記事数, 一致数)"""
+    history = (_STORE.get(url) or {}).get("history") or []
+    return len(history), sum(h[1] for h in history), sum(h[2] for h in history)
+
+
+def yield_rate(url: str) -> Optional[float]:
+    """直近の記録での一致率 (記録が無ければ None)"""
+    _, fetched, matched = totals(url)
+    return matched / fetched if fetched else None
+
+
+def is_zero_yield(url: str) -> bool:
+    """十分な回数・記事数を取得して、一致が1件も無いフィードか"""
+    polls, fetched, matched = totals(url)
+    return polls >= YIELD_MIN_POLLS and fetched >= YIELD_MIN_ENTRIES and matched == 0
+
+
+def skip_remaining(url: str, now: Optional[float] = None) -> float:
+    """一致の無いフィードを、あと何秒取得しないか (取得してよければ 0)"""
+    if YIELD_SKIP_SEC <= 0 or not is_zero_yield(url):
+        return 0.0
+    polled_at = (_STORE.get(url) or {}).get("polled_at") or 0
+    return max(0.0, polled_at + YIELD_SKIP_SEC - (now or time.time()))
+
+
+def plan_feeds(feeds: Iterable[str], now: Optional[float] = None) -> Tuple[List[str], List[str]]:
+    """
+    今回取得するフィード (収穫の多い順) と、一致が無いため今回は取得しないフィードに分ける
+    記録の無いフィードは収穫を調べるため先頭に置く (同じ順位の中では元の順序のまま)
+    """
+    now = now or time.time()
+    to_fetch, skipped = [], []
+    for url in feeds:
+        (skipped if skip_remaining(url, now) > 0 else to_fetch).append(url)
+
+    def priority(url: str) -> float:
+        rate = yield_rate(url)
+        return -(1.0 if rate is None else rate)
+
+    return sorted(to_fetch, key=priority), skipped
+
+
+def report(feeds: Iterable[str]) -> List[dict]:
+    """フィードごとの収穫の一覧 (一致率の低い順)"""
+    rows = []
+    for url in feeds:
+        polls, fetched, matched = totals(url)
+        state = _STORE.get(url) or {}
+        rows.append({
+            "url": url,
+            "polls": polls,
+            "fetched": fetched,
+            "matched": matched,
+            "rate": matched / fetched if fetched else None,
+            "zero_yield": is_zero_yield(url),
+            "last_match_at": state.get("last_match_at"),
+        })
+    return sorted(rows, key=lambda r: (r["rate"] is None, r["rate"] or 0.0, -r["fetched"]))
+
+
+def print_report(feeds: Iterable[str], limit: Optional[int] = None) -> None:
+    rows = report(feeds)
+    print(f"--- フィード別の収穫 (直近 {FEED_YIELD_HISTORY} 回、一致率の低い順) ---")
+    for r in rows[:limit]:
+        rate = "記録なし" if r["rate"] is None else f"{r['rate']:.1%}"
+        mark = " [一致なし: 取得間隔を延長]" if r["zero_yield"] and YIELD_SKIP_SEC > 0 else ""
+        print(f"  {rate:>8}  一致 {r['matched']:>4} / {r['fetched']:>5} 件 ({r['polls']} 回)  {r['url']}{mark}")
+
+
+def save() -> None:
+    _STORE.save()
+
+
+# --- 単体実行 (収穫の一覧) ---
+if __name__ == "__main__":
+    from rss_collector import RSS_FEEDS
+    print_report(RSS_FEEDS)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+差分収集のための既読位置 (ハイウォーターマーク) 管理モジュール
+- ソース・フィードごとに「最後に見た記事の公開時刻」と「最近見た記事ID」を
+  キャッシュディレクトリの high_water_marks.json に保存する
+- コレクターは収集中に stage_mark() で新しい位置を仮登録し、
+  main が記事の保存に成功した後で commit_marks() を呼んで確定する
+  (保存に失敗した実行の位置は確定しないので、次回もう一度処理される)
+- BATCH_INCREMENTAL=0 で無効化 (毎回すべての記事を処理する)
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Iterable, Optional
+
+from cache_store import JsonStore
+
+# --- 設定 ---
+INCREMENTAL_MODE = os.environ.get("BATCH_INCREMENTAL", "1") != "0"
+# 1つの位置に保持する記事IDの最大数 (フィードの記事数より十分大きくする)
+HIGH_WATER_MAX_IDS = 300
+
+_STORE = JsonStore("high_water_marks.json")
+_pending: Dict[str, dict] = {}
+_pending_lock = threading.Lock()
+
+
+def get_mark(key: str) -> Optional[dict]:
+    """
+    確定済みの位置を返す (なければ None)
+    戻り値: {"published": 公開時刻 (UNIX秒) または None, "ids": [記事ID, ...], "updated_at": 確定時刻}
+    """
+    if not INCREMENTAL_MODE:
+        return None
+    mark = _STORE.get(key)
+    return mark if isinstance(mark, dict) else None
+
+
+def seen_ids(key: str) -> set:
+    """確定済みの位置に含まれる記事IDの集合"""
+    mark = get_mark(key)
+    return set(mark.get("ids") or []) if mark else set()
+
+
+def stage_mark(key: str, published: Optional[float], ids: Iterable[str]) -> None:
+    """
+    今回の実行で見た記事の位置を仮登録する (commit_marks() まで保存しない)
+    - published: 見た記事の最新の公開時刻 (UNIX秒)
+    - ids: 見た記事のID (新しい順)。前回までのIDの前に追加し、HIGH_WATER_MAX_IDS 件に切り詰める
+    """
+    if not INCREMENTAL_MODE:
+        return
+    with _pending_lock:
+        base = _pending.get(key) or get_mark(key) or {}
+        merged, added = [], set()
+        for i in list(ids) + list(base.get("ids") or []):
+            if i and i not in added:
+                added.add(i)
+                merged.append(i)
+        latest = max([p for p in (published, base.get("published")) if p is not None], default=None)
+        _pending[key] = {"published": latest, "ids": merged[:HIGH_WATER_MAX_IDS]}
+
+
+def commit_marks() -> int:
+    """仮登録した位置を確定して保存し、確定した件数を返す"""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    now = time.time()
+    for key, mark in pending.items():
+        _STORE.set(key, dict(mark, updated_at=now))
+    _STORE.save()
+    return len(pending)
+
+
+def discard_marks() -> int:
+    """仮登録した位置を破棄し、破棄した件数を返す"""
+    with _pending_lock:
+        count = len(_pending)
+        _pending.clear()
+    return count
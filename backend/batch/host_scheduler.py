@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+ホスト単位のリクエスト制御モジュール
+- 同一ホストへの同時リクエスト数の上限 (stream=True のレスポンスは close() するまで数える)
+- 同一ホストへのリクエスト間隔の下限
+- サーキットブレーカー: 連続して失敗 (例外・タイムアウト・5xx/429) したホストには、
+  一定時間リクエストを送らずに即座に失敗させる
+  クールダウン明けは1件だけ試しに送り (half-open)、成功するまで他のリクエストは遮断したままにする
+- ホストごとの統計 (リクエスト数・失敗数・平均応答時間など) を記録する
+"""
+
+import os
+import time
+import weakref
+import threading
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+# --- 設定 ---
+HOST_MAX_INFLIGHT = int(os.environ.get("HOST_MAX_INFLIGHT", 4))
+HOST_MIN_INTERVAL_SEC = float(os.environ.get("HOST_MIN_INTERVAL_SEC", 0.2))
+HOST_FAILURE_THRESHOLD = int(os.environ.get("HOST_FAILURE_THRESHOLD", 5))
+HOST_COOLDOWN_SEC = float(os.environ.get("HOST_COOLDOWN_SEC", 120))
+
+
+def _parse_host_limits(spec: str) -> Dict[str, int]:
+    """HOST_MAX_INFLIGHT_OVERRIDES ("ホスト=2,ホスト=1") を {ホスト: 同時リクエスト数の上限} にする"""
+    limits: Dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        host, _, value = item.partition("=")
+        try:
+            limits[host.strip().lower()] = int(value)
+        except ValueError:
+            print(f" [HOST] HOST_MAX_INFLIGHT_OVERRIDES の指定を解釈できません: {item}")
+    return limits
+
+
+# ホストごとに同時リクエスト数の上限を変える場合の指定 (指定の無いホストは HOST_MAX_INFLIGHT)
+HOST_MAX_INFLIGHT_OVERRIDES = _parse_host_limits(os.environ.get("HOST_MAX_INFLIGHT_OVERRIDES", ""))
+
+
+class HostCircuitOpen(requests.exceptions.ConnectionError):
+    """サーキットが開いている (一時的に遮断中の) ホストへのリクエスト"""
+
+
+class _HostState:
+    """1ホスト分の制御状態と統計"""
+
+    def __init__(self, max_inflight: int):
+        self.semaphore = threading.BoundedSemaphore(max(1, max_inflight))
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        # クールダウン明けの試しのリクエストを送信中か
+        self.probing = False
+        self.stats = _empty_stats()
+
+
+def _empty_stats() -> dict:
+    return {
+        "requests": 0,
+        "failures": 0,
+        "timeouts": 0,
+        "rejected": 0,
+        "circuit_opened": 0,
+        "total_sec": 0.0,
+        "max_sec": 0.0,
+    }
+
+
+class HostScheduler:
+    """ホストごとに同時実行数・間隔・サーキットブレーカーを適用してリクエストを実行する"""
+
+    def __init__(
+        self,
+        max_inflight: int = HOST_MAX_INFLIGHT,
+        min_interval_sec: float = HOST_MIN_INTERVAL_SEC,
+        failure_threshold: int = HOST_FAILURE_THRESHOLD,
+        cooldown_sec: float = HOST_COOLDOWN_SEC,
+        host_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.max_inflight = max_inflight
+        # ホストごとの同時リクエスト数の上限 (max_inflight より優先する)
+        self.host_limits = HOST_MAX_INFLIGHT_OVERRIDES if host_limits is None else host_limits
+        self.min_interval_sec = min_interval_sec
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec = cooldown_sec
+        self._hosts: Dict[str, _HostState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host: str) -> _HostState:
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self.host_limits.get(host, self.max_inflight))
+            return state
+
+    def _wait_for_turn(self, state: _HostState) -> None:
+        """前回のリクエストから min_interval_sec 空くまで待つ"""
+        with state.lock:
+            now = time.monotonic()
+            start_at = max(now, state.next_slot)
+            state.next_slot = start_at + self.min_interval_sec
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def _record(self, host: str, state: _HostState, elapsed: float, failed: bool, timeout: bool = False,
+                probe: bool = False) -> None:
+        with state.lock:
+            stats = state.stats
+            stats["requests"] += 1
+            stats["total_sec"] += elapsed
+            stats["max_sec"] = max(stats["max_sec"], elapsed)
+            if probe:
+                state.probing = False
+            if not failed:
+                state.consecutive_failures = 0
+                if probe:
+                    # 試しのリクエストが成功したので遮断を解除する
+                    state.open_until = 0.0
+                return
+            stats["failures"] += 1
+            if timeout:
+                stats["timeouts"] += 1
+            state.consecutive_failures += 1
+            if probe or (state.consecutive_failures >= self.failure_threshold
+                         and state.open_until <= time.monotonic()):
+                state.open_until = time.monotonic() + self.cooldown_sec
+                stats["circuit_opened"] += 1
+                print(f" [HOST] {host} で {state.consecutive_failures} 回連続で失敗したため、"
+                      f"{self.cooldown_sec:.0f} 秒間リクエストを停止します")
+
+    def call(self, url: str, send: Callable[[], requests.Response], stream: bool = False) -> requests.Response:
+        """
+        url のホストの制御下で send() を実行してレスポンスを返す。
+        サーキットが開いている間は送信せずに HostCircuitOpen を送出する。
+        stream=True の場合、本文はレスポンスを返した後に読まれるので、レスポンスを close() するまで
+        同時実行数の枠を使い続ける (呼び出し側は with や close() で必ず閉じる)
+        """
+        host = (urlparse(url).hostname or "").lower()
+        state = self._state(host)
+
+        probe = False
+        with state.lock:
+            if state.open_until > time.monotonic() or (state.open_until and state.probing):
+                state.stats["rejected"] += 1
+                raise HostCircuitOpen(f"{host} は一時的に遮断中です (連続失敗のため)")
+            if state.open_until:
+                # クールダウン明け: この1件だけを送って回復を確認する (失敗すれば再び遮断)
+                state.probing = probe = True
+
+        recorded = False
+        held = False
+        state.semaphore.acquire()
+        try:
+            self._wait_for_turn(state)
+            started = time.monotonic()
+            try:
+                resp = send()
+            except requests.RequestException as e:
+                is_timeout = isinstance(e, requests.Timeout)
+                recorded = True
+                self._record(host, state, time.monotonic() - started, failed=True, timeout=is_timeout,
+                             probe=probe)
+                raise
+            failed = resp.status_code >= 500 or resp.status_code == 429
+            recorded = True
+            self._record(host, state, time.monotonic() - started, failed=failed, probe=probe)
+            if stream:
+                _release_on_close(resp, state.semaphore.release)
+                held = True
+            return resp
+        finally:
+            if not held:
+                state.semaphore.release()
+            if probe and not recorded:
+                # 試しのリクエストが想定外の例外で終わった場合は、次の呼び出しで試し直す
+                with state.lock:
+                    state.probing = False
+
+    def stats(self) -> Dict[str, dict]:
+        """ホストごとの統計のスナップショットを返す"""
+        with self._lock:
+            hosts = list(self._hosts.items())
+        snapshot = {}
+        for host, state in hosts:
+            with state.lock:
+                stats = dict(state.stats)
+                # 試しのリクエストが成功するまでは遮断中として表示する
+                stats["circuit_open"] = bool(state.open_until)
+            stats["avg_sec"] = stats["total_sec"] / stats["requests"] if stats["requests"] else 0.0
+            snapshot[host] = stats
+        return snapshot
+
+    def reset(self) -> None:
+        """全ホストの状態と統計を初期化する (同じプロセスで収集を繰り返す場合に使う)"""
+        with self._lock:
+            self._hosts.clear()
+
+    def reset_stats(self) -> None:
+        """統計だけを初期化する (サーキットの状態は残す。常駐モードで収集ごとの統計を表示するため)"""
+        with self._lock:
+            states = list(self._hosts.values())
+        for state in states:
+            with state.lock:
+                state.stats = _empty_stats()
+
+    def print_report(self, top: Optional[int] = 10) -> None:
+        """失敗の多いホストから順に統計を表示する"""
+        stats = self.stats()
+        if not stats:
+            return
+        ordered = sorted(stats.items(), key=lambda kv: (kv[1]["failures"] + kv[1]["rejected"], kv[1]["total_sec"]),
+                         reverse=True)
+        print(f"--- ホスト別の状況 ({len(stats)} ホスト, 上位 {top or len(stats)} 件) ---")
+        for host, s in ordered[:top]:
+            state = "遮断中" if s["circuit_open"] else "正常"
+            print(f"  {host}: {s['requests']} 件 (失敗 {s['failures']}, タイムアウト {s['timeouts']}, "
+                  f"遮断で拒否 {s['rejected']}) 平均 {s['avg_sec']:.2f} 秒 / 最大 {s['max_sec']:.2f} 秒 [{state}]")
+
+
+def _release_on_close(resp: requests.Response, release: Callable[[], None]) -> None:
+    """resp を close() したときに release() を1度だけ呼ぶ (閉じ忘れた場合は resp の破棄時に呼ぶ)"""
+    lock = threading.Lock()
+    released = []
+
+    def release_once() -> None:
+        with lock:
+            if released:
+                return
+            released.append(True)
+        release()
+
+    close = resp.close
+
+    def close_and_release() -> None:
+        try:
+            close()
+        finally:
+            release_once()
+
+    resp.close = close_and_release
+    weakref.finalize(resp, release_once)
+
+
+# 全コレクターで共有するスケジューラー
+HOST_SCHEDULER = HostScheduler()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+HTML解析モジュール (画像候補の抽出 / RSSリンクの発見)
+- lxml がインストールされていれば、必要なタグだけを XPath で直接取り出す高速な実装を使う
+- なければ BeautifulSoup + 標準の "html.parser" で同じ抽出を行う
+- 環境変数 BATCH_HTML_PARSER で明示的に指定することも可能 ("lxml" / "html.parser")
+- どちらの実装でも抽出結果は同じになる (benchmarks/bench_html_parser.py で確認)
+"""
+
+import os
+import re
+import json
+from typing import Callable, List, Optional, Union
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from bs4.dammit import UnicodeDammit
+
+try:
+    import lxml.html
+    from lxml.etree import ParserError
+except ImportError:
+    lxml = None
+
+FALLBACK_PARSER = "html.parser"
+
+# 本文領域の候補 (この順で最初に見つかったものを使う)
+MAIN_CONTENT_SELECTORS = ["article", "main", "[role='main']", ".post-content", ".article-body", "#content"]
+# 上記セレクターと同じ意味の XPath (lxml 用)
+_MAIN_CONTENT_XPATHS = [
+    "//article",
+    "//main",
+    "//*[@role='main']",
+    "//*[contains(concat(' ', normalize-space(@class), ' '), ' post-content ')]",
+    "//*[contains(concat(' ', normalize-space(@class), ' '), ' article-body ')]",
+    "//*[@id='content']",
+]
+# OGP / Twitter の画像メタタグ (属性名, 値) を優先度順に
+META_IMAGE_KEYS = [("property", "og:image"), ("property", "og:image:secure_url"), ("name", "twitter:image")]
+_BODY_TAG_RE = re.compile(r"<body[\s>/]", re.IGNORECASE)
+# html.parser がタグとして解釈しない部分 (コメント、<script> / <style> の中身)
+_NON_TAG_RE = re.compile(r"<!--.*?(?:-->|$)|<(script|style)\b.*?(?:</\1\s*>|$)", re.IGNORECASE | re.DOTALL)
+
+
+def _has_body_tag(text: str) -> bool:
+    """<body> タグが明示されているか (コメントや <script> の中の "<body" は数えない)"""
+    if not _BODY_TAG_RE.search(text):
+        return False
+    return bool(_BODY_TAG_RE.search(_NON_TAG_RE.sub("", text)))
+
+
+def _select_parser() -> str:
+    requested = os.environ.get("BATCH_HTML_PARSER", "").strip()
+    if requested == FALLBACK_PARSER:
+        return FALLBACK_PARSER
+    if requested and requested != "lxml":
+        print(f" [HTMLパーサー] 未対応のパーサー指定 '{requested}' のため自動選択します")
+    if lxml is not None:
+        return "lxml"
+    if requested == "lxml":
+        print(" [HTMLパーサー] lxml がインストールされていないため html.parser を使います")
+    return FALLBACK_PARSER
+
+
+HTML_PARSER = _select_parser()
+
+
+def make_soup(markup: Union[str, bytes], from_encoding: Optional[str] = None) -> BeautifulSoup:
+    """標準の html.parser で BeautifulSoup を作る"""
+    if isinstance(markup, bytes):
+        return BeautifulSoup(markup, FALLBACK_PARSER, from_encoding=from_encoding)
+    return BeautifulSoup(markup, FALLBACK_PARSER)
+
+
+def _to_text(markup: Union[str, bytes], from_encoding: Optional[str]) -> Optional[str]:
+    """バイト列を html.parser と同じ方法 (UnicodeDammit) で文字列にする"""
+    if isinstance(markup, str):
+        return markup
+    return UnicodeDammit(markup, [from_encoding] if from_encoding else [], is_html=True).unicode_markup
+
+
+def _lxml_document(markup: Union[str, bytes], from_encoding: Optional[str]):
+    """lxml で文書を作る (作れない場合は None を返し、呼び出し側は BeautifulSoup にフォールバック)"""
+    text = _to_text(markup, from_encoding)
+    if not text:
+        return None, text
+    try:
+        return lxml.html.document_fromstring(text), text
+    except (ValueError, ParserError):
+        # XML宣言付きの文字列など、lxml が受け付けない入力
+        return None, text
+
+
+def _add_jsonld_images(txt: Optional[str], add: Callable[[str], None]) -> None:
+    """JSON-LD の image / thumbnailUrl から画像URLを取り出す"""
+    try:
+        if not txt: return
+        data = json.loads(txt)
+        items = data if isinstance(data, list) else [data]
+        for it in items:
+            if isinstance(it, dict):
+                img = it.get("image") or it.get("thumbnailUrl")
+                if isinstance(img, str):
+                    add(img)
+                elif isinstance(img, dict):
+                    urlf = img.get("url")
+                    if urlf:
+                        add(urlf)
+                elif isinstance(img, list):
+                    for it2 in img:
+                        if isinstance(it2, str):
+                            add(it2)
+    except Exception:
+        return
+
+
+def _candidate_collector(base_url: str):
+    candidates: List[str] = []
+
+    def add(url: str) -> None:
+        cand = urljoin(base_url, url)
+        if cand not in candidates:
+            candidates.append(cand)
+
+    return candidates, add
+
+
+# -----------------------
+# 画像候補の抽出
+# -----------------------
+def _bs_image_candidates(soup: BeautifulSoup, base_url: str, include_body: bool) -> List[str]:
+    candidates, add = _candidate_collector(base_url)
+
+    # 1) OGP / Twitter
+    for attr, value in META_IMAGE_KEYS:
+        t = soup.find("meta", attrs={attr: value})
+        if t and t.get("content"):
+            add(t.get("content"))
+
+    # 2) JSON-LD
+    for script in soup.find_all("script", type="application/ld+json"):
+        _add_jsonld_images(script.string, add)
+
+    if not include_body:
+        return candidates
+
+    # 3) 本文中画像
+    main_content = None
+    for s in MAIN_CONTENT_SELECTORS:
+        main_content = soup.select_one(s)
+        if main_content: break
+    if not main_content:
+        main_content = soup.body
+
+    if main_content:
+        for img in main_content.find_all("img", src=True):
+            src = img.get("src")
+            if not src or src.startswith("data:"): continue
+            add(src)
+    return candidates
+
+
+def _lxml_image_candidates(doc, text: str, base_url: str, include_body: bool) -> List[str]:
+    candidates, add = _candidate_collector(base_url)
+
+    # 1) OGP / Twitter
+    for attr, value in META_IMAGE_KEYS:
+        found = doc.xpath(f"//meta[@{attr}=$value]", value=value)
+        if found and found[0].get("content"):
+            add(found[0].get("content"))
+
+    # 2) JSON-LD
+    for script in doc.xpath("//script[@type='application/ld+json']"):
+        _add_jsonld_images(script.text, add)
+
+    if not include_body:
+        return candidates
+
+    # 3) 本文中画像
+    main_content = None
+    for xpath in _MAIN_CONTENT_XPATHS:
+        found = doc.xpath(xpath)
+        if found:
+            main_content = found[0]
+            break
+    # lxml は <body> を補完するが、html.parser は補完しないため、明示されている場合のみ使う
+    if main_content is None and _has_body_tag(text):
+        main_content = doc.find("body")
+
+    if main_content is not None:
+        for img in main_content.iterdescendants("img"):
+            src = img.get("src")
+            if not src or src.startswith("data:"): continue
+            add(src)
+    return candidates
+
+
+def extract_image_candidates(markup: Union[str, bytes], base_url: str, include_body: bool = True,
+                             from_encoding: Optional[str] = None, parser: Optional[str] = None) -> List[str]:
+    """
+    ページ内の画像候補URLを優先度順 (OGP/Twitter → JSON-LD → 本文<img>) で返す
+    include_body=False の場合は <head> で判定できる候補 (OGP/Twitter/JSON-LD) のみ
+    """
+    if (parser or HTML_PARSER) == "lxml" and lxml is not None:
+        doc, text = _lxml_document(markup, from_encoding)
+        if doc is not None:
+            return _lxml_image_candidates(doc, text, base_url, include_body)
+    return _bs_image_candidates(make_soup(markup, from_encoding), base_url, include_body)
+
+
+# -----------------------
+# RSSリンクの発見
+# -----------------------
+def _bs_feed_link(soup: BeautifulSoup, base_url: str) -> Optional[str]:
+    # <link rel="alternate" type="application/rss+xml" href="...">
+    link = soup.find("link", rel=lambda x: x and "alternate" in x.lower(),
+                     type=lambda t: t and "rss" in t.lower())
+    if link and link.get("href"):
+        return urljoin(base_url, link["href"])
+    # <a> にフィードや RSS の文言がある場合
+    a = soup.find("a", href=True, string=lambda s: s and "rss" in s.lower())
+    if a:
+        return urljoin(base_url, a["href"])
+    return None
+
+
+def _single_string(el) -> Optional[str]:
+    """BeautifulSoup の Tag.string と同じく、子が1つだけのときにその文字列を返す"""
+    children = list(el)
+    if not children:
+        return el.text or None
+    if len(children) == 1 and not el.text and not children[0].tail:
+        child = children[0]
+        if not isinstance(child.tag, str):
+            # コメントなど
+            return child.text
+        return _single_string(child)
+    return None
+
+
+def _lxml_feed_link(doc, base_url: str) -> Optional[str]:
+    for link in doc.iter("link"):
+        rel, type_ = link.get("rel"), link.get("type")
+        if rel and "alternate" in rel.lower() and type_ and "rss" in type_.lower():
+            if link.get("href"):
+                return urljoin(base_url, link.get("href"))
+            break
+    for a in doc.iter("a"):
+        if a.get("href") is None:
+            continue
+        s = _single_string(a)
+        if s and "rss" in s.lower():
+            return urljoin(base_url, a.get("href"))
+    return None
+
+
+def find_feed_link(markup: Union[str, bytes], base_url: str, parser: Optional[str] = None) -> Optional[str]:
+    """HTML内からRSSリンクを発見して絶対URLとして返す（見つからなければ None）"""
+    if (parser or HTML_PARSER) == "lxml" and lxml is not None:
+        doc, _ = _lxml_document(markup, None)
+        if doc is not None:
+            return _lxml_feed_link(doc, base_url)
+    return _bs_feed_link(make_soup(markup), base_url)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+キーワード判定モジュール (全コレクター共通)
+- パンダ関連キーワードのリストを1つの正規表現にまとめてコンパイルし、
+  テキストを1回走査するだけで関連性を判定する
+- どのキーワードに一致したかも返す (ログやタグ付け用)
+- キーワードは環境変数で変更可能
+    BATCH_KEYWORDS:       カンマ区切りでデフォルトのリストを置き換える
+    BATCH_KEYWORDS_EXTRA: カンマ区切りでデフォルトのリストに追加する
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+# --- デフォルトキーワード（小文字で比較） ---
+DEFAULT_KEYWORDS = [
+    # 英語
+    "panda", "pandas", "giant panda", "red panda",
+    "panda cub", "baby panda", "panda birth",
+    "panda conservation", "panda breeding", "panda exhibit", "panda zoo",
+
+    # 日本語・中国語
+    "パンダ", "レッサーパンダ",
+    "シャンシャン", "リーリー", "シンシン", "タンタン", "香香",
+    "熊猫", "大熊猫", "圓仔", "円仔", "圓圓", "円円",
+]
+
+
+def _split_env(name: str) -> List[str]:
+    return [k.strip() for k in os.environ.get(name, "").split(",") if k.strip()]
+
+
+def load_keywords() -> List[str]:
+    """環境変数を反映した、全コレクター共通のキーワードリストを返す"""
+    keywords = _split_env("BATCH_KEYWORDS") or list(DEFAULT_KEYWORDS)
+    return keywords + _split_env("BATCH_KEYWORDS_EXTRA")
+
+
+class KeywordMatcher:
+    """
+    キーワードの集合をコンパイル済みの正規表現1つで判定するクラス
+    (長いキーワードを優先する選択 (alternation) で、テキストを1回だけ走査する)
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        # 小文字化して重複を除く (順序は維持)
+        self.keywords: List[str] = list(dict.fromkeys(k.lower() for k in keywords if k))
+        ordered = sorted(self.keywords, key=len, reverse=True)
+        alternation = "|".join(re.escape(k) for k in ordered)
+        # 重なり合う一致 ("giant panda cub" の "panda cub" など) も拾えるように先読みで走査する
+        self._overlapping = re.compile(f"(?=({alternation}))") if ordered else None
+        # "giant panda" に一致したら "panda" にも一致したとみなすための対応表
+        self._contained = {
+            k: [other for other in self.keywords if other in k] for k in self.keywords
+        }
+
+    def find_terms(self, text: str) -> List[str]:
+        """一致したキーワードをキーワードリストの順で返す (一致なしなら空リスト)"""
+        if not self._overlapping or not text:
+            return []
+        found = set()
+        for m in self._overlapping.finditer(text.lower()):
+            found.update(self._contained[m.group(1)])
+        return [k for k in self.keywords if k in found]
+
+
+@lru_cache(maxsize=8)
+def _cached_matcher(keywords: Tuple[str, ...]) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
+
+def get_matcher(keywords: Optional[Iterable[str]] = None) -> KeywordMatcher:
+    """キーワードリストに対応するコンパイル済みマッチャーを返す (None なら共通リスト)"""
+    return _cached_matcher(tuple(keywords if keywords is not None else load_keywords()))
@@ -3,29 +3,363 @@
 Pandas ニュース収集バッチ実行スクリプト (拡張版)
 
 1. 各種コレクターモジュールを呼び出し、記事データを並列で取得
+   (ソースごとに時間予算を持ち、超過したソースはそこまでの結果を保存する)
    - Google Search API (search_panda_images.py)
    - NewsAPI (article_collector.py)
    - RSS (rss_collector.py)
    - 個別スクレイピング (scrape_collector.py)
-2. DB管理モジュール (database_manager) を呼び出し、取得したデータを保存
+2. 取得した記事は、全ソースの完了を待たずに小さなバッチで順次DBに保存 (database_manager.ArticleWriter)
+   (コレクター → 上限付きキュー → 保存 のパイプライン)
 3. 古いデータをクリーンアップ
+
+--daemon を付けて実行すると常駐モードになり、接続やキャッシュを保ったまま、
+フィード・APIごとに更新頻度から決めた間隔で繰り返し収集する (poll_schedule.py)
 """
 
 import os
 import sys
+import time
+import queue
+import signal
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
-from typing import List
+from typing import Callable, Iterable, List, Optional, Tuple
 
 # --- DB管理モジュール ---
-from database_manager import init_supabase_client, save_articles_to_db, delete_old_articles
+from database_manager import init_supabase_client, delete_old_articles, fetch_known_articles, ArticleWriter
+from article_index import ArticleIndex
 
 # --- 共通ヘルパー (単発検証用) ---
 from utils import get_main_image
 
-# --- 各種コレクターモジュール ---
-from search_panda_images import fetch_from_google_search
-from article_collector import fetch_from_newsapi
-from rss_collector import fetch_from_rss
+# --- ホスト単位のリクエスト制御 (統計の表示用) ---
+from host_scheduler import HOST_SCHEDULER
+
+# --- 解析用のプロセスプール (BATCH_PARSE_PROCESSES 指定時のみ。収集後に終了する) ---
+import parse_pool
+
+# --- 実行メトリクス (最後に JSON / Prometheus 形式で書き出す) ---
+from metrics import METRICS
+
+# --- 差分収集の既読位置 (保存に成功した場合だけ確定する) ---
+from high_water import commit_marks, discard_marks
+
+# --- 各種コレクターモジュール (記事を1件ずつ返すジェネレーター) ---
+from search_panda_images import iter_from_google_search
+from article_collector import iter_from_newsapi
+from rss_collector import iter_from_rss, RSS_FEEDS, commit_feed_validators, discard_feed_validators
+
+# --- 実行をまたぐキャッシュ (常駐モードでは期限切れのエントリを定期的に捨てる) ---
+from cache_store import prune_all as prune_caches
+
+# --- 記事URLの正規化 (実行中の対応表は実行ごとに空にする) ---
+from url_canonical import reset_run_cache
+
+# --- 常駐モードの取得間隔 (フィード・APIごと) ---
+from poll_schedule import is_due, next_due_at, record_poll, save as save_poll_schedule
+
+# --- 並列実行の設定 ---
+# BATCH_CONCURRENT=0 で従来どおり 1 ソースずつ順番に実行する
+CONCURRENT_MODE = os.environ.get("BATCH_CONCURRENT", "1") != "0"
+# ソースごとの時間予算 (秒)。超過したソースはそこまでの結果を返す
+SOURCE_TIME_BUDGETS = {
+    "Google Search API": float(os.environ.get("BATCH_BUDGET_GOOGLE_SEC", 600)),
+    "NewsAPI": float(os.environ.get("BATCH_BUDGET_NEWSAPI_SEC", 600)),
+    "RSSフィード": float(os.environ.get("BATCH_BUDGET_RSS_SEC", 600)),
+}
+# 予算超過後、実行中のリクエストが終わるのを待つ猶予 (秒)
+SOURCE_GRACE_SEC = float(os.environ.get("BATCH_BUDGET_GRACE_SEC", 30))
+# コレクターと保存処理の間のキューの上限 (満杯の間、コレクターは保存が追いつくのを待つ)
+ARTICLE_QUEUE_SIZE = int(os.environ.get("BATCH_QUEUE_SIZE", 200))
+
+# --- 常駐モード (python batch/main.py --daemon) の設定 ---
+# 取得時刻を確認する最大の間隔 (秒)
+DAEMON_TICK_SEC = float(os.environ.get("DAEMON_TICK_SEC", 60))
+# 収集の間に必ず空ける時間 (秒。時間予算を超えて記録されなかったフィードで連続実行しないため)
+DAEMON_MIN_SLEEP_SEC = 10
+# 古い記事の削除と既知記事の読み直しの間隔 (秒)
+DAEMON_CLEANUP_SEC = float(os.environ.get("DAEMON_CLEANUP_SEC", 3600))
+# API ソースの最短の取得間隔 (秒)。API の利用上限に合わせる
+DAEMON_SOURCE_INTERVALS = {
+    "Google Search API": float(os.environ.get("DAEMON_INTERVAL_GOOGLE_SEC", 3600)),
+    "NewsAPI": float(os.environ.get("DAEMON_INTERVAL_NEWSAPI_SEC", 1800)),
+}
+
+# キューに流す「ソースの終了」の印
+_SOURCE_DONE = object()
+
+Source = Tuple[str, Callable[..., Iterable[dict]]]
+
+
+def _run_source(name: str, collector: Callable[..., Iterable[dict]], out: "queue.Queue",
+                stop: threading.Event, hard_deadline: float) -> Tuple[int, float]:
+    """
+    1つのコレクターを時間予算付きで実行し、記事を1件ずつキューに入れる。
+    締切は全体の打ち切り時刻 hard_deadline より後にしない
+    (コレクターは締切後に終わった分の既読位置を仮登録しないので、打ち切り後にキューに入った
+    記事の位置が確定されることはない)
+    戻り値: (記事数, 所要秒数)
+    """
+    start = time.monotonic()
+    deadline = min(start + SOURCE_TIME_BUDGETS[name], hard_deadline)
+    count = 0
+    try:
+        with METRICS.stage(f"collect.{name}"):
+            for article in collector(deadline=deadline):
+                if not _put_until_stopped(out, article, stop):
+                    break
+                count += 1
+    finally:
+        METRICS.count(f"articles.{name}", count)
+        _put_until_stopped(out, (_SOURCE_DONE, name), stop)
+    return count, time.monotonic() - start
+
+
+def _put_until_stopped(out: "queue.Queue", item, stop: threading.Event) -> bool:
+    """キューが満杯なら空くまで待って入れる。打ち切りを指示されたら入れずに False を返す"""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=1.0)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def collect_all(sources: List[Source], writer: ArticleWriter) -> int:
+    """
+    全ソースを実行し、届いた記事から順に writer へ渡す。戻り値は記事候補の件数。
+    - CONCURRENT_MODE では各ソースを別スレッドで同時に実行する (逐次モードでは定義順に1つずつ)
+    - コレクターと保存処理の間は上限付きキューでつなぎ、メモリ使用量を抑える
+    - 各ソースの所要時間 (wall time) を最後にまとめて表示する
+    """
+    out: "queue.Queue" = queue.Queue(maxsize=max(1, ARTICLE_QUEUE_SIZE))
+    stop = threading.Event()
+    budgets = [SOURCE_TIME_BUDGETS[name] for name, _ in sources]
+    if CONCURRENT_MODE:
+        workers = max(1, len(sources))
+        max_wait = max(budgets or [0]) + SOURCE_GRACE_SEC
+    else:
+        # ワーカー1つに順番に投入すると、定義順に1ソースずつ実行される
+        workers = 1
+        max_wait = sum(budgets) + SOURCE_GRACE_SEC
+    hard_deadline = time.monotonic() + max_wait
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="collector")
+    futures = {name: executor.submit(_run_source, name, collector, out, stop, hard_deadline)
+               for name, collector in sources}
+    remaining = set(futures)
+    total = 0
+    try:
+        while remaining:
+            now = time.monotonic()
+            if now >= hard_deadline:
+                break
+            try:
+                item = out.get(timeout=min(1.0, hard_deadline - now))
+            except queue.Empty:
+                writer.flush_if_due()
+                continue
+            if isinstance(item, tuple) and item and item[0] is _SOURCE_DONE:
+                remaining.discard(item[1])
+                continue
+            total += 1
+            writer.add(item)
+            writer.flush_if_due()
+    finally:
+        # 終わらなかったソースには打ち切りを指示し、待たずに先へ進む
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        # キューに残っている収集済みの記事は保存する (既読位置に含まれている可能性があるため)
+        while True:
+            try:
+                item = out.get_nowait()
+            except queue.Empty:
+                break
+            if not (isinstance(item, tuple) and item and item[0] is _SOURCE_DONE):
+                total += 1
+                writer.add(item)
+
+    # 結果はソースの定義順に表示する (実行順に依存させない)
+    timings = {}
+    for name, future in futures.items():
+        if name in remaining:
+            print(f"[収集タイムアウト] {name}: 予算+猶予 ({max_wait:.0f} 秒) 内に終了しませんでした")
+            METRICS.error(f"collect.{name}.timeout")
+            continue
+        try:
+            count, elapsed = future.result()
+            timings[name] = elapsed
+            print(f"[収集完了] {name}: {count} 件 ({elapsed:.1f} 秒)")
+        except Exception as e:
+            print(f"[収集エラー] {name}: {e}")
+            METRICS.error(f"collect.{name}")
+
+    if timings:
+        print("--- ソース別 所要時間 ---")
+        for name, elapsed in timings.items():
+            print(f"  {name}: {elapsed:.1f} 秒")
+
+    return total
+
+
+def _print_duplicate_report(article_index: ArticleIndex, limit: int = 10) -> None:
+    """類似記事としてスキップした記事を、代表の記事ごとにまとめて表示する"""
+    duplicates = article_index.duplicates
+    if not duplicates:
+        return
+    clusters = {}
+    for url, title, representative in duplicates:
+        clusters.setdefault(representative, []).append(title)
+    print(f"--- 類似記事としてスキップ: {len(duplicates)} 件 ({len(clusters)} クラスタ) ---")
+    for representative, titles in list(clusters.items())[:limit]:
+        print(f"  {representative} ← {len(titles)} 件 (例: {titles[0]})")
+
+
+def load_article_index(supabase_client) -> ArticleIndex:
+    """
+    DB登録済みのURLとタイトルを一度だけ読み込み、全コレクターで共有するインデックスを作る
+    (登録済みの記事と、別URLの類似記事は画像検証やスクレイピングの前にスキップされる)
+    """
+    with METRICS.stage("known_urls"):
+        known_articles = fetch_known_articles(supabase_client)
+        return ArticleIndex(known_articles, titles=known_articles.items())
+
+
+def build_sources(api_keys: dict, article_index: ArticleIndex, names: Optional[Iterable[str]] = None,
+                  rss_feeds: Optional[List[str]] = None) -> List[Source]:
+    """
+    収集するソースの一覧を作る
+    - names: 指定したソースだけにする (常駐モードで取得時刻になったものだけを実行する)
+    - rss_feeds: RSSフィードを指定したものだけにする
+    """
+    wanted = set(names) if names is not None else None
+    sources: List[Source] = []
+
+    # --- Google Search API ---
+    if api_keys.get("GOOGLE_API_KEY") and api_keys.get("CUSTOM_SEARCH_CX"):
+        if wanted is None or "Google Search API" in wanted:
+            sources.append(("Google Search API", partial(iter_from_google_search, api_keys["GOOGLE_API_KEY"],
+                                                         api_keys["CUSTOM_SEARCH_CX"], article_index=article_index)))
+    elif names is None:
+        print("[収集スキップ] Google APIキーが設定されていません。")
+
+    # --- NewsAPI ---
+    if api_keys.get("NEWS_API_KEY"):
+        if wanted is None or "NewsAPI" in wanted:
+            sources.append(("NewsAPI", partial(iter_from_newsapi, api_keys["NEWS_API_KEY"],
+                                               article_index=article_index)))
+    elif names is None:
+        print("[収集スキップ] NewsAPIキーが設定されていません。")
+
+    # --- RSSフィード ---
+    if wanted is None or "RSSフィード" in wanted:
+        sources.append(("RSSフィード", partial(iter_from_rss, feeds=rss_feeds, article_index=article_index)))
+
+    # --- 個別スクレイピング ---
+    # (注: 現在はサンプル。必要に応じて有効化・拡張してください)
+    # sources.append(("個別スクレイピング", fetch_from_scraping))
+    return sources
+
+
+def run_collection(supabase_client, sources: List[Source], article_index: ArticleIndex) -> int:
+    """
+    収集と並行して、届いた記事から小さなバッチで順次保存し、新規に保存した件数を返す
+    記事をすべて保存できた場合だけ、今回の既読位置とフィードの検証子 (ETag / Last-Modified) を確定する
+    """
+    print("--- 収集した記事は順次データベースに保存します ---")
+    reset_run_cache()
+    writer = ArticleWriter(supabase_client, prepare=article_index.annotate)
+    with METRICS.stage("collect"):
+        total_collected = collect_all(sources, writer)
+    HOST_SCHEDULER.print_report()
+    _print_duplicate_report(article_index)
+
+    print(f"\n--- 全ソースから合計 {total_collected} 件の記事候補を取得しました ---")
+    print("--- 未保存の記事をデータベースに保存します ---")
+    total_saved = writer.close()
+
+    # (DB未設定や保存の失敗時は確定せず、次回もう一度同じ記事を処理する)
+    if supabase_client and writer.failed == 0:
+        print(f"--- 既読位置を更新しました ({commit_marks()} 件、フィードの検証子 {commit_feed_validators()} 件) ---")
+    else:
+        discard_marks()
+        discard_feed_validators()
+        print("--- 保存していない記事があるため、既読位置とフィードの検証子は更新しません ---")
+    return total_saved
+
+
+def cleanup(supabase_client) -> int:
+    """古いデータを削除し、削除した件数を返す"""
+    print("--- 古い記事のクリーンアップ処理を開始します ---")
+    with METRICS.stage("cleanup"):
+        return delete_old_articles(supabase_client)
+
+
+def run_daemon(supabase_client, api_keys: dict) -> None:
+    """
+    常駐モード: プロセス (接続プール・キャッシュ) を維持したまま、
+    フィード・APIごとに poll_schedule が決めた時刻になったものだけを繰り返し収集する
+    - 古い記事の削除・既知記事インデックスの読み直し・期限切れのキャッシュの削除は DAEMON_CLEANUP_SEC ごと
+    - SIGINT / SIGTERM で、実行中の収集が終わってから終了する
+    """
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    api_names = [name for name, available in (
+        ("Google Search API", api_keys.get("GOOGLE_API_KEY") and api_keys.get("CUSTOM_SEARCH_CX")),
+        ("NewsAPI", api_keys.get("NEWS_API_KEY")),
+    ) if available]
+    poll_keys = ["rss:" + url for url in RSS_FEEDS] + ["source:" + name for name in api_names]
+    print(f"データ収集デーモン開始 (RSS {len(RSS_FEEDS)} 件, API: {', '.join(api_names) or 'なし'})")
+
+    article_index = None
+    next_cleanup = 0.0
+    while not stop.is_set():
+        now = time.time()
+        # メトリクスとホスト別の統計は1回の巡回 (削除・収集) ごとに集計して書き出す
+        METRICS.reset()
+        HOST_SCHEDULER.reset_stats()
+        ran = False
+        if article_index is None or now >= next_cleanup:
+            ran = True
+            print(f"--- 古い記事を {cleanup(supabase_client)} 件削除しました。既知記事を読み直します ---")
+            print(f"--- 期限切れのキャッシュを {prune_caches()} 件削除しました ---")
+            article_index = load_article_index(supabase_client)
+            next_cleanup = now + DAEMON_CLEANUP_SEC
+
+        due_feeds = [url for url in RSS_FEEDS if is_due("rss:" + url, now)]
+        due_apis = [name for name in api_names if is_due("source:" + name, now)]
+        if due_feeds or due_apis:
+            ran = True
+            print(f"\n=== {datetime.now().isoformat(timespec='seconds')} 収集: "
+                  f"RSS {len(due_feeds)} / {len(RSS_FEEDS)} 件, API: {', '.join(due_apis) or 'なし'} ===")
+            names = due_apis + (["RSSフィード"] if due_feeds else [])
+            sources = build_sources(api_keys, article_index, names=names, rss_feeds=due_feeds)
+            total_saved = run_collection(supabase_client, sources, article_index)
+
+            # API はソース単位で、新着の有無から次の取得時刻を決める (フィードは rss_collector が記録する)
+            report = METRICS.snapshot()
+            for name in due_apis:
+                failed = any(k.startswith(f"collect.{name}") for k in report["errors"])
+                record_poll("source:" + name, report["counters"].get(f"articles.{name}", 0),
+                            hint_sec=DAEMON_SOURCE_INTERVALS[name], error=failed)
+            save_poll_schedule()
+            print(f"=== 収集完了 (新規保存: {total_saved} 件) ===")
+        if ran:
+            METRICS.write_report()
+
+        # 次に取得時刻になるフィード・API か、次の削除まで待つ (最大 DAEMON_TICK_SEC)
+        wake_at = min(next_due_at(poll_keys) or 0.0, next_cleanup) if poll_keys else next_cleanup
+        stop.wait(min(DAEMON_TICK_SEC, max(DAEMON_MIN_SLEEP_SEC, wake_at - time.time())))
+
+    parse_pool.shutdown()
+    print("データ収集デーモンを終了しました")
+
 
 def main():
     # 1. 環境変数の読み込みとDBクライアントの初期化
@@ -33,13 +367,14 @@ def main():
     supabase_client = init_supabase_client()
 
     # 2. 必要なAPIキーを環境変数から取得
-    GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
-    CUSTOM_SEARCH_CX = os.environ.get("CUSTOM_SEARCH_CX")
-    NEWS_API_KEY = os.environ.get("NEWS_API_KEY")
+    api_keys = {name: os.environ.get(name) for name in ("GOOGLE_API_KEY", "CUSTOM_SEARCH_CX", "NEWS_API_KEY")}
 
-    # 3. コマンドライン引数がある場合は単発検証モード
+    # 3. コマンドライン引数がある場合は常駐モードか単発検証モード
     #    (utils.py の get_main_image を使うように修正)
     args = sys.argv[1:]
+    if args == ["--daemon"]:
+        run_daemon(supabase_client, api_keys)
+        return
     if args:
         for u in args:
             print(f"=== 単発検証: {u}")
@@ -51,61 +386,22 @@ def main():
         return
 
     # 4. メインのバッチ処理
-    print("データ収集バッチ開始 (マルチソース・モード)")
-    
-    all_collected_articles: List[dict] = []
-
-    # --- 4-1. Google Search API から収集 ---
-    if GOOGLE_API_KEY and CUSTOM_SEARCH_CX:
-        try:
-            google_articles = fetch_from_google_search(GOOGLE_API_KEY, CUSTOM_SEARCH_CX)
-            all_collected_articles.extend(google_articles)
-            print(f"[収集完了] Google Search API: {len(google_articles)} 件")
-        except Exception as e:
-            print(f"[収集エラー] Google Search API: {e}")
-    else:
-        print("[収集スキップ] Google APIキーが設定されていません。")
-
-    # --- 4-2. NewsAPI から収集 ---
-    if NEWS_API_KEY:
-        try:
-            newsapi_articles = fetch_from_newsapi(NEWS_API_KEY)
-            all_collected_articles.extend(newsapi_articles)
-            print(f"[収集完了] NewsAPI: {len(newsapi_articles)} 件")
-        except Exception as e:
-            print(f"[収集エラー] NewsAPI: {e}")
-    else:
-        print("[収集スキップ] NewsAPIキーが設定されていません。")
+    mode = "並列" if CONCURRENT_MODE else "逐次"
+    print(f"データ収集バッチ開始 (マルチソース・モード: {mode})")
 
-    # --- 4-3. RSSフィード から収集 ---
-    try:
-        rss_articles = fetch_from_rss()
-        all_collected_articles.extend(rss_articles)
-        print(f"[収集完了] RSSフィード: {len(rss_articles)} 件")
-    except Exception as e:
-        print(f"[収集エラー] RSSフィード: {e}")
-
-    # --- 4-4. 個別スクレイピング ---
-    # (注: 現在はサンプル。必要に応じて有効化・拡張してください)
-    # try:
-    #     scraped_articles = fetch_from_scraping()
-    #     all_collected_articles.extend(scraped_articles)
-    #     print(f"[収集完了] 個別スクレイピング: {len(scraped_articles)} 件")
-    # except Exception as e:
-    #     print(f"[収集エラー] 個別スクレイピング: {e}")
+    METRICS.reset()
+    article_index = load_article_index(supabase_client)
+    sources = build_sources(api_keys, article_index)
 
-
-    print(f"\n--- 全ソースから合計 {len(all_collected_articles)} 件の記事候補を取得しました ---")
-    
-    # 5. データの保存 (変更なし)
-    print("--- データベースへの保存処理を開始します ---")
-    total_saved = save_articles_to_db(supabase_client, all_collected_articles)
+    # 5. 収集と並行して、届いた記事から小さなバッチで順次保存する
+    total_saved = run_collection(supabase_client, sources, article_index)
+    parse_pool.shutdown()
 
     # 6. 古いデータの削除 (変更なし)
-    print("--- 古い記事のクリーンアップ処理を開始します ---")
-    total_deleted = delete_old_articles(supabase_client)
+    total_deleted = cleanup(supabase_client)
 
     print(f"\nデータ収集バッチ完了 (新規保存: {total_saved} 件, 削除: {total_deleted} 件)")
+    METRICS.write_report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+実行メトリクスの記録モジュール
+- 処理段階 (ソースごとの収集 / 画像補完 / Upsert / 削除) の所要時間
+- HTTPリクエストの件数とレイテンシのヒストグラム (ホスト別・種別ごと)
+  種別は transport の request_kind: feed / html / head / get-fallback / api など
+- キャッシュのヒット率 (フィードの 304、画像検証) と、既知URLとしてスキップした件数
+- エラー件数
+実行の最後に write_report() で JSON (と、指定があれば Prometheus の textfile 形式) に書き出す。
+- BATCH_METRICS_FILE: JSONの出力先 (デフォルト: キャッシュディレクトリの run_metrics.json)
+- BATCH_METRICS_PROM_FILE: Prometheus textfile の出力先 (node_exporter の textfile collector 用。未指定なら出力しない)
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cache_store import cache_path
+from transport import add_request_observer
+
+# --- 設定 ---
+METRICS_FILE = os.environ.get("BATCH_METRICS_FILE") or cache_path("run_metrics.json")
+METRICS_PROM_FILE = os.environ.get("BATCH_METRICS_PROM_FILE") or None
+# レイテンシのヒストグラムの境界 (秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Histogram:
+    """累積しない (各区間の) 件数を持つヒストグラム。出力時に累積へ変換する"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+        self.sum_sec = 0.0
+        self.max_sec = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool) -> None:
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        self.counts[index] += 1
+        self.total += 1
+        self.sum_sec += seconds
+        self.max_sec = max(self.max_sec, seconds)
+        if error:
+            self.errors += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        running, result = 0, []
+        for bound, count in zip([f"{b:g}" for b in LATENCY_BUCKETS] + ["+Inf"], self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """区間の上端で近似した分位点 (最後の区間は観測された最大値)"""
+        if not self.total:
+            return 0.0
+        target = q * self.total
+        for (bound, running), upper in zip(self.cumulative(), list(LATENCY_BUCKETS) + [self.max_sec]):
+            if running >= target:
+                return min(upper, self.max_sec)
+        return self.max_sec
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.total,
+            "errors": self.errors,
+            "sum_sec": round(self.sum_sec, 4),
+            "max_sec": round(self.max_sec, 4),
+            "p50_sec": round(self.quantile(0.5), 4),
+            "p95_sec": round(self.quantile(0.95), 4),
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class RunMetrics:
+    """1回のバッチ実行のメトリクス (スレッドセーフ)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self._started = time.monotonic()
+            self._stages: Dict[str, dict] = {}
+            self._requests: Dict[Tuple[str, str], _Histogram] = {}
+            self._caches: Dict[str, Dict[str, int]] = {}
+            self._counters: Dict[str, int] = {}
+            self._errors: Dict[str, int] = {}
+
+    # --- 処理段階 ---
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """with METRICS.stage("upsert"): のように囲んだ処理の所要時間を記録する (同名は合算)"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.monotonic() - started)
+
+    def record_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            s = self._stages.setdefault(name, {"count": 0, "total_sec": 0.0, "max_sec": 0.0})
+            s["count"] += 1
+            s["total_sec"] += seconds
+            s["max_sec"] = max(s["max_sec"], seconds)
+
+    # --- HTTPリクエスト (transport の observer) ---
+    def observe_request(self, info: dict) -> None:
+        status = info.get("status")
+        error = bool(info.get("error")) or status is None or status >= 400
+        with self._lock:
+            key = (info.get("host") or "", info.get("kind") or "")
+            hist = self._requests.get(key)
+            if hist is None:
+                hist = self._requests[key] = _Histogram()
+            hist.observe(info.get("elapsed") or 0.0, error)
+
+    # --- キャッシュ / カウンター / エラー ---
+    def cache(self, name: str, hit: bool) -> None:
+        with self._lock:
+            c = self._caches.setdefault(name, {"hit": 0, "miss": 0})
+            c["hit" if hit else "miss"] += 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def error(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._errors[name] = self._errors.get(name, 0) + n
+
+    # --- 出力 ---
+    def snapshot(self) -> dict:
+        """現在のメトリクスを JSON に変換できる辞書で返す"""
+        with self._lock:
+            by_kind: Dict[str, _Histogram] = {}
+            by_host: Dict[str, Dict[str, dict]] = {}
+            for (host, kind), hist in sorted(self._requests.items()):
+                merged = by_kind.setdefault(kind, _Histogram())
+                merged.counts = [a + b for a, b in zip(merged.counts, hist.counts)]
+                merged.total += hist.total
+                merged.sum_sec += hist.sum_sec
+                merged.max_sec = max(merged.max_sec, hist.max_sec)
+                merged.errors += hist.errors
+                by_host.setdefault(host, {})[kind] = hist.as_dict()
+            caches = {
+                name: dict(c, hit_rate=round(c["hit"] / (c["hit"] + c["miss"]), 4) if c["hit"] + c["miss"] else None)
+                for name, c in sorted(self._caches.items())
+            }
+            return {
+                "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "duration_sec": round(time.monotonic() - self._started, 3),
+                "stages": {name: dict(s, total_sec=round(s["total_sec"], 3), max_sec=round(s["max_sec"], 3))
+                           for name, s in self._stages.items()},
+                "requests": {
+                    "by_kind": {kind: hist.as_dict() for kind, hist in sorted(by_kind.items())},
+                    "by_host": by_host,
+                },
+                "caches": caches,
+                "counters": dict(sorted(self._counters.items())),
+                "errors": dict(sorted(self._errors.items())),
+            }
+
+    def write_report(self, path: Optional[str] = METRICS_FILE, prom_path: Optional[str] = METRICS_PROM_FILE) -> dict:
+        """JSON (と Prometheus textfile) を書き出し、書き出した内容を返す"""
+        report = self.snapshot()
+        if path:
+            _write_atomic(path, json.dumps(report, ensure_ascii=False, indent=2))
+            print(f"[メトリクス] {path} に書き出しました")
+        if prom_path:
+            _write_atomic(prom_path, to_prometheus(report))
+            print(f"[メトリクス] {prom_path} に Prometheus 形式で書き出しました")
+        return report
+
+
+def _write_atomic(path: str, text: str) -> None:
+    """一時ファイル経由で置き換える (収集側が書きかけのファイルを読まないように)"""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f" [メトリクス書き出しエラー] {path} : {e}")
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(report: dict) -> str:
+    """snapshot() の内容を Prometheus の textfile 形式に変換する"""
+    lines = [
+        "# HELP batch_run_duration_seconds Duration of the last batch run.",
+        "# TYPE batch_run_duration_seconds gauge",
+        f"batch_run_duration_seconds {report['duration_sec']}",
+        "# HELP batch_run_finished_timestamp_seconds Unix time the last batch run finished.",
+        "# TYPE batch_run_finished_timestamp_seconds gauge",
+        f"batch_run_finished_timestamp_seconds {datetime.fromisoformat(report['finished_at']).timestamp():.0f}",
+        "# HELP batch_stage_duration_seconds Total time spent in each stage.",
+        "# TYPE batch_stage_duration_seconds gauge",
+    ]
+    for name, s in report["stages"].items():
+        lines.append(f'batch_stage_duration_seconds{{stage="{_label(name)}"}} {s["total_sec"]}')
+
+    lines += [
+        "# HELP batch_http_request_duration_seconds HTTP request latency by host and request kind.",
+        "# TYPE batch_http_request_duration_seconds histogram",
+    ]
+    errors = []
+    for host, kinds in report["requests"]["by_host"].items():
+        for kind, h in kinds.items():
+            labels = f'host="{_label(host)}",kind="{_label(kind)}"'
+            for bound, count in h["buckets"].items():
+                lines.append(f'batch_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"batch_http_request_duration_seconds_sum{{{labels}}} {h['sum_sec']}")
+            lines.append(f"batch_http_request_duration_seconds_count{{{labels}}} {h['count']}")
+            errors.append(f"batch_http_request_errors_total{{{labels}}} {h['errors']}")
+    lines += [
+        "# HELP batch_http_request_errors_total HTTP requests that failed or returned 4xx/5xx.",
+        "# TYPE batch_http_request_errors_total counter",
+    ] + errors
+
+    lines += ["# HELP batch_cache_requests_total Cache lookups by result.", "# TYPE batch_cache_requests_total counter"]
+    for name, c in report["caches"].items():
+        for result in ("hit", "miss"):
+            lines.append(f'batch_cache_requests_total{{cache="{_label(name)}",result="{result}"}} {c[result]}')
+
+    lines += ["# HELP batch_events_total Counted batch events.", "# TYPE batch_events_total counter"]
+    for name, value in report["counters"].items():
+        lines.append(f'batch_events_total{{name="{_label(name)}"}} {value}')
+
+    lines += ["# HELP batch_errors_total Errors by location.", "# TYPE batch_errors_total counter"]
+    for name, value in report["errors"].items():
+        lines.append(f'batch_errors_total{{where="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+# 全モジュールで共有するメトリクス (全HTTPリクエストを自動で記録する)
+METRICS = RunMetrics()
+add_request_observer(METRICS.observe_request)
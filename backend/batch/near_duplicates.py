@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+類似記事 (同じニュースの別URL) の検出モジュール
+- 同じ話題が NHK・毎日・NewsAPI・Google などから別々のURLで届くため、
+  タイトルの類似度で「同じ記事」をまとめる
+- タイトルを正規化 (NFKC・小文字化・媒体名の除去) してシングル (特徴) に分解する
+  日本語・中国語は文字の 2-gram、英数字は単語を使う
+- MinHash の署名を LSH (バンド分割) で索引し、候補だけを Jaccard 係数で確かめる
+  (全組み合わせを比較しないので、件数が増えても遅くならない)
+- Jaccard 係数が高くても、両方のタイトルに相手に無い語 (漢字・カタカナの連なり、英単語) が
+  あれば別の記事とみなす (「赤ちゃんが誕生」と「赤ちゃんが死亡」、名前や場所だけが違う記事など)
+- BATCH_NEAR_DUP=0 で無効化、NEAR_DUP_THRESHOLD で類似とみなす Jaccard 係数を変更できる
+"""
+
+import os
+import re
+import random
+import hashlib
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# --- 設定 ---
+NEAR_DUP_ENABLED = os.environ.get("BATCH_NEAR_DUP", "1") != "0"
+# この Jaccard 係数以上のタイトルを同じ記事とみなす
+# パンダの記事はどれも「パンダ」「動物園」などの語を共有するため、別の話題でも 0.6〜0.75 になる
+# (「赤ちゃん誕生」と「赤ちゃん死亡」、名前だけが違う記事など)。媒体名・句読点・助詞程度の違いに限る
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", 0.8))
+# 特徴がこれより少ないタイトル (短すぎるもの) は判定しない
+NEAR_DUP_MIN_SHINGLES = 4
+# MinHash の署名長と LSH のバンド数 (1バンド = 署名長 / バンド数 行)
+# 12 バンド x 4 行では、Jaccard 0.8 の組が候補に入る確率は約 99.8%、0.5 の組は約 54%
+# (行を減らすと、語を共有するパンダの記事がすべて同じバケットに入り、検索が遅くなる)
+MINHASH_PERMUTATIONS = 48
+LSH_BANDS = 12
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# 実行ごとに同じ署名になるよう、固定の乱数系列でハッシュ関数を決める
+_rng = random.Random(20240601)
+_HASH_PARAMS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                for _ in range(MINHASH_PERMUTATIONS)]
+
+# 【速報】 などの見出しラベルと、末尾の (共同通信) などの括弧書き
+_LABEL_RE = re.compile(r"【[^】]*】|\[[^\]]*\]")
+_TRAILING_PAREN_RE = re.compile(r"[（(][^（）()]*[）)]\s*$")
+# 「タイトル - 媒体名」「タイトル | 媒体名」の媒体名 (短いものだけ)
+_SOURCE_SUFFIX_RE = re.compile(r"\s*(?:\s-\s|\s\|\s|｜|\s–\s|\s—\s)[^-|｜–—]{1,30}$")
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# 記事の内容を表す語 (漢字の連なり、カタカナの連なり)。ひらがな (助詞など) は含めない
+_KEY_TERM_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff々]+|[\u30a0-\u30ff]+")
+# 内容を表さない英単語 (見出しの書き方の違いで増減するもの)
+_STOP_WORDS = {
+    "a", "an", "the", "to", "of", "in", "on", "at", "for", "and", "or", "as", "by", "with", "from",
+    "is", "are", "was", "were", "be", "will", "has", "have", "its", "it", "s",
+}
+
+
+def normalize_title(title: str) -> str:
+    """比較用にタイトルを正規化する (NFKC・小文字化・見出しラベルと媒体名の除去)"""
+    text = unicodedata.normalize("NFKC", title or "").lower().strip()
+    text = _SOURCE_SUFFIX_RE.sub("", text)
+    text = _LABEL_RE.sub(" ", text)
+    text = _TRAILING_PAREN_RE.sub("", text)
+    return text.strip()
+
+
+def title_shingles(title: str) -> FrozenSet[str]:
+    """タイトルの特徴の集合 (日本語・中国語は文字 2-gram、英数字は単語)"""
+    text = normalize_title(title)
+    shingles = set()
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            shingles.add(run)
+        shingles.update(run[i:i + 2] for i in range(len(run) - 1))
+    shingles.update(_WORD_RE.findall(text))
+    return frozenset(shingles)
+
+
+def key_terms(title: str) -> FrozenSet[str]:
+    """タイトルの内容を表す語の集合 (漢字・カタカナの連なりと、助詞・冠詞などを除いた英単語)"""
+    text = normalize_title(title)
+    terms = set(_KEY_TERM_RE.findall(text))
+    terms.update(w for w in _WORD_RE.findall(text) if w not in _STOP_WORDS)
+    return frozenset(terms)
+
+
+def _conflicting(a: FrozenSet[str], b: FrozenSet[str]) -> bool:
+    """両方に相手に無い語がある (出来事・名前・場所が違う) か。片方が語を足しただけなら False"""
+    return bool(a - b) and bool(b - a)
+
+
+def _minhash(shingles: FrozenSet[str]) -> Tuple[int, ...]:
+    values = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+              for s in shingles]
+    return tuple(min((a * v + b) % _MERSENNE_PRIME for v in values) for a, b in _HASH_PARAMS)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def cluster_id_for(url: str) -> str:
+    """代表記事のURLから決まるクラスタID"""
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+
+
+class StoryIndex:
+    """
+    記事タイトルの LSH 索引 (スレッドセーフではない。ArticleIndex のロックの中で使う)
+    1つのURLが1つのクラスタの代表になり、find() は似ている代表のURLを返す。
+    """
+
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD):
+        self.threshold = threshold
+        self._rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = {}
+        # URL → (特徴の集合, MinHash の署名, 内容を表す語の集合)
+        self._stories: Dict[str, Tuple[FrozenSet[str], Tuple[int, ...], FrozenSet[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._stories)
+
+    def _bands(self, signature: Tuple[int, ...]):
+        for band in range(LSH_BANDS):
+            yield band, signature[band * self._rows:(band + 1) * self._rows]
+
+    def _signature(self, title: str):
+        shingles = title_shingles(title)
+        if len(shingles) < NEAR_DUP_MIN_SHINGLES:
+            return None
+        return shingles, _minhash(shingles), key_terms(title)
+
+    def find(self, title: str) -> Optional[str]:
+        """似ているタイトルを持つ代表のURL (最も似ているもの)。なければ None"""
+        entry = self._signature(title)
+        if entry is None:
+            return None
+        shingles, signature, terms = entry
+        candidates = set()
+        for key in self._bands(signature):
+            candidates.update(self._buckets.get(key, ()))
+        best, best_score = None, self.threshold
+        for url in candidates:
+            other_shingles, _, other_terms = self._stories[url]
+            score = jaccard(shingles, other_shingles)
+            if score >= best_score and not _conflicting(terms, other_terms):
+                best, best_score = url, score
+        return best
+
+    def add(self, url: str, title: str) -> bool:
+        """url をクラスタの代表として登録する (タイトルが短すぎる場合は登録せず False)"""
+        entry = self._signature(title)
+        if entry is None or url in self._stories:
+            return False
+        self._stories[url] = entry
+        for key in self._bands(entry[1]):
+            self._buckets.setdefault(key, []).append(url)
+        return True
+
+    def remove(self, url: str) -> None:
+        entry = self._stories.pop(url, None)
+        if entry is None:
+            return
+        for key in self._bands(entry[1]):
+            bucket = self._buckets.get(key)
+            if bucket and url in bucket:
+                bucket.remove(url)
+                if not bucket:
+                    del self._buckets[key]
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+CPUを使う解析処理 (記事HTMLの画像候補の抽出、フィードの解析) の実行モジュール
+- HTTPの取得はスレッドで並列化しているが、BeautifulSoup の木の構築や feedparser.parse は
+  GIL のため1コアしか使えない。BATCH_PARSE_PROCESSES にプロセス数を指定すると、
+  大きな文書 (PARSE_POOL_MIN_BYTES 以上) の解析を別プロセスで行う
+- 別プロセスには生のバイト列を渡し、返すのは小さな結果だけにする
+  (画像候補のURLのリスト、記事ごとに必要な項目と一致したキーワードだけにしたフィード)。
+  解析木や記事の本文は返さない (キーワード判定も解析と同じプロセスで行う)
+- 未指定 (0) のときは従来どおり呼び出し元のスレッドで解析する
+- プロセスプールが使えなくなった場合 (ワーカーの異常終了など) は、以降はスレッドで解析する
+"""
+
+import os
+import html
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple, Union
+
+import feedparser
+
+import html_parser
+from keyword_matcher import get_matcher
+
+# --- 設定 ---
+PARSE_PROCESSES = int(os.environ.get("BATCH_PARSE_PROCESSES", 0))
+# これより小さい文書は、プロセス間のやり取りの方が高くつくのでスレッドで解析する
+PARSE_POOL_MIN_BYTES = 64 * 1024
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# ワーカーの異常終了後はプロセスプールを使わない
+_pool_disabled = False
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    """プロセスプールを初回の利用時に作る (無効・異常終了後は None)"""
+    global _pool
+    if PARSE_PROCESSES <= 0 or _pool_disabled:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # スレッドの動いているプロセスを fork しないよう spawn で起動する
+            _pool = ProcessPoolExecutor(max_workers=PARSE_PROCESSES,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _run(func, markup: Union[str, bytes], *args):
+    """大きな文書ならプロセスプールで、それ以外は呼び出し元のスレッドで func(markup, *args) を実行する"""
+    global _pool_disabled
+    pool = _get_pool() if len(markup or b"") >= PARSE_POOL_MIN_BYTES else None
+    if pool is not None:
+        try:
+            return pool.submit(func, markup, *args).result()
+        except BrokenProcessPool as e:
+            print(f" [解析プロセスエラー] 以降はスレッドで解析します: {e}")
+            _pool_disabled = True
+        except RuntimeError:
+            # shutdown() と同時に届いた解析 (打ち切られたコレクターなど) はスレッドで行う
+            pass
+    return func(markup, *args)
+
+
+def shutdown() -> None:
+    """プロセスプールを終了する (次に使うときに作り直す)"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# -----------------------
+# 記事HTML
+# -----------------------
+def extract_image_candidates(markup: Union[str, bytes], base_url: str, include_body: bool = True,
+                             from_encoding: Optional[str] = None) -> List[str]:
+    """html_parser.extract_image_candidates と同じ (大きな文書はプロセスプールで解析する)"""
+    return _run(html_parser.extract_image_candidates, markup, base_url, include_body, from_encoding)
+
+
+# -----------------------
+# フィード
+# -----------------------
+# コレクターが使う記事の項目 (これ以外は返さない)
+_ENTRY_FIELDS = ("id", "link", "title", "published", "updated", "published_parsed", "updated_parsed")
+
+
+def _entry_combined_text(entry) -> str:
+    """entry の title/summary/content/tags を結合して小文字化した文字列を返す"""
+    parts: List[str] = []
+    parts.append(entry.get("title") or "")
+    parts.append(entry.get("summary") or entry.get("description") or "")
+
+    content_text = ""
+    if "content" in entry:
+        try:
+            c = entry["content"]
+            if isinstance(c, list):
+                content_text = " ".join([(ci.get("value") if isinstance(ci, dict) else str(ci)) or "" for ci in c])
+            elif isinstance(c, dict):
+                content_text = c.get("value", "") or ""
+            elif isinstance(c, str):
+                content_text = c
+        except Exception:
+            content_text = ""
+    parts.append(content_text)
+
+    if "tags" in entry:
+        try:
+            tag_texts = []
+            for t in entry["tags"]:
+                if isinstance(t, dict):
+                    tag_texts.append(t.get("term", "") or t.get("label", "") or "")
+                elif isinstance(t, str):
+                    tag_texts.append(t)
+            parts.append(" ".join(tag_texts))
+        except Exception:
+            pass
+
+    combined = "\n".join(parts)
+    return html.unescape(combined).lower()
+
+
+def _parse_feed_compact(content: bytes, keywords: Optional[Tuple[str, ...]]) -> feedparser.FeedParserDict:
+    feed = feedparser.parse(content)
+    matcher = get_matcher(keywords)
+    entries = []
+    for entry in feed.entries:
+        compact = feedparser.FeedParserDict((k, entry.get(k)) for k in _ENTRY_FIELDS if entry.get(k))
+        # 本文 (summary / content / tags) は返さず、ここでキーワード判定した結果だけを返す
+        compact["matched_terms"] = matcher.find_terms(_entry_combined_text(entry))
+        entries.append(compact)
+    compact_feed = feedparser.FeedParserDict(
+        feed=feedparser.FeedParserDict(title=feed.feed.get("title"), ttl=feed.feed.get("ttl")),
+        entries=entries,
+        bozo=getattr(feed, "bozo", False),
+    )
+    if "status" in feed:
+        compact_feed["status"] = feed.status
+    return compact_feed
+
+
+def parse_feed(content: bytes, keywords: Optional[Tuple[str, ...]] = None) -> feedparser.FeedParserDict:
+    """
+    フィードを解析し、記事ごとに必要な項目だけにした結果を返す (大きなフィードはプロセスプールで解析する)
+    - feed.feed.title、feed.feed.ttl (RSS の <ttl>、分)、feed.entries、feed.bozo を持つ
+    - 各記事は id / link / title / published(_parsed) / updated(_parsed) と、
+      title / summary / content / tags のうち keywords (None なら keyword_matcher の共通リスト) に
+      一致したキーワードのリスト matched_terms を持つ
+    """
+    return _run(_parse_feed_compact, content, keywords)
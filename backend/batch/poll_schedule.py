@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+常駐モード (main.py --daemon) のための、フィード・ソースごとの取得間隔の管理モジュール
+- 取得のたびに record_poll() で結果を記録し、次に取得する時刻を決める
+  - フィードの記事の公開間隔 (中央値) の半分を基本の間隔にする (更新の多いフィードほど頻繁に取得)
+  - 新しい記事が無ければ間隔を延ばす (静かなフィードを毎回取得しない)
+  - フィードの <ttl> や Cache-Control: max-age より短くはしない
+  - 失敗が続いたら間隔を倍々に延ばす (バックオフ)
+  - 間隔は POLL_MIN_SEC 〜 POLL_MAX_SEC に収め、±POLL_JITTER の揺らぎを加える
+    (同じ時刻に取得が集中しないように)
+- 状態はキャッシュディレクトリの poll_schedule.json に保存する
+"""
+
+import os
+import time
+import random
+import statistics
+from typing import Iterable, List, Optional
+
+from cache_store import JsonStore
+
+# --- 設定 ---
+POLL_MIN_SEC = float(os.environ.get("DAEMON_POLL_MIN_SEC", 300))
+POLL_MAX_SEC = float(os.environ.get("DAEMON_POLL_MAX_SEC", 3 * 3600))
+# 初めて取得するフィード (記事の公開時刻が分からないもの) の間隔
+POLL_DEFAULT_SEC = 900
+# 新しい記事が無かったときに間隔を延ばす倍率
+POLL_QUIET_FACTOR = 1.5
+POLL_JITTER = 0.1
+# 公開間隔の推定に使う、最近の記事の数
+POLL_RECENT_ENTRIES = 10
+
+_STORE = JsonStore("poll_schedule.json")
+
+
+def _clamp(seconds: float) -> float:
+    return min(POLL_MAX_SEC, max(POLL_MIN_SEC, seconds))
+
+
+def _publish_interval(stamps: Iterable[float]) -> Optional[float]:
+    """記事の公開時刻 (UNIX秒) から、最近の公開間隔の中央値を返す (推定できなければ None)"""
+    recent = sorted(set(stamps), reverse=True)[:POLL_RECENT_ENTRIES]
+    gaps = [a - b for a, b in zip(recent, recent[1:]) if a > b]
+    return statistics.median(gaps) if len(gaps) >= 2 else None
+
+
+def is_due(key: str, now: Optional[float] = None) -> bool:
+    """key (フィードやソース) を今取得すべきか (記録が無ければ True)"""
+    state = _STORE.get(key)
+    if not state:
+        return True
+    return (now or time.time()) >= state.get("next_at", 0)
+
+
+def next_due_at(keys: Iterable[str]) -> Optional[float]:
+    """keys のうち、最も早く取得時刻になるものの時刻 (記録が無いものがあれば 0)"""
+    times: List[float] = []
+    for key in keys:
+        state = _STORE.get(key)
+        times.append(state.get("next_at", 0) if state else 0)
+    return min(times) if times else None
+
+
+def record_poll(key: str, new_items: int, stamps: Iterable[float] = (), hint_sec: Optional[float] = None,
+                error: bool = False, now: Optional[float] = None) -> float:
+    """
+    取得の結果を記録し、次に取得するまでの秒数を返す
+    - new_items: 新しく見つかった記事の数 (既読位置より新しい記事)
+    - stamps: フィードの記事の公開時刻 (UNIX秒)。公開間隔の推定に使う
+    - hint_sec: フィードやAPIが示す最短の取得間隔 (<ttl>、Cache-Control: max-age など)
+    - error: 取得に失敗したか
+    """
+    now = now or time.time()
+    state = dict(_STORE.get(key) or {})
+    previous = state.get("interval") or POLL_DEFAULT_SEC
+
+    if error:
+        state["failures"] = state.get("failures", 0) + 1
+        interval = previous * 2
+    else:
+        state["failures"] = 0
+        learned = _publish_interval(stamps)
+        interval = learned / 2 if learned is not None else previous
+        if new_items:
+            state["last_new_at"] = now
+        else:
+            interval = max(interval, previous * POLL_QUIET_FACTOR)
+        if hint_sec:
+            interval = max(interval, hint_sec)
+
+    interval = _clamp(interval)
+    state.update(interval=interval, polled_at=now,
+                 next_at=now + interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER))
+    _STORE.set(key, state)
+    return interval
+
+
+def save() -> None:
+    _STORE.save()
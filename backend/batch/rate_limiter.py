@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+レート制限モジュール
+- トークンバケット方式で、API呼び出しの頻度を一定以下に保つ
+- 同じキー (APIキーなど) のバケットはプロセス内で共有される
+"""
+
+import time
+import threading
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    トークンバケット (rate_per_sec で補充、最大 capacity 個まで貯まる)
+    acquire() はトークンが得られるまで待つ (スレッドセーフ)
+    """
+
+    def __init__(self, rate_per_sec: float, capacity: float = 1.0):
+        self.rate_per_sec = max(rate_per_sec, 1e-6)
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_sec)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0, deadline: Optional[float] = None) -> bool:
+        """
+        トークンを消費する。足りなければ補充されるまで待つ。
+        待っても deadline (time.monotonic() 基準) までに得られない場合は False を返す。
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait_sec = (tokens - self._tokens) / self.rate_per_sec
+            if deadline is not None and now + wait_sec > deadline:
+                return False
+            time.sleep(wait_sec)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(key: str, rate_per_sec: float, capacity: float = 1.0) -> TokenBucket:
+    """キーごとのバケットを返す (初回のみ rate_per_sec / capacity で作成する)"""
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(rate_per_sec, capacity)
+        return bucket
@@ -3,21 +3,45 @@
 記事データ収集モジュール (RSS)
 - 指定されたRSSフィードを巡回
 - 記事の画像は utils.py の get_main_image で補完（任意）
+- フィードの ETag / Last-Modified は、記事の保存に成功した後で main が
+  commit_feed_validators() を呼んで確定する (保存に失敗したフィードは次回も全体を取得する)
 """
 
-from typing import List, Optional
-import feedparser
-import requests
-from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
-import html
+import os
+import re
+import time
+import hashlib
+import calendar
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from urllib.parse import urlparse
 
 # 共通ヘルパーをインポート（ユーザ実装前提）
-from utils import get_main_image, parse_published
+from utils import get_main_image, parse_published, deadline_exceeded, SESSION
+from cache_store import JsonStore, cache_path
+from html_parser import find_feed_link
+from parse_pool import parse_feed
+from article_index import ArticleIndex, CLAIMED, DUPLICATE
+from keyword_matcher import get_matcher
+from metrics import METRICS
+from high_water import seen_ids, stage_mark
+from poll_schedule import record_poll, save as save_poll_schedule
+import feed_yield
+from url_canonical import canonical_article_url, canonicalize_url
 
 # --- 設定 ---
 REQUEST_TIMEOUT = 10.0
 USER_AGENT = "Mozilla/5.0 (compatible; MyRSSBot/1.0; +https://example.com/bot)"
+# 並列取得の設定（全体の同時接続数。同一ホストへの同時接続数は host_scheduler で制限する）
+RSS_MAX_WORKERS = 8
+# 304 (未更新) のとき、前回保存したフィード本文を再パースして返すか（デフォルトはスキップ）
+RSS_SERVE_CACHED_ON_304 = os.environ.get("RSS_SERVE_CACHED_ON_304", "0") == "1"
+# 新しい順のフィードで、前回までに見た記事がこの件数続いたら、そのフィードの残りは読まない
+RSS_SEEN_STOP_AFTER = int(os.environ.get("RSS_SEEN_STOP_AFTER", 5))
+# HTMLから発見したフィードURLを覚えておく期間 (秒)。過ぎたら設定URLから発見し直す
+RSS_DISCOVERY_TTL_SEC = float(os.environ.get("RSS_DISCOVERY_TTL_SEC", 7 * 24 * 3600))
 
 # 実稼働で安定して取得できたフィード（ログ確認済み）
 RSS_FEEDS = [
@@ -47,20 +71,136 @@ RSS_FEEDS = [
 ]
 
 
-# --- デフォルトキーワード（小文字で比較） ---
-DEFAULT_KEYWORDS = [
-    # 英語
-    "panda", "pandas", "giant panda", "red panda",
-    "panda cub", "baby panda", "panda birth",
-    "panda conservation", "panda breeding", "panda exhibit", "panda zoo",
+# -----------------------
+# 条件付きGET用のフィードキャッシュ (ETag / Last-Modified)
+# -----------------------
+_FEED_CACHE = JsonStore("feed_cache.json")
+_NOT_MODIFIED = "304 未更新"
+_BUDGET_EXCEEDED = "時間予算超過"
+_feed_cache_stats = {"hit": 0, "miss": 0}
+_feed_cache_stats_lock = threading.Lock()
+# 記事を最後まで処理したフィードの検証子 (フィードURL → 検証子、None は削除)。
+# 記事の保存に成功した後で main が commit_feed_validators() を呼んで確定する
+# (保存に失敗した・処理を打ち切ったフィードの検証子を保存すると、次回 304 になり記事を取りこぼすため)
+_pending_validators: Dict[str, Optional[dict]] = {}
+_pending_validators_lock = threading.Lock()
 
-    # 日本語・中国語
-    "パンダ", "レッサーパンダ",
-    "シャンシャン", "リーリー", "シンシン", "タンタン", "香香",
-    "熊猫", "大熊猫", "圓仔", "円仔", "圓圓", "円円",
-]
 
-DEFAULT_KEYWORDS_LOWER = [k.lower() for k in DEFAULT_KEYWORDS]
+# -----------------------
+# フィードURL発見のキャッシュ (設定URL → 実際のフィードURL)
+# -----------------------
+def _discovery_expired(_url: str, entry) -> bool:
+    try:
+        return time.time() - entry["resolved_at"] > RSS_DISCOVERY_TTL_SEC
+    except (TypeError, KeyError):
+        return True
+
+
+_DISCOVERY_CACHE = JsonStore("feed_discovery.json", expire=_discovery_expired)
+
+
+def _remember_feed_url(url: str, feed_url: str, how: str) -> None:
+    """設定URL url の実際のフィードURLを記録する (how: "discovered" / "redirected")"""
+    if feed_url == url:
+        _DISCOVERY_CACHE.delete(url)
+        return
+    _DISCOVERY_CACHE.set(url, {"feed_url": feed_url, "how": how, "resolved_at": time.time()})
+
+
+def discovery_report(feeds: Optional[List[str]] = None) -> List[Tuple[str, str, str]]:
+    """
+    実際のフィードURLが設定と異なる設定URLの一覧を返す (RSS_FEEDS の更新候補)
+    戻り値: [(設定URL, 実際のフィードURL, "discovered" / "redirected"), ...]
+    """
+    report = []
+    for url in feeds or RSS_FEEDS:
+        entry = _DISCOVERY_CACHE.get(url)
+        if entry and not _discovery_expired(url, entry):
+            report.append((url, entry["feed_url"], entry.get("how") or "discovered"))
+    return report
+
+
+def _count_feed_cache(kind: str) -> None:
+    with _feed_cache_stats_lock:
+        _feed_cache_stats[kind] += 1
+    METRICS.cache("feed_304", kind == "hit")
+
+
+def _feed_body_path(url: str) -> str:
+    return cache_path("feeds", hashlib.sha1(url.encode("utf-8")).hexdigest() + ".xml")
+
+
+def _conditional_headers(url: str) -> Dict[str, str]:
+    """前回の検証子から If-None-Match / If-Modified-Since ヘッダーを作る"""
+    cached = _FEED_CACHE.get(url) or {}
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+def _feed_validators(url: str, resp) -> Tuple[str, Optional[dict]]:
+    """レスポンスの ETag / Last-Modified (フィードURL, 検証子) を返す (どちらも無ければ検証子は None)"""
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return url, None
+    return url, {
+        "etag": etag,
+        "last_modified": last_modified,
+        "saved_at": datetime.now(timezone.utc).isoformat(),
+        "content": resp.content if RSS_SERVE_CACHED_ON_304 else None,
+    }
+
+
+def _stage_feed_validators(feed) -> None:
+    """記事を最後まで処理したフィードの検証子を仮登録する (commit_feed_validators() まで保存しない)"""
+    validators = feed.get("validators")
+    if validators:
+        url, entry = validators
+        with _pending_validators_lock:
+            _pending_validators[url] = entry
+
+
+def commit_feed_validators() -> int:
+    """仮登録した検証子を確定して保存し、確定した件数を返す (次回の取得から条件付きGETに使う)"""
+    with _pending_validators_lock:
+        pending = dict(_pending_validators)
+        _pending_validators.clear()
+    for url, entry in pending.items():
+        if entry is None:
+            _FEED_CACHE.delete(url)
+            continue
+        content = entry.pop("content", None)
+        if content is not None:
+            try:
+                with open(_feed_body_path(url), "wb") as f:
+                    f.write(content)
+            except OSError as e:
+                print(f"    [CACHE] フィード本文を保存できません: {e}")
+        _FEED_CACHE.set(url, entry)
+    _FEED_CACHE.save()
+    return len(pending)
+
+
+def discard_feed_validators() -> int:
+    """仮登録した検証子を破棄し、破棄した件数を返す (次回も同じフィードを全体取得する)"""
+    with _pending_validators_lock:
+        count = len(_pending_validators)
+        _pending_validators.clear()
+    return count
+
+
+def _load_cached_feed(url: str, keywords: Tuple[str, ...]):
+    """保存済みのフィード本文を再パースして返す（無ければ None）"""
+    try:
+        with open(_feed_body_path(url), "rb") as f:
+            feed = parse_feed(f.read(), keywords)
+    except OSError:
+        return None
+    return feed if len(feed.entries) > 0 else None
 
 
 # -----------------------
@@ -69,36 +209,107 @@ DEFAULT_KEYWORDS_LOWER = [k.lower() for k in DEFAULT_KEYWORDS]
 def _discover_rss_link_from_html(base_url: str, html_text: str) -> Optional[str]:
     """HTML内からRSSリンクを発見して絶対URLとして返す（見つからなければ None）"""
     try:
-        soup = BeautifulSoup(html_text, "html.parser")
-        # <link rel="alternate" type="application/rss+xml" href="...">
-        link = soup.find("link", rel=lambda x: x and "alternate" in x.lower(),
-                         type=lambda t: t and "rss" in t.lower())
-        if link and link.get("href"):
-            return urljoin(base_url, link["href"])
-        # <a> にフィードや RSS の文言がある場合
-        a = soup.find("a", href=True, string=lambda s: s and "rss" in s.lower())
-        if a:
-            return urljoin(base_url, a["href"])
+        return find_feed_link(html_text, base_url)
     except Exception:
         pass
     return None
 
 
-def _get_feed_via_requests(url: str, user_agent: str, timeout: float, verify_ssl: bool):
-    """requests で取得して feedparser に渡す。HTMLなら RSS 発見を試みる"""
-    headers = {"User-Agent": user_agent}
+def _request_feed(url: str, headers: Dict[str, str], timeout: float, verify_ssl: bool,
+                  keywords: Tuple[str, ...]):
+    """
+    フィードを条件付きGETで取得して feedparser に渡す (各記事に keywords との一致を付ける)
+    戻り値: (レスポンス, フィード, エラー)
+    - 304 のときは (None, None, _NOT_MODIFIED)（RSS_SERVE_CACHED_ON_304 なら保存済みの本文のフィード）
+    - 記事があれば検証子を feed["validators"] に付ける (url 自体がフィードの場合のみ。
+      保存するのは記事の処理と保存が終わった後)
+    """
     try:
-        resp = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True, verify=verify_ssl)
+        resp = SESSION.get(url, headers={**headers, **_conditional_headers(url)},
+                           timeout=timeout, allow_redirects=True, verify=verify_ssl, request_kind="feed")
     except Exception as e:
         print(f"  [HTTP ERROR] {url} を取得できません: {e}")
-        return None, getattr(e, "__class__", Exception)
+        METRICS.error("rss.feed_fetch")
+        return None, None, getattr(e, "__class__", Exception)
 
     status = getattr(resp, "status_code", None)
     print(f"  [HTTP] {url} -> status {status}")
-    feed = feedparser.parse(resp.content)
+    if status == 304:
+        _count_feed_cache("hit")
+        if RSS_SERVE_CACHED_ON_304:
+            cached_feed = _load_cached_feed(url, keywords)
+            if cached_feed is not None:
+                return None, cached_feed, None
+        return None, None, _NOT_MODIFIED
+    _count_feed_cache("miss")
+
+    feed = parse_feed(resp.content, keywords)
+    feed["poll_hint_sec"] = _poll_hint_sec(feed, resp)
     print(f"    feed.status: {getattr(feed,'status','N/A')}, entries: {len(feed.entries)}, bozo: {getattr(feed,'bozo',False)}")
     if len(feed.entries) > 0:
-        return feed, None
+        # 取得したURL自体がフィードだった場合のみ検証子を記録する
+        # (HTMLページの検証子では、発見先フィードの更新を検出できないため)
+        feed["validators"] = _feed_validators(url, resp)
+        return resp, feed, None
+    return resp, None, None
+
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+def _poll_hint_sec(feed, resp) -> Optional[float]:
+    """フィードが示す最短の取得間隔 (RSS の <ttl> と Cache-Control: max-age の長い方、秒)"""
+    hints = []
+    try:
+        hints.append(float(feed.feed.get("ttl")) * 60)
+    except (TypeError, ValueError):
+        pass
+    m = _MAX_AGE_RE.search(resp.headers.get("Cache-Control") or "")
+    if m:
+        hints.append(float(m.group(1)))
+    return max(hints) if hints else None
+
+
+def _permanent_redirect_target(resp) -> Optional[str]:
+    """恒久的なリダイレクト (301/308) だけを経由した場合の最終URL"""
+    history = getattr(resp, "history", None) or []
+    if history and all(r.status_code in (301, 308) for r in history) and resp.url:
+        return resp.url
+    return None
+
+
+def _get_feed_via_requests(url: str, user_agent: str, timeout: float, verify_ssl: bool,
+                           keywords: Tuple[str, ...]):
+    """
+    requests で取得して feedparser に渡す。HTMLなら RSS 発見を試みる
+    前回の ETag / Last-Modified があれば条件付きGETを行い、304 なら
+    (None, _NOT_MODIFIED) を返す（RSS_SERVE_CACHED_ON_304 なら保存済み本文を返す）
+    発見したフィードURL (と恒久的なリダイレクト先) は RSS_DISCOVERY_TTL_SEC の間覚えておき、
+    次回からは直接取得する。取得に失敗したら設定URLから発見し直す。
+    """
+    headers = {"User-Agent": user_agent}
+
+    # 前回発見したフィードURLがあれば直接取得する
+    resolved = _DISCOVERY_CACHE.get(url)
+    if resolved:
+        resp, feed, error = _request_feed(resolved["feed_url"], headers, timeout, verify_ssl, keywords)
+        if feed is not None or error is _NOT_MODIFIED:
+            METRICS.cache("feed_discovery", True)
+            return feed, error
+        # 発見済みのURLが使えなくなった: 設定URLから発見し直す
+        print(f"    [DISCOVER] 記録済みのフィード {resolved['feed_url']} が使えないため、発見し直します")
+        _DISCOVERY_CACHE.delete(url)
+        METRICS.count("rss.discovery_revalidated")
+
+    resp, feed, error = _request_feed(url, headers, timeout, verify_ssl, keywords)
+    if feed is not None or resp is None:
+        if resp is not None:
+            redirected = _permanent_redirect_target(resp)
+            if redirected:
+                _remember_feed_url(url, redirected, "redirected")
+            elif resolved:
+                _DISCOVERY_CACHE.delete(url)
+        return feed, error
 
     # HTML の場合はページ内に RSS リンクが無いか探す
     content_type = resp.headers.get("Content-Type", "")
@@ -106,58 +317,71 @@ def _get_feed_via_requests(url: str, user_agent: str, timeout: float, verify_ssl
         discovered = _discover_rss_link_from_html(resp.url, resp.text)
         if discovered and discovered != url:
             print(f"    [DISCOVER] HTML内にRSSリンクを発見: {discovered} — 再取得します")
-            try:
-                r2 = requests.get(discovered, headers=headers, timeout=timeout, allow_redirects=True, verify=verify_ssl)
-                f2 = feedparser.parse(r2.content)
-                print(f"      discovered feed.status: {getattr(f2,'status','N/A')}, entries: {len(f2.entries)}, bozo: {getattr(f2,'bozo',False)}")
-                if len(f2.entries) > 0:
-                    return f2, None
-            except Exception as e:
-                print(f"      [ERROR] 発見したRSSの取得失敗: {e}")
-                return None, e
+            METRICS.cache("feed_discovery", False)
+            _, f2, error2 = _request_feed(discovered, headers, timeout, verify_ssl, keywords)
+            if f2 is not None or error2 is _NOT_MODIFIED:
+                _remember_feed_url(url, discovered, "discovered")
+                return f2, error2
+            if error2:
+                print(f"      [ERROR] 発見したRSSの取得失敗: {error2}")
+                return None, error2
     return None, None
 
 
-def _entry_combined_text(entry) -> str:
-    """entry の title/summary/content/tags を結合して小文字化した文字列を返す"""
-    parts: List[str] = []
-    parts.append(entry.get("title") or "")
-    parts.append(entry.get("summary") or entry.get("description") or "")
-
-    content_text = ""
-    if "content" in entry:
-        try:
-            c = entry["content"]
-            if isinstance(c, list):
-                content_text = " ".join([(ci.get("value") if isinstance(ci, dict) else str(ci)) or "" for ci in c])
-            elif isinstance(c, dict):
-                content_text = c.get("value", "") or ""
-            elif isinstance(c, str):
-                content_text = c
-        except Exception:
-            content_text = ""
-    parts.append(content_text)
-
-    if "tags" in entry:
-        try:
-            tag_texts = []
-            for t in entry["tags"]:
-                if isinstance(t, dict):
-                    tag_texts.append(t.get("term", "") or t.get("label", "") or "")
-                elif isinstance(t, str):
-                    tag_texts.append(t)
-            parts.append(" ".join(tag_texts))
-        except Exception:
-            pass
-
-    combined = "\n".join(parts)
-    return html.unescape(combined).lower()
+def _fetch_feeds_concurrently(
+    feeds: List[str],
+    user_agent: str,
+    timeout: float,
+    verify_ssl: bool,
+    deadline: Optional[float],
+    max_workers: int,
+    keywords: Tuple[str, ...],
+) -> Iterator[Tuple[Optional[object], Optional[object]]]:
+    """
+    フィードを並列に取得し、入力と同じ順序で (feed, error) を順次返す。
+    (先頭から取得の終わったものを返すので、呼び出し側は全件の取得を待たずに処理できる)
+    全体の同時実行数は max_workers までに制限する
+    (同一ホストへの同時実行数と間隔は、SESSION の HOST_SCHEDULER が全コレクター共通で制限する)。
+    """
+
+    def fetch_one(url: str):
+        if deadline_exceeded(deadline):
+            return None, _BUDGET_EXCEEDED
+        print(f"[RSS] {url} を巡回中...")
+        return _get_feed_via_requests(url, user_agent, timeout, verify_ssl, keywords)
+
+    workers = max(1, min(max_workers, len(feeds)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rss") as executor:
+        # map は入力順に結果を返すため、出力順は完了順に依存しない
+        yield from executor.map(fetch_one, feeds)
+
+
+def _entry_id(entry) -> Optional[str]:
+    """既読判定に使う記事ID (guid / id、なければリンク)"""
+    return entry.get("id") or entry.get("link") or None
+
+
+def _entry_timestamp(entry) -> Optional[float]:
+    """記事の公開 (更新) 時刻を UNIX 秒で返す (feedparser の *_parsed は UTC)"""
+    dt_struct = entry.get("published_parsed") or entry.get("updated_parsed")
+    if not dt_struct:
+        return None
+    try:
+        return float(calendar.timegm(dt_struct))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _is_newest_first(entries) -> bool:
+    """公開時刻から、フィードが新しい順に並んでいると判断できるか"""
+    stamps = [t for t in (_entry_timestamp(e) for e in entries) if t is not None]
+    return len(stamps) >= 2 and stamps[0] >= stamps[-1]
 
 
 # -----------------------
 # メイン関数（外部から呼ぶだけで完結）
 # -----------------------
-def fetch_from_rss(
+def iter_from_rss(
     feeds: Optional[List[str]] = None,
     keywords: Optional[List[str]] = None,
     fetch_images: bool = False,
@@ -165,45 +389,109 @@ def fetch_from_rss(
     request_timeout: float = REQUEST_TIMEOUT,
     user_agent: str = USER_AGENT,
     max_articles_per_feed: Optional[int] = None,
-) -> List[dict]:
+    deadline: Optional[float] = None,
+    max_workers: int = RSS_MAX_WORKERS,
+    article_index: Optional[ArticleIndex] = None,
+) -> Iterator[dict]:
     """
-    フィード一覧を巡回してパンダ関連記事を返す。
+    フィード一覧を巡回してパンダ関連記事を見つけた順に返すジェネレーター。
     - feeds: RSS URL リスト（None の場合はデフォルト RSS_FEEDS）
-    - keywords: 検索キーワードリスト（None の場合は DEFAULT_KEYWORDS_LOWER）
+    - keywords: 検索キーワードリスト（None の場合は keyword_matcher の共通リスト）
     - fetch_images: True なら get_main_image を呼ぶ（遅い）
     - verify_ssl: SSL 検証を行うか（デバッグで False にすることは可）
+    - deadline: time.monotonic() 基準の締切。超過したらそこまでの結果を返す
+    - max_workers: フィード取得の全体同時数 (同一ホストへの同時数は HOST_SCHEDULER が制限する)
+    - article_index: 既知記事インデックス。登録済みURLの記事は返さない
+    フィードの取得は並列に行い、記事の抽出は収穫 (feed_yield の一致率) の多いフィードから順に行う。
+    先頭のフィードから順に、取得が終わり次第そのフィードの記事を返す。
+    十分な回数取得しても一致の無いフィードは RSS_YIELD_SKIP_SEC のあいだ取得しない。
+    前回までに見た記事 (high_water の既読位置) は読み飛ばし、新しい順のフィードでは
+    既読が RSS_SEEN_STOP_AFTER 件続いた時点でそのフィードの残りを読まない。
     """
-    feeds_to_use = feeds or RSS_FEEDS
-    kw_list = [k.lower() for k in (keywords or DEFAULT_KEYWORDS_LOWER)]
-
-    print(f"--- RSSフィード巡回開始 ({len(feeds_to_use)} 件) ---")
-    all_articles: List[dict] = []
+    # 収穫の多いフィードから取得し、一致の無いフィードは間隔を空ける
+    feeds_to_use, low_yield = feed_yield.plan_feeds(feeds or RSS_FEEDS)
+    for url in low_yield:
+        # 常駐モードでも、スキップする期間が過ぎるまでは取得時刻にしない
+        record_poll("rss:" + url, 0, hint_sec=feed_yield.skip_remaining(url))
+    # キーワード判定はフィードの解析と同時に行う (parse_feed が記事ごとに matched_terms を付ける)
+    keyword_terms = tuple(get_matcher(keywords or None).keywords)
+
+    print(f"--- RSSフィード巡回開始 ({len(feeds_to_use)} 件"
+          + (f", 一致が無いため今回は取得しない: {len(low_yield)} 件" if low_yield else "") + ") ---")
+    collected = 0
     seen_urls = set()
     skipped_samples: List[str] = []
-
-    for url in feeds_to_use:
-        print(f"[RSS] {url} を巡回中...")
-        feed, error = _get_feed_via_requests(url, user_agent, request_timeout, verify_ssl)
+    known_skipped = duplicate_skipped = 0
+    seen_skipped = 0
+    early_stopped = 0
+
+    fetched = _fetch_feeds_concurrently(
+        feeds_to_use, user_agent, request_timeout, verify_ssl, deadline, max_workers, keyword_terms
+    )
+
+    for url, (feed, error) in zip(feeds_to_use, fetched):
+        if deadline_exceeded(deadline):
+            print("  [TIMEOUT] 時間予算を超過したため、残りのフィードをスキップします")
+            break
         if not feed:
-            if error:
+            if error is _NOT_MODIFIED:
+                print(f"  [SKIP] {url} は前回から更新されていません (304)")
+            elif error:
                 print(f"  [SKIP] {url} でエラー: {error}")
             else:
                 print(f"  [SKIP] {url} から有効なフィードが取得できませんでした")
+            if error is not _BUDGET_EXCEEDED:
+                record_poll("rss:" + url, 0, error=error is not _NOT_MODIFIED)
+                feed_yield.record(url, 0, 0)
             continue
 
         source_title = feed.feed.get("title") or urlparse(url).netloc
         entries = feed.entries or []
+        mark_key = "rss:" + url
+        already_seen = seen_ids(mark_key)
+        can_stop_early = bool(already_seen) and _is_newest_first(entries)
+        visited_ids: List[str] = []
+        # 収穫の記録用: キーワード判定の対象になった記事数と、パンダ関連だった記事数 (既知URLを含む)
+        checked = matched = 0
+        latest_published: Optional[float] = None
+        seen_streak = 0
+        # 記事を最後まで見たか (件数の上限で打ち切ったフィードは、次回も全体を取得する)
+        completed = True
         for entry in entries:
-            article_url = entry.get("link")
+            entry_id = _entry_id(entry)
+            if entry_id in already_seen:
+                seen_skipped += 1
+                seen_streak += 1
+                if can_stop_early and seen_streak >= RSS_SEEN_STOP_AFTER:
+                    early_stopped += 1
+                    break
+                continue
+            seen_streak = 0
+            if entry_id:
+                visited_ids.append(entry_id)
+            stamp = _entry_timestamp(entry)
+            if stamp is not None and (latest_published is None or stamp > latest_published):
+                latest_published = stamp
+
+            # トラッキング用パラメータなどを除いた正規化済みのURLで判定・保存する
+            article_url = canonicalize_url(entry.get("link") or "")
             title = entry.get("title") or ""
             if not article_url or not title:
                 continue
+            checked += 1
 
-            # キーワード判定（title+summary+content+tags を結合して検索）
-            combined_text = _entry_combined_text(entry)
-            if not any(kw in combined_text for kw in kw_list):
+            # DB登録済み (または他のソースで処理中) の記事は、関連記事として数えてスキップする
+            if article_index is not None and article_url in article_index:
+                known_skipped += 1
+                matched += 1
+                continue
+
+            # キーワード判定（title+summary+content+tags を結合して検索した parse_feed の結果）
+            matched_terms = entry.get("matched_terms") or []
+            if not matched_terms:
                 skipped_samples.append(title or article_url or "<no title>")
                 continue
+            matched += 1
 
             # published の安全取得
             dt_struct = entry.get("published_parsed") or entry.get("updated_parsed")
@@ -215,38 +503,91 @@ def fetch_from_rss(
             else:
                 published_at = entry.get("published") or entry.get("updated") or None
 
-            # 重複除去（URLベース）
+            # 重複除去（URLベース。アグリゲーターのリンクは元記事のURLに解決してから比較する）
+            article_url = canonical_article_url(article_url)
             if article_url in seen_urls:
                 continue
             seen_urls.add(article_url)
+            if article_index is not None:
+                claimed = article_index.claim_article(article_url, title)
+                if claimed != CLAIMED:
+                    if claimed == DUPLICATE:
+                        duplicate_skipped += 1
+                    else:
+                        known_skipped += 1
+                    continue
 
-            print(f"  [FOUND] {title} ({article_url})")
+            print(f"  [FOUND] {title} ({article_url}) 一致: {', '.join(matched_terms)}")
 
             image_url = None
             if fetch_images and article_url:
                 try:
-                    image_url = get_main_image(article_url)
+                    with METRICS.stage("enrich.rss"):
+                        image_url = get_main_image(article_url)
                 except Exception as e:
                     print(f"    [IMG ERR] {e}")
+                    METRICS.error("rss.image")
 
-            all_articles.append({
+            yield {
                 "title": title,
                 "article_url": article_url,
                 "image_url": image_url,
                 "source_name": source_title,
                 "published_at": published_at
-            })
+            }
+            collected += 1
 
-            if max_articles_per_feed and len(all_articles) >= max_articles_per_feed:
+            if max_articles_per_feed and collected >= max_articles_per_feed:
+                completed = False
                 break
 
-    print(f"[収集完了] 総取得記事数: {len(all_articles)} (フィード候補: {len(feeds_to_use)})")
+        # このフィードで見た記事を既読位置として仮登録する (保存の成功後に main が確定する)
+        # 締切後に終わったフィードは登録しない (打ち切られた収集の記事は保存されないことがある)
+        if not deadline_exceeded(deadline):
+            stage_mark(mark_key, latest_published, visited_ids)
+            if completed:
+                _stage_feed_validators(feed)
+        # 記事の公開間隔と新着の有無から、常駐モードで次にこのフィードを取得する時刻を決める
+        record_poll(mark_key, len(visited_ids), [t for t in map(_entry_timestamp, entries) if t is not None],
+                    hint_sec=feed.get("poll_hint_sec"))
+        feed_yield.record(url, checked, matched)
+
+    print(f"[収集完了] 総取得記事数: {collected} (フィード候補: {len(feeds_to_use)})")
+    if article_index is not None:
+        print(f"  既知URLのためスキップ: {known_skipped} 件 / 類似記事のためスキップ: {duplicate_skipped} 件")
+        METRICS.count("known_skipped.rss", known_skipped)
+        METRICS.count("near_duplicate.rss", duplicate_skipped)
+    if seen_skipped:
+        print(f"  前回までに処理済みのためスキップ: {seen_skipped} 件 (途中で打ち切ったフィード: {early_stopped} 件)")
+    METRICS.count("incremental.seen_skipped.rss", seen_skipped)
+    METRICS.count("incremental.early_stopped.rss", early_stopped)
+    with _feed_cache_stats_lock:
+        hits, misses = _feed_cache_stats["hit"], _feed_cache_stats["miss"]
+        _feed_cache_stats.update(hit=0, miss=0)
+    print(f"  フィードキャッシュ: ヒット(304) {hits} 件 / ミス(全体取得) {misses} 件")
+    _DISCOVERY_CACHE.save()
+    save_poll_schedule()
+    feed_yield.save()
+    zero_yield = [url for url in feeds_to_use if feed_yield.is_zero_yield(url)]
+    if zero_yield:
+        interval = f"、{feed_yield.YIELD_SKIP_SEC / 3600:g} 時間ごとに取得" if feed_yield.YIELD_SKIP_SEC > 0 else ""
+        print(f"  一致の無いフィード ({len(zero_yield)} 件{interval}):")
+        for url in zero_yield[:10]:
+            print(f"   - {url}")
+    updates = discovery_report(feeds_to_use)
+    if updates:
+        print(f"  RSS_FEEDS の更新候補 ({len(updates)} 件、実際のフィードURLが設定と異なる):")
+        for configured, actual, how in updates:
+            print(f"   - {configured} → {actual} ({'HTMLから発見' if how == 'discovered' else 'リダイレクト'})")
     if skipped_samples:
         print("  スキップサンプル(最大10):")
         for s in skipped_samples[:10]:
             print("   -", s)
 
-    return all_articles
+
+def fetch_from_rss(*args, **kwargs) -> List[dict]:
+    """iter_from_rss の結果をリストで返す (引数は iter_from_rss と同じ)"""
+    return list(iter_from_rss(*args, **kwargs))
 
 
 # 実行用
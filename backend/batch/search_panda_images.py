@@ -6,18 +6,147 @@ Google Custom Search API を使用したパンダ画像収集モジュール
 
 import os
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, List
+from typing import Iterator, Optional, List
 import requests
 
 # 共通ヘルパーをインポート
-from utils import get_main_image, validate_image_url, SESSION
+from utils import get_main_image, validate_image_url, deadline_exceeded, SESSION
+from article_index import ArticleIndex, CLAIMED, DUPLICATE
+from url_canonical import canonical_article_url
+from metrics import METRICS
+
+# --- 並列実行の設定 ---
+# 検索ページを同時に取得する数 (空ページで打ち切るため、無駄になるのは最大 N-1 ページ)
+GOOGLE_PAGE_WORKERS = 3
+# 候補の検証 (画像検証 + スクレイピング) を同時に行う数
+GOOGLE_VERIFY_WORKERS = 8
+
+
+def _fetch_search_page(api_url: str, params: dict) -> List[dict]:
+    """検索結果を1ページ取得してアイテムのリストを返す (失敗時は例外)"""
+    response = None
+    try:
+        response = SESSION.get(api_url, params=params, timeout=10, request_kind="api")
+        response.raise_for_status()
+        return response.json().get("items") or []
+    except requests.RequestException as e:
+        print(f" [APIリクエストエラー]: {e}")
+        METRICS.error("google.search_page")
+        if response is not None and hasattr(response, 'text'):
+            print(f" [エラー詳細]: {response.text}")
+        raise
+
+
+def _fetch_all_pages(api_url: str, base_params: dict, total_pages: int, items_per_page: int,
+                     deadline: Optional[float]) -> List[dict]:
+    """
+    検索ページを GOOGLE_PAGE_WORKERS 件ずつ先読みしながら取得し、ページ順にアイテムを返す。
+    空のページが返ったら、それ以降のページは取得しない (未着手のものは取り消す)。
+    """
+    all_data_items: List[dict] = []
+    with ThreadPoolExecutor(max_workers=GOOGLE_PAGE_WORKERS, thread_name_prefix="gsearch") as executor:
+        pending = deque()
+        next_page = 0
+
+        def submit_next() -> None:
+            nonlocal next_page
+            params = dict(base_params, start=(next_page * items_per_page) + 1)
+            pending.append(executor.submit(_fetch_search_page, api_url, params))
+            next_page += 1
+
+        while next_page < min(GOOGLE_PAGE_WORKERS, total_pages):
+            submit_next()
 
-def fetch_from_google_search(api_key: str, cx_id: str) -> List[dict]:
+        try:
+            while pending:
+                items_on_this_page = pending.popleft().result()
+                if not items_on_this_page:
+                    print(" [情報] これ以上取得するアイテムがありません。ループを終了します。")
+                    break
+                all_data_items.extend(items_on_this_page)
+
+                if deadline_exceeded(deadline):
+                    print(" [情報] 時間予算を超過したため、ページ取得を打ち切ります。")
+                    break
+                if next_page < total_pages:
+                    submit_next()
+        finally:
+            for future in pending:
+                future.cancel()
+    return all_data_items
+
+
+def _verify_item(item: dict, deadline: Optional[float], article_index: Optional[ArticleIndex]):
+    """
+    1件の検索結果を検証し、(状態, 記事辞書) を返す。
+    状態は "ok" / "known" (既知URL) / "duplicate" (類似記事) / "skip" (URLなし・画像なし・時間切れ)
+    """
+    if deadline_exceeded(deadline):
+        return "skip", None
+
+    title = item.get("title", "(タイトルなし)")
+    google_image_url = item.get("link")
+    source_article_url = canonical_article_url(item.get("image", {}).get("contextLink") or "")
+    source_name = item.get("displayLink")
+
+    if not source_article_url:
+        print(f" [スキップ] 元記事のURLがありません: {title}")
+        return "skip", None
+
+    if article_index is not None:
+        claimed = article_index.claim_article(source_article_url, item.get("title"))
+        if claimed != CLAIMED:
+            return ("duplicate" if claimed == DUPLICATE else "known"), None
+
+    print(f"\n* 検証中: {title}")
+    print(f"   元記事 (参考文献): {source_article_url}")
+
+    final_image_url = None
+
+    # 画像の検証・スクレイピングにかかった時間だけを記録する (結果を返した後の待ち時間は含めない)
+    with METRICS.stage("enrich.google"):
+        # ★ 共通ヘルパーを使用
+        if validate_image_url(google_image_url):
+            print(f"   [OK] Google提供の画像を採用: {google_image_url}")
+            final_image_url = google_image_url
+        else:
+            print(f"   [NG] Google提供の画像が無効。元記事をスクレイピングします...")
+            # ★ 共通ヘルパーを使用
+            scraped_image_url = get_main_image(source_article_url)
+
+            if scraped_image_url:
+                print(f"   [OK] スクレイピングで画像を発見: {scraped_image_url}")
+                final_image_url = scraped_image_url
+            else:
+                print(f"   [FAIL] スクレイピングでも画像を発見できませんでした。")
+
+    if not final_image_url:
+        if article_index is not None:
+            article_index.release(source_article_url)
+        return "skip", None
+
+    return "ok", {
+        "title": title,
+        "article_url": source_article_url,
+        "image_url": final_image_url,
+        "source_name": source_name,
+        # Google Search APIは公開日を返さないため、現在時刻をセット
+        "published_at": datetime.now().isoformat()
+    }
+
+
+def iter_from_google_search(api_key: str, cx_id: str, deadline: Optional[float] = None,
+                            article_index: Optional[ArticleIndex] = None) -> Iterator[dict]:
     """
     Google Custom Search API (Image) を使って
-    過去24時間 ('d1') のパンダの画像と元記事を取得する
-    (関数名を変更)
+    過去24時間 ('d1') のパンダの画像と元記事を取得し、検証の済んだ記事から順に返すジェネレーター。
+    deadline (time.monotonic() 基準) を超過した場合は、そこで終了する。
+    article_index を渡すと、既知URLの記事は画像検証の前にスキップする。
+    - 検索ページは並列に先読みし、候補の検証はワーカープールで並列に行う
+      (結果の順序は検索結果の順序のまま)
     """
     
     API_URL = "https://www.googleapis.com/customsearch/v1"
@@ -37,80 +166,39 @@ def fetch_from_google_search(api_key: str, cx_id: str) -> List[dict]:
     
     print(f"--- Google Custom Search API 実行中 (最大100件取得, q={query}) ---")
 
-    all_data_items = [] 
-    
-    for i in range(TOTAL_PAGES_TO_TRY):
-        params['start'] = (i * ITEMS_PER_PAGE) + 1
-        
-        try:
-            response = SESSION.get(API_URL, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            items_on_this_page = data.get("items")
-            
-            if not items_on_this_page:
-                print(" [情報] これ以上取得するアイテムがありません。ループを終了します。")
-                break
-            
-            all_data_items.extend(items_on_this_page)
-
-        except requests.RequestException as e:
-            print(f" [APIリクエストエラー]: {e}")
-            if response is not None and hasattr(response, 'text'):
-                print(f" [エラー詳細]: {response.text}")
-            return [] 
-
-    results = []
-    items = all_data_items
-    
+    try:
+        items = _fetch_all_pages(API_URL, params, TOTAL_PAGES_TO_TRY, ITEMS_PER_PAGE, deadline)
+    except requests.RequestException:
+        return
+
     if not items:
         print(" [情報] 該当する画像は見つかりませんでした。")
-        return []
+        return
 
     print(f"\n--- APIから取得した合計 {len(items)} 件の記事候補を検証します ---")
 
-    for item in items:
-        title = item.get("title", "(タイトルなし)")
-        google_image_url = item.get("link")
-        source_article_url = item.get("image", {}).get("contextLink")
-        source_name = item.get("displayLink")
-
-        if not source_article_url:
-            print(f" [スキップ] 元記事のURLがありません: {title}")
-            continue
-
-        print(f"\n* 検証中: {title}")
-        print(f"   元記事 (参考文献): {source_article_url}")
-
-        final_image_url = None
-
-        # ★ 共通ヘルパーを使用
-        if validate_image_url(google_image_url):
-            print(f"   [OK] Google提供の画像を採用: {google_image_url}")
-            final_image_url = google_image_url
-        else:
-            print(f"   [NG] Google提供の画像が無効。元記事をスクレイピングします...")
-            # ★ 共通ヘルパーを使用
-            scraped_image_url = get_main_image(source_article_url)
-            
-            if scraped_image_url:
-                print(f"   [OK] スクレイピングで画像を発見: {scraped_image_url}")
-                final_image_url = scraped_image_url
-            else:
-                print(f"   [FAIL] スクレイピングでも画像を発見できませんでした。")
-
-        if final_image_url:
-            results.append({
-                "title": title,
-                "article_url": source_article_url,
-                "image_url": final_image_url,
-                "source_name": source_name,
-                # Google Search APIは公開日を返さないため、現在時刻をセット
-                "published_at": datetime.now().isoformat() 
-            })
-
-    return results
+    known_skipped = duplicate_skipped = 0
+    with ThreadPoolExecutor(max_workers=GOOGLE_VERIFY_WORKERS, thread_name_prefix="gverify") as executor:
+        # map は入力順に結果を返すため、結果の順序は検索結果の順序のまま
+        for status, article in executor.map(lambda item: _verify_item(item, deadline, article_index), items):
+            if status == "ok":
+                yield article
+            elif status == "known":
+                known_skipped += 1
+            elif status == "duplicate":
+                duplicate_skipped += 1
+
+    if deadline_exceeded(deadline):
+        print(" [情報] 時間予算を超過したため、一部の候補の検証をスキップしました。")
+    if article_index is not None:
+        print(f" [情報] 既知URLのためスキップ: {known_skipped} 件 / 類似記事のためスキップ: {duplicate_skipped} 件")
+        METRICS.count("known_skipped.google", known_skipped)
+        METRICS.count("near_duplicate.google", duplicate_skipped)
+
+
+def fetch_from_google_search(*args, **kwargs) -> List[dict]:
+    """iter_from_google_search の結果をリストで返す (引数は iter_from_google_search と同じ)"""
+    return list(iter_from_google_search(*args, **kwargs))
 
 
 # --- 単体実行 (テスト) ---
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+HTTP通信の共通設定モジュール
+- 全コレクターが使う requests.Session を1か所で作る (create_session)
+  - 接続プールのサイズ調整と keep-alive による接続の再利用
+  - 冪等なリクエスト (GET/HEAD) の 429/5xx・接続エラー時のリトライ (ジッター付きバックオフ)
+    Retry-After が HTTP_RETRY_AFTER_MAX_SEC より長い場合は待たずにそのレスポンスを返す
+  - 接続タイムアウトと読み込みタイムアウトを個別に設定
+  - 圧縮 (gzip/deflate, brotli があれば br) の受け入れ
+- すべてのリクエストはホスト単位の制御 (host_scheduler) を通り、
+  add_request_observer() で登録した関数に計測結果が通知される
+"""
+
+import os
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+from host_scheduler import HOST_SCHEDULER, HostScheduler
+
+# --- 設定 ---
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 3.05))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 10))
+# 接続プール: 保持するホスト数 / 1ホストあたりの接続数 (並列度に合わせる)
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", 64))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 16))
+# リトライ: 最大回数 / バックオフの基準秒数 / ジッターの最大秒数
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 2))
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_BACKOFF_JITTER = 0.5
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Retry-After に従って待つ最大秒数。これより長い指定は待たずに失敗とする
+# (待つ間もホストの同時接続数の枠を使い続け、ソースごとの時間予算も無視してしまうため)
+HTTP_RETRY_AFTER_MAX_SEC = float(os.environ.get("HTTP_RETRY_AFTER_MAX_SEC", 10))
+
+try:
+    import brotli  # noqa: F401  (urllib3 が br の展開に使う)
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+# --- 計測 ---
+# observer(info) の info: method, url, host, kind, status, elapsed, error
+RequestObserver = Callable[[Dict], None]
+_observers: List[RequestObserver] = []
+_observers_lock = threading.Lock()
+
+
+def add_request_observer(observer: RequestObserver) -> None:
+    """全リクエストの完了 (成功・失敗とも) 時に呼ばれる関数を登録する"""
+    with _observers_lock:
+        _observers.append(observer)
+
+
+def _notify(info: Dict) -> None:
+    with _observers_lock:
+        observers = list(_observers)
+    for observer in observers:
+        try:
+            observer(info)
+        except Exception as e:
+            print(f" [計測エラー] {e}")
+
+
+def _split_timeout(timeout):
+    """数値のタイムアウトを (接続, 読み込み) のタプルに分ける"""
+    if timeout is None:
+        return (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    if isinstance(timeout, (int, float)):
+        return (min(HTTP_CONNECT_TIMEOUT, timeout), timeout)
+    return timeout
+
+
+class _CappedRetry(Retry):
+    """Retry-After が HTTP_RETRY_AFTER_MAX_SEC を超えるレスポンスはリトライせずに返す Retry"""
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None and self.respect_retry_after_header:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None and retry_after > HTTP_RETRY_AFTER_MAX_SEC:
+                # raise_on_status=False なので、呼び出し元には最後のレスポンス (429/503) が返る
+                raise MaxRetryError(_pool, url, ResponseError(
+                    f"Retry-After {retry_after:.0f} 秒が上限 {HTTP_RETRY_AFTER_MAX_SEC:.0f} 秒を超えています"))
+        return super().increment(method, url, response=response, error=error, _pool=_pool,
+                                 _stacktrace=_stacktrace)
+
+
+def _make_retry() -> Retry:
+    options = dict(
+        total=HTTP_MAX_RETRIES,
+        # 読み込みタイムアウトの再試行は待ち時間が大きく膨らむため1回まで
+        read=min(1, HTTP_MAX_RETRIES),
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        respect_retry_after_header=True,
+        # リトライを使い切ったら最後のレスポンスをそのまま返す (呼び出し側でステータスを判定する)
+        raise_on_status=False,
+    )
+    try:
+        return _CappedRetry(backoff_jitter=HTTP_BACKOFF_JITTER, backoff_max=HTTP_RETRY_AFTER_MAX_SEC, **options)
+    except TypeError:
+        # urllib3 < 2.0 には backoff_jitter / backoff_max が無い
+        return _CappedRetry(**options)
+
+
+class BatchSession(requests.Session):
+    """
+    バッチ共通の Session
+    - request(..., request_kind="feed") のように種別を付けると計測結果に含まれる
+    - timeout を省略すると (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT) を使う
+    """
+
+    def __init__(self, scheduler: Optional[HostScheduler] = None):
+        super().__init__()
+        self.scheduler = scheduler or HOST_SCHEDULER
+
+    def request(self, method, url, *args, request_kind: Optional[str] = None, **kwargs):
+        kwargs["timeout"] = _split_timeout(kwargs.get("timeout"))
+        send = super().request
+        info = {
+            "method": method.upper(),
+            "url": url,
+            "host": (urlparse(url).hostname or "").lower(),
+            "kind": request_kind or method.lower(),
+            "status": None,
+            "elapsed": 0.0,
+            "error": None,
+        }
+        started = time.monotonic()
+        try:
+            resp = self.scheduler.call(url, lambda: send(method, url, *args, **kwargs),
+                                       stream=bool(kwargs.get("stream")))
+            info["status"] = resp.status_code
+            return resp
+        except requests.RequestException as e:
+            info["error"] = e.__class__.__name__
+            raise
+        finally:
+            info["elapsed"] = time.monotonic() - started
+            _notify(info)
+
+
+def create_session(headers: Optional[Dict[str, str]] = None,
+                   pool_connections: int = HTTP_POOL_CONNECTIONS,
+                   pool_maxsize: int = HTTP_POOL_MAXSIZE) -> BatchSession:
+    """接続プール・リトライ・タイムアウト・圧縮を設定した Session を作る"""
+    session = BatchSession()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=_make_retry(),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": ACCEPT_ENCODING, "Connection": "keep-alive"})
+    if headers:
+        session.headers.update(headers)
+    return session
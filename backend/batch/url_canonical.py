@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+記事URLの正規化モジュール (全コレクター共通)
+- 同じ記事がトラッキング用パラメータ (utm_* など)・AMP版・フラグメントの違いで
+  別のURLとして保存され、重複除去をすり抜けて何度もスクレイピングされるのを防ぐ
+- canonicalize_url(): 保存する記事URL (ホストの小文字化、既定ポート・フラグメント・
+  トラッキング用パラメータの除去、AMP版から通常版への変換)
+  残すクエリは元の文字列のまま (順序・エンコード・値の無いパラメータを変えない)
+- canonical_key(): 重複判定用のキー (さらに http/https・www.・末尾のスラッシュの違いを無視する)
+- canonical_article_url(): アグリゲーター (Yahoo!ニュースのピックアップ、Google ニュース) の
+  リンクを元記事のURLに解決してから正規化する。解決結果はキャッシュディレクトリの
+  url_redirects.json に保存し、実行中はメモリ上の対応表で引く (reset_run_cache() で実行ごとに空にする)
+- URL_RESOLVE_REDIRECTS=0 でアグリゲーターのリンクの解決を無効化
+"""
+
+import os
+import re
+import time
+import threading
+from functools import lru_cache
+from typing import Dict, Tuple
+from urllib.parse import unquote_plus, urljoin, urlsplit, urlunsplit
+
+from cache_store import JsonStore
+from metrics import METRICS
+from utils import HTTP_TIMEOUT, SESSION
+
+# --- 設定 ---
+RESOLVE_REDIRECTS = os.environ.get("URL_RESOLVE_REDIRECTS", "1") != "0"
+# アグリゲーターのリンクの解決結果を覚えておく期間 (秒)
+REDIRECT_CACHE_TTL_SEC = 30 * 24 * 3600
+
+# トラッキング用のクエリパラメータ (記事の内容は変わらないもの)
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ref", "ref_src", "ref_url", "cmpid", "ocid", "smid", "spm", "rss",
+}
+TRACKING_PARAM_PREFIXES = ("utm_",)
+# ホスト固有のトラッキング用パラメータ
+HOST_TRACKING_PARAMS = {
+    "news.yahoo.co.jp": {"source"},
+}
+# AMP版を示すクエリ (outputType=amp など)
+_AMP_QUERY = {("outputtype", "amp"), ("output", "amp")}
+_AMP_QUERY_KEYS = {"amp"}
+
+# アグリゲーターのリンクの解決規則: (ホスト, パスの先頭, 元記事のリンクを探す正規表現)
+# 正規表現が None のものは HTTP のリダイレクトだけをたどる
+AGGREGATOR_RULES = [
+    ("news.yahoo.co.jp", "/pickup/", re.compile(r"https://news\.yahoo\.co\.jp/articles/[0-9a-f]+")),
+    ("news.google.com", "/rss/articles/", None),
+    ("news.google.com", "/articles/", None),
+]
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# 末尾の /amp と .amp は、AMPキャッシュ経由か AMP のクエリがあるURLだけで除く
+# (/amp で終わる通常のページがあるため)
+_AMP_PATH_RE = re.compile(r"(?<=.)(?:/amp/?|\.amp)$")
+_AMP_HTML_RE = re.compile(r"\.amp\.html$")
+
+
+def _redirect_expired(_url: str, entry) -> bool:
+    try:
+        return time.time() - entry["resolved_at"] > REDIRECT_CACHE_TTL_SEC
+    except (TypeError, KeyError):
+        return True
+
+
+_REDIRECT_CACHE = JsonStore("url_redirects.json", expire=_redirect_expired)
+# 実行中の対応表 (元のURL → 解決・正規化したURL)
+_run_map: Dict[str, str] = {}
+_run_map_lock = threading.Lock()
+
+
+def _filter_query(query: str, host: str) -> Tuple[str, bool]:
+    """
+    トラッキング用・AMP版を示すパラメータを除いたクエリと、AMP版を示すパラメータがあったかを返す
+    除くものが無ければ元の文字列をそのまま返す (残すパラメータも元の文字列のまま)
+    """
+    if not query:
+        return query, False
+    host_params = HOST_TRACKING_PARAMS.get(host, ())
+    kept, removed, is_amp = [], False, False
+    for part in query.split("&"):
+        raw_key, _, raw_value = part.partition("=")
+        key, value = unquote_plus(raw_key).lower(), unquote_plus(raw_value).lower()
+        if (key, value) in _AMP_QUERY or key in _AMP_QUERY_KEYS:
+            is_amp = removed = True
+            continue
+        if key in TRACKING_PARAMS or key in host_params or key.startswith(TRACKING_PARAM_PREFIXES):
+            removed = True
+            continue
+        kept.append(part)
+    return ("&".join(kept) if removed else query), is_amp
+
+
+def _unwrap_amp_cache(parts):
+    """AMPキャッシュ (Google AMP Viewer / cdn.ampproject.org) のURLなら元のURLを返す"""
+    host, path = parts.hostname or "", parts.path
+    if host.endswith(".cdn.ampproject.org") and path.startswith("/c/"):
+        rest = path[len("/c/"):]
+        scheme = "https" if rest.startswith("s/") else "http"
+        rest = rest[2:] if rest.startswith("s/") else rest
+        return f"{scheme}://{rest}"
+    if host in ("www.google.com", "google.com") and path.startswith("/amp/"):
+        rest = path[len("/amp/"):]
+        if rest.startswith("s/"):
+            return "https://" + rest[2:]
+        return "http://" + rest
+    return None
+
+
+@lru_cache(maxsize=4096)
+def canonicalize_url(url: str) -> str:
+    """
+    保存用に記事URLを正規化する (解析できないURLはそのまま返す)
+    - スキームとホストの小文字化、既定ポートとフラグメントの除去
+    - トラッキング用パラメータ (utm_* など) の除去 (残りのクエリは元の文字列のまま)
+    - AMP版のURL (AMPキャッシュ、.amp.html、?amp=1) を通常版に変換
+      末尾の /amp と .amp は、AMPキャッシュ経由か AMP のクエリがある場合だけ除く
+    """
+    url = (url or "").strip()
+    try:
+        parts = urlsplit(url)
+        if parts.scheme.lower() not in _DEFAULT_PORTS or not parts.hostname:
+            return url
+        unwrapped = _unwrap_amp_cache(parts)
+        is_amp = unwrapped is not None
+        if unwrapped:
+            parts = urlsplit(unwrapped)
+        scheme, host = parts.scheme.lower(), (parts.hostname or "").lower()
+        port = parts.port
+    except ValueError:
+        return url
+
+    # IPv6 アドレスは hostname では角括弧が外れているので付け直す
+    netloc = f"[{host}]" if ":" in host else host
+    if port not in (None, _DEFAULT_PORTS[scheme]):
+        netloc = f"{netloc}:{port}"
+    if parts.username:
+        netloc = parts.netloc.rsplit("@", 1)[0] + "@" + netloc
+
+    query, amp_query = _filter_query(parts.query, host)
+    path = parts.path or "/"
+    path = _AMP_HTML_RE.sub(".html", path)
+    if is_amp or amp_query:
+        path = _AMP_PATH_RE.sub("", path)
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def canonical_key(url: str) -> str:
+    """
+    重複判定用のキー。canonicalize_url() に加えて、http/https、先頭の www.、
+    末尾のスラッシュの違いを無視する (保存するURLには使わない)
+    """
+    canonical = canonicalize_url(url)
+    parts = urlsplit(canonical)
+    if not parts.netloc:
+        return canonical
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    path = parts.path.rstrip("/")
+    return host + path + ("?" + parts.query if parts.query else "")
+
+
+def _aggregator_rule(url: str):
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    for rule_host, prefix, pattern in AGGREGATOR_RULES:
+        if host == rule_host and parts.path.startswith(prefix):
+            return pattern
+    return False
+
+
+def resolve_aggregator_url(url: str) -> str:
+    """
+    アグリゲーターのリンクなら元記事のURLを返す (それ以外・解決できない場合は url のまま)
+    HTTP のリダイレクトをたどり、ホストごとの規則があればページ内の元記事のリンクを探す
+    """
+    pattern = _aggregator_rule(url)
+    if pattern is False or not RESOLVE_REDIRECTS:
+        return url
+
+    cached = _REDIRECT_CACHE.get(url)
+    if cached:
+        METRICS.cache("url_redirect", True)
+        return cached["target"]
+    METRICS.cache("url_redirect", False)
+
+    try:
+        resp = SESSION.get(url, timeout=HTTP_TIMEOUT, allow_redirects=True, request_kind="resolve")
+        resp.raise_for_status()
+    except Exception as e:
+        print(f"    [URL解決エラー] {url} : {e}")
+        METRICS.error("url.resolve")
+        return url
+
+    target = resp.url or url
+    if pattern is not None and _aggregator_rule(target) is not False:
+        m = pattern.search(resp.text or "")
+        target = urljoin(target, m.group(0)) if m else target
+    if target != url:
+        _REDIRECT_CACHE.set(url, {"target": target, "resolved_at": time.time()})
+    return target
+
+
+def reset_run_cache() -> None:
+    """実行中の対応表を空にする (常駐モードで実行ごとに呼び、対応表が増え続けないようにする)"""
+    with _run_map_lock:
+        _run_map.clear()
+
+
+def canonical_article_url(url: str) -> str:
+    """
+    コレクターが保存する記事URL (アグリゲーターのリンクを解決して正規化したもの)
+    同じURLは実行中に1回だけ解決する
+    """
+    if not url:
+        return url
+    with _run_map_lock:
+        known = _run_map.get(url)
+    if known is not None:
+        return known
+    canonical = canonicalize_url(resolve_aggregator_url(canonicalize_url(url)))
+    with _run_map_lock:
+        _run_map[url] = canonical
+    return canonical
+
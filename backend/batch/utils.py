@@ -1,29 +1,71 @@
 #!/usr/bin/env python3
 """
 共通ヘルパーモジュール
-- HTTPリクエスト
+- HTTPリクエスト (共通 Session の作成は transport.py)
 - 画像URLの検証
-- 記事ページからの画像抽出 (OGP, JSON-LD, etc.)
+- 記事ページからの画像抽出 (OGP, JSON-LD, etc. 解析は html_parser.py)
 - 日付のパース
 """
 
-import json
+import re
+import time
+import threading
 import requests
-from bs4 import BeautifulSoup
 from datetime import datetime
 from email.utils import parsedate_to_datetime
-from typing import Optional, List
-from time import mktime
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, List, Dict, Iterator, Tuple
+
+from cache_store import JsonStore
+from parse_pool import extract_image_candidates
+from host_scheduler import HostCircuitOpen
+from metrics import METRICS
+from transport import create_session
 
 # --- 定数 ---
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
 HTTP_TIMEOUT = 10
 MIN_IMAGE_BYTES = 512
-SESSION = requests.Session()
-SESSION.headers.update({"User-Agent": USER_AGENT, "Accept-Language": "ja,en-US;q=0.9,en;q=0.8"})
+# get_main_image の高速パス: </head> まで、または最大この長さまでを先に読む
+HEAD_PREFIX_MAX_BYTES = 256 * 1024
+HTML_CHUNK_BYTES = 16 * 1024
+_HEAD_END_RE = re.compile(rb"</head\s*>", re.IGNORECASE)
+# </head> が見つからないまま打ち切るときの区切り (ASCII の > は UTF-8 / Shift_JIS / EUC-JP の
+# マルチバイト文字の途中に現れないので、ここで切っても文字が壊れない)
+_SAFE_CUT_RE = re.compile(rb">[^>]*$")
+# 画像候補を同時に検証する数
+IMAGE_VALIDATE_WORKERS = 4
+# 全コレクター共通の Session (接続プール・リトライ・ホスト単位の制御は transport.py)
+SESSION = create_session(headers={"User-Agent": USER_AGENT, "Accept-Language": "ja,en-US;q=0.9,en;q=0.8"})
+
+# 画像URL検証結果の永続キャッシュ (有効/無効で保持期間を分ける)
+IMAGE_CACHE_TTL_OK_SEC = 7 * 24 * 3600
+IMAGE_CACHE_TTL_NG_SEC = 6 * 3600
+
+
+def _image_validation_expired(_url: str, entry) -> bool:
+    try:
+        ttl = IMAGE_CACHE_TTL_OK_SEC if entry["ok"] else IMAGE_CACHE_TTL_NG_SEC
+        return time.time() - entry["checked_at"] > ttl
+    except (TypeError, KeyError):
+        return True
+
+
+_IMAGE_CACHE = JsonStore("image_validation.json", expire=_image_validation_expired)
+# 同じURLを同時に検証しようとした呼び出しは、先行するリクエストの結果を共有する
+_image_inflight: Dict[str, Future] = {}
+_image_inflight_lock = threading.Lock()
 
 # --- 共通ヘルパー関数 ---
 
+def deadline_exceeded(deadline: Optional[float]) -> bool:
+    """
+    締切時刻 (time.monotonic() 基準) を過ぎているか判定する
+    (deadline が None の場合は無制限として常に False)
+    """
+    return deadline is not None and time.monotonic() >= deadline
+
+
 def parse_published(pubval) -> datetime:
     """
     様々な形式の日付文字列や数値をdatetimeオブジェクトに変換する
@@ -50,118 +92,218 @@ def parse_published(pubval) -> datetime:
     if isinstance(pubval, (tuple, list)):
         try:
             # time.struct_time (feedparser用)
-            return datetime.fromtimestamp(mktime(tuple(pubval)))
+            return datetime.fromtimestamp(time.mktime(tuple(pubval)))
         except Exception:
             pass
             
     return datetime.now()
 
 
-def fetch_html(url: str, timeout: int = HTTP_TIMEOUT) -> Optional[tuple]:
-    """[内部] HTMLを取得して BeautifulSoup オブジェクトを返す"""
-    try:
-        resp = SESSION.get(url, timeout=timeout, allow_redirects=True)
-        resp.raise_for_status()
-        # 最終的なURLとBeautifulSoupオブジェクトを返す
-        return resp.url, BeautifulSoup(resp.text, "html.parser")
-    except requests.RequestException as e:
-        print(f" [fetch_html エラー] {url} : {e}")
-        return None
+def _cached_image_validation(img_url: str) -> Optional[bool]:
+    """[内部] 期限内の検証結果 (なければ None)"""
+    cached = _IMAGE_CACHE.get(img_url)
+    if cached is not None and not _image_validation_expired(img_url, cached):
+        return cached["ok"]
+    return None
 
 
 def validate_image_url(img_url: str, timeout: int = 6) -> bool:
-    """[内部] 提供された画像URLが有効か検証する"""
+    """
+    [内部] 提供された画像URLが有効か検証する
+    - 結果は永続キャッシュに保存し、TTL内なら再検証しない
+    - 同じURLの検証が実行中なら、その結果を待って共有する (single-flight)
+    """
+    if not img_url or not img_url.startswith("http"):
+        return False
+
+    cached = _cached_image_validation(img_url)
+    if cached is not None:
+        METRICS.cache("image_validation", True)
+        return cached
+
+    with _image_inflight_lock:
+        # 先行する検証がキャッシュに書いてから _image_inflight を消すまでの間に
+        # 上のキャッシュを読んだ場合に、同じURLをもう一度検証しないよう確かめ直す
+        cached = _cached_image_validation(img_url)
+        inflight = _image_inflight.get(img_url)
+        is_leader = cached is None and inflight is None
+        if is_leader:
+            inflight = _image_inflight[img_url] = Future()
+    if cached is not None:
+        METRICS.cache("image_validation", True)
+        return cached
+    METRICS.cache("image_validation", False)
+    if not is_leader:
+        return inflight.result()
+
+    ok = False
+    try:
+        ok = _validate_image_url_uncached(img_url, timeout)
+        _IMAGE_CACHE.set(img_url, {"ok": ok, "checked_at": time.time()})
+    except HostCircuitOpen:
+        # ホストが一時的に遮断中なだけなので、無効としてキャッシュはしない
+        ok = False
+    finally:
+        inflight.set_result(ok)
+        with _image_inflight_lock:
+            _image_inflight.pop(img_url, None)
+    return ok
+
+
+def _validate_image_url_uncached(img_url: str, timeout: int) -> bool:
+    """[内部] HEAD (失敗時は GET) で画像URLを実際に検証する"""
     try:
-        if not img_url or not img_url.startswith("http"):
-            return False
-        
         # HEADリクエストで Content-Type と Content-Length を確認
         try:
-            head = SESSION.head(img_url, timeout=timeout, allow_redirects=True)
+            head = SESSION.head(img_url, timeout=timeout, allow_redirects=True, request_kind="head")
             if head.status_code >= 400: return False
             ct = head.headers.get("Content-Type", "")
             if not ct.startswith("image/"): return False
             cl = head.headers.get("Content-Length")
             if cl and int(cl) < MIN_IMAGE_BYTES: return False
             return True
+        except HostCircuitOpen:
+            raise
         
         # HEADが失敗した場合 (サーバーがHEADをサポートしていない場合)
         except Exception:
-            g = SESSION.get(img_url, timeout=timeout, stream=True)
-            if g.status_code >= 400: return False
-            ct = g.headers.get("Content-Type", "") or ""
-            if not ct.startswith("image/"): return False
-            first_chunk = next(g.iter_content(1024), b"")
-            g.close()
-            return len(first_chunk) >= 16
-            
+            # stream のレスポンスは閉じるまでホストの同時接続の枠を使うので、必ず閉じる
+            with SESSION.get(img_url, timeout=timeout, stream=True, request_kind="get-fallback") as g:
+                if g.status_code >= 400: return False
+                ct = g.headers.get("Content-Type", "") or ""
+                if not ct.startswith("image/"): return False
+                first_chunk = next(g.iter_content(1024), b"")
+                return len(first_chunk) >= 16
+
+    except HostCircuitOpen:
+        raise
     except Exception as e:
         print(f"   [validate_image 例外] {img_url} : {e}")
+        METRICS.error("image_validation")
         return False
 
+def _open_html_stream(url: str, timeout: int = HTTP_TIMEOUT) -> Optional[requests.Response]:
+    """[内部] 本文を読み込まずにHTMLのレスポンスを開く (stream=True)"""
+    try:
+        resp = SESSION.get(url, timeout=timeout, allow_redirects=True, stream=True, request_kind="html")
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError:
+            resp.close()
+            raise
+        return resp
+    except requests.RequestException as e:
+        print(f" [HTML取得エラー] {url} : {e}")
+        METRICS.error("html_fetch")
+        return None
+
+
+def _head_end(buf: bytes) -> int:
+    """[内部] max_bytes で打ち切った先頭部分のうち、文字やタグの途中で切れない位置 (最後の > の直後)"""
+    m = _SAFE_CUT_RE.search(buf)
+    return m.start() + 1 if m else len(buf)
+
+
+def _read_html_prefix(chunks: Iterator[bytes], max_bytes: int = HEAD_PREFIX_MAX_BYTES) -> Tuple[bytes, int, bool]:
+    """
+    [内部] </head> が現れるか max_bytes に達するまで読み込む
+    戻り値: (読み込んだ部分, そのうち <head> として解析する長さ, 本文を最後まで読み切ったか)
+    解析する長さは </head> の直後まで (見つからなければ max_bytes 以内の安全な区切りまで)
+    """
+    buf = bytearray()
+    for chunk in chunks:
+        # チャンク境界をまたぐ </head> も検出できるよう、少し手前から探す
+        search_from = max(0, len(buf) - 16)
+        buf += chunk
+        m = _HEAD_END_RE.search(buf, search_from)
+        if m:
+            return bytes(buf), m.end(), False
+        if len(buf) >= max_bytes:
+            data = bytes(buf)
+            return data, _head_end(data[:max_bytes]), False
+    return bytes(buf), len(buf), True
+
+
+def _response_charset(resp: requests.Response) -> Optional[str]:
+    """[内部] ヘッダーで charset が明示されていればそれを返す (なければ文書から自動判定させる)"""
+    content_type = resp.headers.get("Content-Type", "")
+    if "charset=" in content_type.lower():
+        return resp.encoding
+    return None
+
+
+def first_valid_image(candidates: List[str], max_workers: int = IMAGE_VALIDATE_WORKERS) -> Optional[str]:
+    """
+    優先度順の画像候補を並列に検証し、有効なもののうち最も優先度の高い候補を返す。
+    自分より優先度の高い候補がすべて無効と確定した時点で返し、未着手の検証は取り消す。
+    (結果は候補を1つずつ順番に検証した場合と同じになる)
+    """
+    if not candidates:
+        return None
+    if len(candidates) == 1 or max_workers <= 1:
+        return next((c for c in candidates if validate_image_url(c)), None)
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(candidates)), thread_name_prefix="imgcheck")
+    try:
+        futures = [executor.submit(validate_image_url, c) for c in candidates]
+        for cand, future in zip(candidates, futures):
+            if future.result():
+                return cand
+        return None
+    finally:
+        # 実行中の検証は待たずに戻る (結果は検証キャッシュに残る)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def get_main_image(article_url: str) -> Optional[str]:
     """
     記事URLをスクレイピングしてOGPや本文からメイン画像を取得する
     (すべてのコレクターモジュールから呼び出される)
+    - まず </head> までだけを読み、OGP/Twitter/JSON-LD の候補を検証する (高速パス)
+    - 有効な候補がなければ残りの本文を読み、本文中の画像まで含めて探す
+    - 候補の検証は first_valid_image で並列に行う (優先順位は従来どおり)
+    - 記事HTMLのレスポンスは候補の検証の前に閉じる (ホストの同時接続の枠を使い続けないように。
+      同じホストの画像の検証が枠の空きを待ち続けることがある)
     """
-    fetched = fetch_html(article_url)
-    if not fetched:
+    resp = _open_html_stream(article_url)
+    if resp is None:
         return None
-    final_url, soup = fetched
-
-    # 1) OGP / Twitter
-    meta_keys = [
-        ("meta", {"property": "og:image"}, "content"),
-        ("meta", {"property": "og:image:secure_url"}, "content"),
-        ("meta", {"name": "twitter:image"}, "content"),
-    ]
-    for tag, attrs, attrname in meta_keys:
-        t = soup.find(tag, attrs=attrs)
-        if t and t.get(attrname):
-            cand = requests.compat.urljoin(final_url, t.get(attrname))
-            if validate_image_url(cand):
-                return cand
 
-    # 2) JSON-LD
-    for script in soup.find_all("script", type="application/ld+json"):
-        try:
-            txt = script.string
-            if not txt: continue
-            data = json.loads(txt)
-            items = data if isinstance(data, list) else [data]
-            for it in items:
-                if isinstance(it, dict):
-                    img = it.get("image") or it.get("thumbnailUrl")
-                    if isinstance(img, str):
-                        cand = requests.compat.urljoin(final_url, img)
-                        if validate_image_url(cand): return cand
-                    elif isinstance(img, dict):
-                        urlf = img.get("url")
-                        if urlf:
-                            cand = requests.compat.urljoin(final_url, urlf)
-                            if validate_image_url(cand): return cand
-                    elif isinstance(img, list):
-                        for it2 in img:
-                            if isinstance(it2, str):
-                                cand = requests.compat.urljoin(final_url, it2)
-                                if validate_image_url(cand): return cand
-        except Exception:
-            continue
-
-    # 3) 本文中画像
-    selectors = ["article", "main", "[role='main']", ".post-content", ".article-body", "#content"]
-    main_content = None
-    for s in selectors:
-        main_content = soup.select_one(s)
-        if main_content: break
-    if not main_content:
-        main_content = soup.body
-
-    if main_content:
-        for img in main_content.find_all("img", src=True):
-            src = img.get("src")
-            if not src or src.startswith("data:"): continue
-            cand = requests.compat.urljoin(final_url, src)
-            if validate_image_url(cand):
-                return cand
-    return None
\ No newline at end of file
+    tried = set()
+    try:
+        final_url = resp.url
+        charset = _response_charset(resp)
+        chunks = resp.iter_content(HTML_CHUNK_BYTES)
+        prefix, head_end, complete = _read_html_prefix(chunks)
+
+        head_candidates = extract_image_candidates(prefix[:head_end], final_url, include_body=False,
+                                                   from_encoding=charset)
+        if complete:
+            body = prefix
+        elif head_candidates:
+            # 高速パスの候補を先に検証し、見つからなかった場合だけ本文を取り直す
+            body = None
+        else:
+            try:
+                body = prefix + b"".join(chunks)
+            except requests.RequestException:
+                # 読み込み中に接続が切れた場合などは取り直す
+                body = None
+    finally:
+        resp.close()
+
+    if not complete and head_candidates:
+        tried.update(head_candidates)
+        found = first_valid_image(head_candidates)
+        if found:
+            return found
+
+    if body is None:
+        resp = _open_html_stream(article_url)
+        if resp is None:
+            return None
+        with resp:
+            final_url, charset, body = resp.url, _response_charset(resp), resp.content
+
+    candidates = extract_image_candidates(body, final_url, from_encoding=charset)
+    return first_valid_image([c for c in candidates if c not in tried])
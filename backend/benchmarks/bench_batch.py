@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+収集バッチのオフライン・ベンチマーク
+- bench_server.py のローカルHTTPサーバー (フィード / 記事HTML / 画像のスタンドイン) に対して、
+  次のシナリオを実行してスループットと p50/p95 レイテンシを測る
+    rss       fetch_from_rss (RSS 2.0 / RDF / HTML からのフィード発見)
+    page      get_main_image (OGP / JSON-LD / 本文画像の記事HTML)
+    image     validate_image_url (有効な画像と 404 の画像)
+    pipeline  main() 全体 (DBはスタブ、Google / NewsAPI は無効)
+- 各回で別のURLを使うため、キャッシュ (フィードの ETag / 画像検証) は効かない (--warm で同じURLを再利用)
+- キャッシュの保存先は一時ディレクトリにするので、batch/.cache には影響しない
+- --output で保存したJSONを --compare に渡すと、コミット間の差を表示できる
+
+実行方法 (backend ディレクトリから):
+    python benchmarks/bench_batch.py [--scenarios rss,page,image,pipeline] [--repeat 3]
+        [--latency-ms 20] [--failure-rate 0.05] [--output result.json] [--compare base.json]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BATCH_DIR = os.path.join(BENCH_DIR, "..", "batch")
+
+# バッチのモジュールは import 時に設定を読むため、先に環境を整える
+os.environ["BATCH_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-cache-")
+# .env に本物のキーがあっても外部APIへは接続しない (load_dotenv は既存の値を上書きしない)
+for _key in ("GOOGLE_API_KEY", "CUSTOM_SEARCH_CX", "NEWS_API_KEY", "SUPABASE_URL", "SUPABASE_KEY"):
+    os.environ[_key] = ""
+# フィクスチャの記事タイトルは数種類の使い回しなので、類似記事の判定は無効にする (記事数を比較できるように)
+os.environ.setdefault("BATCH_NEAR_DUP", "0")
+sys.path.insert(0, BATCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import main as batch_main  # noqa: E402
+import rss_collector  # noqa: E402
+from html_parser import HTML_PARSER  # noqa: E402
+from host_scheduler import HOST_SCHEDULER  # noqa: E402
+from transport import add_request_observer  # noqa: E402
+from utils import get_main_image, validate_image_url  # noqa: E402
+from bench_server import ARTICLE_VARIANTS, BenchServer, FaultInjection  # noqa: E402
+
+SCENARIOS = ("rss", "page", "image", "pipeline")
+
+
+# -----------------------
+# 計測
+# -----------------------
+def percentile(samples: List[float], p: float) -> float:
+    """最近傍順位法のパーセンタイル (samples が空なら 0)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(round(p / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _latency_summary(samples: List[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "max_ms": max(samples) * 1000 if samples else 0.0,
+    }
+
+
+class RequestRecorder:
+    """transport の observer として、HTTPリクエストの所要時間を種別ごとに記録する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_kind: Dict[str, List[float]] = {}
+        self._errors: Dict[str, int] = {}
+
+    def __call__(self, info: dict) -> None:
+        with self._lock:
+            self._by_kind.setdefault(info["kind"], []).append(info["elapsed"])
+            status = info.get("status")
+            if info.get("error") or status is None or status >= 400:
+                self._errors[info["kind"]] = self._errors.get(info["kind"], 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._by_kind.clear()
+            self._errors.clear()
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {kind: dict(_latency_summary(samples), errors=self._errors.get(kind, 0))
+                    for kind, samples in sorted(self._by_kind.items())}
+
+
+RECORDER = RequestRecorder()
+add_request_observer(RECORDER)
+
+
+# -----------------------
+# DBスタブ
+# -----------------------
+class _StubResponse:
+    def __init__(self, data=None, count=None):
+        self.data = data
+        self.count = count
+
+
+class _StubQuery:
+    """supabase のクエリビルダーのうち、バッチが使うメソッドだけを受け付ける"""
+
+    def __init__(self, client: "StubSupabaseClient"):
+        self._client = client
+        self._op = "select"
+        self._rows: List[dict] = []
+
+    def select(self, *args, **kwargs):
+        self._op = "select"
+        return self
+
+    def upsert(self, rows, **kwargs):
+        self._op, self._rows = "upsert", list(rows)
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def range(self, *args, **kwargs):
+        return self
+
+    def lt(self, *args, **kwargs):
+        return self
+
+    def lte(self, *args, **kwargs):
+        return self
+
+    def execute(self) -> _StubResponse:
+        return self._client.execute(self._op, self._rows)
+
+
+class StubSupabaseClient:
+    """DBの代わりに upsert された記事を記録するだけのクライアント"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.article_urls = set()
+        self.calls = {"select": 0, "upsert": 0, "delete": 0}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _StubQuery:
+        return _StubQuery(self)
+
+    def execute(self, op: str, rows: List[dict]) -> _StubResponse:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        with self._lock:
+            self.calls[op] += 1
+            if op == "upsert":
+                inserted = [r for r in rows if r["article_url"] not in self.article_urls]
+                self.article_urls.update(r["article_url"] for r in inserted)
+                return _StubResponse(data=inserted)
+        if op == "delete":
+            return _StubResponse(data=None, count=0)
+        return _StubResponse(data=[])
+
+
+# -----------------------
+# シナリオ
+# -----------------------
+def _quiet(verbose: bool):
+    """バッチのログ出力を捨てる (--verbose のときはそのまま表示する)"""
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def _timed_calls(func: Callable[[str], object], urls: List[str], workers: int):
+    """urls を workers 並列で func に渡し、(結果リスト, 1件ごとの所要秒数リスト) を返す"""
+    def run_one(url: str):
+        started = time.perf_counter()
+        result = func(url)
+        return result, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bench") as executor:
+        pairs = list(executor.map(run_one, urls))
+    return [r for r, _ in pairs], [t for _, t in pairs]
+
+
+def _feed_urls(server: BenchServer, run: int, feeds: int) -> List[str]:
+    # RSS 2.0 / RDF / HTML からの発見を 2:1:1 の割合で混ぜる
+    fmts = ("rss", "rdf", "rss", "page")
+    return [server.site.feed_url(run, n, fmts[n % len(fmts)]) for n in range(feeds)]
+
+
+def scenario_rss(server: BenchServer, run: int, args) -> dict:
+    feeds = _feed_urls(server, run, args.feeds)
+    started = time.perf_counter()
+    articles = rss_collector.fetch_from_rss(feeds=feeds, fetch_images=False)
+    elapsed = time.perf_counter() - started
+    return {"wall_sec": elapsed, "units": len(feeds), "samples": [elapsed],
+            "extra": {"articles": len(articles)}}
+
+
+def scenario_page(server: BenchServer, run: int, args) -> dict:
+    urls = [server.site.article_url(run, n, 0) for n in range(args.articles)]
+    started = time.perf_counter()
+    images, samples = _timed_calls(get_main_image, urls, args.workers)
+    return {"wall_sec": time.perf_counter() - started, "units": len(urls), "samples": samples,
+            "extra": {"found": sum(1 for i in images if i)}}
+
+
+def scenario_image(server: BenchServer, run: int, args) -> dict:
+    # 4件に1件は 404 になる画像
+    names = [f"{'missing' if i % 4 == 3 else ARTICLE_VARIANTS[i % len(ARTICLE_VARIANTS)]}-img-{i}"
+             for i in range(args.images)]
+    urls = [server.site.image_url(run, name, i) for i, name in enumerate(names)]
+    started = time.perf_counter()
+    results, samples = _timed_calls(validate_image_url, urls, args.workers)
+    return {"wall_sec": time.perf_counter() - started, "units": len(urls), "samples": samples,
+            "extra": {"valid": sum(1 for ok in results if ok)}}
+
+
+def scenario_pipeline(server: BenchServer, run: int, args) -> dict:
+    client = StubSupabaseClient(latency_ms=args.db_latency_ms)
+    rss_collector.RSS_FEEDS[:] = _feed_urls(server, run, args.feeds)
+    original_init, original_argv = batch_main.init_supabase_client, sys.argv
+    batch_main.init_supabase_client = lambda: client
+    sys.argv = [sys.argv[0]]
+    try:
+        started = time.perf_counter()
+        batch_main.main()
+        elapsed = time.perf_counter() - started
+    finally:
+        batch_main.init_supabase_client, sys.argv = original_init, original_argv
+    return {"wall_sec": elapsed, "units": len(client.article_urls), "samples": [elapsed],
+            "extra": {"saved": len(client.article_urls), "db_calls": dict(client.calls)}}
+
+
+SCENARIO_FUNCS = {
+    "rss": scenario_rss,
+    "page": scenario_page,
+    "image": scenario_image,
+    "pipeline": scenario_pipeline,
+}
+
+
+def run_scenario(name: str, server: BenchServer, args, first_run: int) -> dict:
+    """シナリオを repeat 回実行し、集計結果を返す"""
+    runs = []
+    samples: List[float] = []
+    RECORDER.reset()
+    requests_before = server.request_count
+    for i in range(args.repeat):
+        HOST_SCHEDULER.reset()
+        run = first_run if args.warm else first_run + i
+        with _quiet(args.verbose):
+            result = SCENARIO_FUNCS[name](server, run, args)
+        runs.append(result)
+        samples.extend(result["samples"])
+
+    wall = [r["wall_sec"] for r in runs]
+    units = sum(r["units"] for r in runs)
+    return {
+        "repeat": args.repeat,
+        "wall_sec_median": statistics.median(wall),
+        "wall_sec_runs": wall,
+        "units": units,
+        "throughput_per_sec": units / sum(wall) if sum(wall) else 0.0,
+        "latency": _latency_summary(samples),
+        "http": RECORDER.summary(),
+        "server_requests": server.request_count - requests_before,
+        "extra": [r["extra"] for r in runs],
+    }
+
+
+# -----------------------
+# 出力
+# -----------------------
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def print_report(report: dict) -> None:
+    meta = report["meta"]
+    print(f"コミット {meta['commit'] or '?'} / Python {meta['python']} / HTMLパーサー {meta['html_parser']}")
+    print(f"注入: {meta['faults']} / 繰り返し {meta['repeat']} 回{' (キャッシュあり)' if meta['warm'] else ''}")
+    for name, s in report["scenarios"].items():
+        lat = s["latency"]
+        print(f"\n[{name}] {s['throughput_per_sec']:8.1f} 件/秒  wall 中央値 {s['wall_sec_median']:.2f} 秒  "
+              f"p50 {lat['p50_ms']:.1f} ms / p95 {lat['p95_ms']:.1f} ms  (サーバー側 {s['server_requests']} リクエスト)")
+        for kind, h in s["http"].items():
+            print(f"    HTTP {kind:10s} {h['count']:5d} 件  p50 {h['p50_ms']:7.1f} ms  p95 {h['p95_ms']:7.1f} ms  "
+                  f"エラー {h['errors']}")
+
+
+def print_comparison(base: dict, report: dict) -> None:
+    """基準の結果 (--compare) との差を表示する。スループットは増加、レイテンシは減少が改善"""
+    print(f"\n--- 比較: {base['meta'].get('commit') or '?'} → {report['meta'].get('commit') or '?'} ---")
+    for name, s in report["scenarios"].items():
+        b = base.get("scenarios", {}).get(name)
+        if not b:
+            print(f"  [{name}] 基準に結果がありません")
+            continue
+
+        def delta(new: float, old: float) -> str:
+            return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+        print(f"  [{name}] スループット {b['throughput_per_sec']:.1f} → {s['throughput_per_sec']:.1f} 件/秒 "
+              f"({delta(s['throughput_per_sec'], b['throughput_per_sec'])})  "
+              f"p50 {delta(s['latency']['p50_ms'], b['latency']['p50_ms'])}  "
+              f"p95 {delta(s['latency']['p95_ms'], b['latency']['p95_ms'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="実行するシナリオ (カンマ区切り)")
+    parser.add_argument("--repeat", type=int, default=3, help="各シナリオの繰り返し回数")
+    parser.add_argument("--warm", action="store_true", help="毎回同じURLを使い、キャッシュが効いた状態も測る")
+    parser.add_argument("--hosts", type=int, default=6, help="サーバーのホスト数 (ループバックアドレス)")
+    parser.add_argument("--feeds", type=int, default=12, help="rss / pipeline で巡回するフィード数")
+    parser.add_argument("--articles", type=int, default=30, help="page で取得する記事数")
+    parser.add_argument("--images", type=int, default=60, help="image で検証する画像数")
+    parser.add_argument("--workers", type=int, default=8, help="page / image の同時実行数")
+    parser.add_argument("--paragraphs", type=int, default=400, help="記事HTMLの段落数 (ページの大きさ)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="全レスポンスに加える遅延 (ミリ秒)")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="遅延に加えるランダムな揺らぎの最大値 (ミリ秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="503 を返すパスの割合")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="極端に遅くするパスの割合")
+    parser.add_argument("--slow-ms", type=float, default=2000.0, help="極端に遅いパスに加える遅延 (ミリ秒)")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="DBスタブの1回あたりの遅延 (ミリ秒)")
+    parser.add_argument("--seed", type=int, default=0, help="揺らぎの乱数シード")
+    parser.add_argument("--output", help="結果のJSONを保存するファイル")
+    parser.add_argument("--compare", help="比較の基準にする、以前の --output のJSON")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで標準出力に出す")
+    parser.add_argument("--verbose", action="store_true", help="バッチのログを表示する")
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIO_FUNCS]
+    if unknown:
+        parser.error(f"未対応のシナリオ: {', '.join(unknown)}")
+
+    faults = FaultInjection(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, failure_rate=args.failure_rate,
+                            slow_rate=args.slow_rate, slow_ms=args.slow_ms, seed=args.seed)
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "html_parser": HTML_PARSER,
+            "repeat": args.repeat,
+            "warm": args.warm,
+            "faults": faults.as_dict(),
+            "sizes": {"hosts": args.hosts, "feeds": args.feeds, "articles": args.articles,
+                      "images": args.images, "workers": args.workers, "paragraphs": args.paragraphs},
+        },
+        "scenarios": {},
+    }
+
+    with BenchServer(hosts=args.hosts, faults=faults, article_paragraphs=args.paragraphs) as server:
+        # シナリオごとに run 番号の範囲を分け、シナリオ間でもキャッシュが効かないようにする
+        for i, name in enumerate(names):
+            report["scenarios"][name] = run_scenario(name, server, args, first_run=i * 1000)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+HTMLパーサーのベンチマーク
+- 重いニュースページを模したHTML (OGP / JSON-LD / 本文画像の3種類) を生成し、
+  利用可能なパーサーごとに「パース + 画像候補抽出」と「RSSリンク発見」の時間を測る
+- パーサー間で抽出結果が一致することも確認する
+
+実行方法 (backend ディレクトリから):
+    python benchmarks/bench_html_parser.py [--repeat 5] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "batch"))
+
+from html_parser import FALLBACK_PARSER, extract_image_candidates, find_feed_link, lxml  # noqa: E402
+
+BASE_URL = "https://news.example.com/articles/panda"
+
+
+def _article_page(variant: str, paragraphs: int = 12000) -> bytes:
+    """1〜3MB 程度のニュース記事ページを生成する"""
+    head = ['<meta charset="utf-8"><title>ジャイアントパンダの赤ちゃん誕生</title>']
+    head += [f'<link rel="stylesheet" href="/static/css/{i}.css">' for i in range(40)]
+    head.append("<script>" + "var x = 1;" * 5000 + "</script>")
+    if variant == "ogp":
+        head.append('<meta property="og:image" content="/images/og/panda.jpg">')
+        head.append('<meta name="twitter:image" content="https://cdn.example.com/tw/panda.jpg">')
+    if variant in ("ogp", "jsonld"):
+        ld = {"@type": "NewsArticle", "image": ["/images/ld/panda-1.jpg", "/images/ld/panda-2.jpg"]}
+        head.append(f'<script type="application/ld+json">{json.dumps(ld)}</script>')
+    head.append('<link rel="alternate" type="application/rss+xml" href="/rss/news.xml">')
+
+    body = ['<header><nav>' + "".join(f'<a href="/c/{i}">カテゴリ{i}</a>' for i in range(200)) + "</nav></header>"]
+    body.append('<main><article class="article-body">')
+    for i in range(paragraphs):
+        body.append(f"<p>上野動物園のパンダに関する記事の段落 {i}。<span>詳細</span></p>")
+        if i % 1500 == 0:
+            body.append(f'<img src="/images/body/{i}.jpg" alt="panda {i}">')
+    body.append('<img src="data:image/gif;base64,R0lGOD">')
+    body.append("</article></main><footer>" + "<div>footer</div>" * 500 + "</footer>")
+    return ("<!DOCTYPE html><html><head>" + "".join(head) + "</head><body>" + "".join(body)
+            + "</body></html>").encode("utf-8")
+
+
+# 抽出結果の一致だけを確認する小さな入力 (パーサーごとの挙動の違いが出やすいもの)
+EDGE_CASES = {
+    "edge:a-rss-span": b'<html><body><a href="/x">Top</a><a href="/feed.xml"><span>RSS Feed</span></a></body></html>',
+    "edge:no-body-tag": b'<meta property="og:image" content="/og.png"><p>text</p><img src="/a.jpg">',
+    "edge:link-no-href": (b'<html><head><link rel="Alternate" type="application/RSS+xml">'
+                          b'</head><body><a href="/rss">rss</a></body></html>'),
+    "edge:shift-jis": ('<html><head><meta charset="shift_jis"><title>パンダ</title>'
+                       '<meta name="twitter:image" content="/画像/パンダ.jpg"></head>'
+                       '<body><div id="content"><img src="/b.jpg"></div></body></html>').encode("shift_jis"),
+    "edge:xml-declaration": (b'<?xml version="1.0" encoding="utf-8"?><html><head>'
+                             b'<script type="application/ld+json">{"image": {"url": "/ld.jpg"}}</script>'
+                             b'</head><body><main><img src="/m.jpg"></main></body></html>'),
+    # 本文の無いページで、コメントや <script> の中にだけ "<body" がある
+    "edge:body-in-comment": b'<meta property="og:image" content="/og.png"><!-- <body> --><img src="/a.jpg">',
+    "edge:body-in-script": b'<script>document.write("<body>");</script><img src="/a.jpg">',
+    "edge:body-after-comment": b'<!-- <body> --><body class="x"><img src="/a.jpg"></body>',
+}
+
+
+def _time_it(func, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - started)
+    return result, samples
+
+
+def run(repeat: int) -> dict:
+    parsers = [FALLBACK_PARSER] + (["lxml"] if lxml is not None else [])
+    pages = {variant: _article_page(variant) for variant in ("ogp", "jsonld", "body")}
+    pages.update(EDGE_CASES)
+    report = {"parsers": parsers, "cases": {}}
+
+    for variant, page in pages.items():
+        html_text = page.decode("utf-8", errors="replace")
+        case = {"bytes": len(page), "results": {}}
+        for parser in parsers:
+            candidates, extract_samples = _time_it(
+                lambda: extract_image_candidates(page, BASE_URL, parser=parser), repeat)
+            feed_link, discover_samples = _time_it(
+                lambda: find_feed_link(html_text, BASE_URL, parser=parser), repeat)
+            case["results"][parser] = {
+                "candidates": candidates,
+                "feed_link": feed_link,
+                "extract_median_sec": statistics.median(extract_samples),
+                "discover_median_sec": statistics.median(discover_samples),
+            }
+        outputs = {(r["feed_link"], tuple(r["candidates"])) for r in case["results"].values()}
+        case["results_match"] = len(outputs) == 1
+        report["cases"][variant] = case
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="各計測の繰り返し回数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"パーサー: {', '.join(report['parsers'])} (繰り返し {args.repeat} 回の中央値)")
+    for variant, case in report["cases"].items():
+        if variant.startswith("edge:"):
+            print(f"\n[{variant}] 抽出結果の一致: {'OK' if case['results_match'] else 'NG'}")
+            continue
+        print(f"\n[{variant}] {case['bytes'] / 1024 / 1024:.1f} MB / 抽出結果の一致: {'OK' if case['results_match'] else 'NG'}")
+        base = case["results"][FALLBACK_PARSER]
+        for name, r in case["results"].items():
+            speedup = base["extract_median_sec"] / r["extract_median_sec"] if r["extract_median_sec"] else 0
+            print(f"  {name:12s} 画像候補抽出 {r['extract_median_sec'] * 1000:8.1f} ms (x{speedup:.1f})"
+                  f"  RSSリンク発見 {r['discover_median_sec'] * 1000:8.1f} ms  候補 {len(r['candidates'])} 件")
+    if not all(c["results_match"] for c in report["cases"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+類似記事の判定 (near_duplicates.StoryIndex) のベンチマーク
+- 同じニュースの別媒体の見出し (まとめるべき組) と、語の大半を共有する別のニュース
+  (まとめてはいけない組) を判定し、結果が期待どおりか確認する
+- 過去の記事を模した見出しを索引に登録し、1件あたりの登録・検索の時間を測る
+
+実行方法 (backend ディレクトリから):
+    python benchmarks/bench_near_duplicates.py [--titles 5000] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "batch"))
+
+from near_duplicates import NEAR_DUP_THRESHOLD, StoryIndex, jaccard, title_shingles  # noqa: E402
+
+# 同じニュース (媒体名・見出しラベル・句読点・助詞の違い) : まとめる
+SAME_STORY = [
+    ("上野動物園のパンダ、シャオシャオとレイレイが中国へ返還",
+     "上野動物園のパンダ シャオシャオとレイレイ 中国へ返還 - NHK"),
+    ("【速報】上野動物園のパンダ、シャオシャオとレイレイが中国へ返還",
+     "上野動物園のパンダ、シャオシャオとレイレイが中国へ返還（共同通信）"),
+    ("アドベンチャーワールドでパンダの赤ちゃんが誕生",
+     "アドベンチャーワールドでパンダの赤ちゃん誕生"),
+    ("China to send two giant pandas to San Diego Zoo - BBC News",
+     "China to send two giant pandas to San Diego Zoo | Reuters"),
+    ("China to send two giant pandas to San Diego Zoo",
+     "China will send two giant pandas to the San Diego Zoo"),
+]
+
+# 語の大半を共有する別のニュース (出来事・場所・名前だけが違う) : まとめない
+NEAR_MISS = [
+    ("Giant panda cub born at Tokyo zoo", "Giant panda cub dies at Tokyo zoo"),
+    ("China to send two giant pandas to San Diego Zoo", "China to send two giant pandas to Washington zoo"),
+    ("上野動物園のパンダ シャオシャオが誕生日", "上野動物園のパンダ レイレイが誕生日"),
+    ("上野動物園のパンダ、シャオシャオとレイレイが中国へ返還", "上野動物園のパンダ、シャンシャンが中国へ返還"),
+    ("アドベンチャーワールドでパンダの赤ちゃんが誕生", "アドベンチャーワールドでパンダの赤ちゃんが死亡"),
+    ("神戸の王子動物園、パンダの見学方法を変更", "神戸の王子動物園、パンダの見学を中止"),
+]
+
+_PLACES = ["上野動物園", "王子動物園", "アドベンチャーワールド", "成都", "San Diego Zoo", "Smithsonian"]
+_NAMES = ["シャオシャオ", "レイレイ", "シャンシャン", "タンタン", "Bao Li", "Qing Bao"]
+_EVENTS = ["が誕生", "が死亡", "の公開を再開", "が中国へ返還", "の誕生日を祝う", " arrives", " turns one"]
+
+
+def _history_titles(count: int, seed: int = 1) -> list:
+    """過去 100 時間分の記事を模した見出し (語の重なりが多いもの。同じ見出しは作らない)"""
+    rng = random.Random(seed)
+    return [f"{rng.choice(_PLACES)}のパンダ {rng.choice(_NAMES)}{rng.choice(_EVENTS)} 第{seed}-{i}報"
+            for i in range(count)]
+
+
+def check_pairs() -> dict:
+    """組ごとに、類似度と StoryIndex の判定が期待どおりかを返す"""
+    results = {}
+    for expected, pairs in (("same", SAME_STORY), ("different", NEAR_MISS)):
+        for first, second in pairs:
+            index = StoryIndex()
+            index.add("https://a.example.com/1", first)
+            merged = index.find(second) is not None
+            results[f"{first} / {second}"] = {
+                "expected": expected,
+                "jaccard": round(jaccard(title_shingles(first), title_shingles(second)), 3),
+                "merged": merged,
+                "ok": merged == (expected == "same"),
+            }
+    return results
+
+
+def measure(titles: int) -> dict:
+    history = _history_titles(titles)
+    index = StoryIndex()
+    started = time.perf_counter()
+    for i, title in enumerate(history):
+        index.add(f"https://db.example.com/{i}", title)
+    add_sec = time.perf_counter() - started
+
+    queries = _history_titles(1000, seed=2)
+    started = time.perf_counter()
+    found = sum(1 for title in queries if index.find(title) is not None)
+    find_sec = time.perf_counter() - started
+    return {"titles": titles, "add_us": add_sec / titles * 1e6, "find_us": find_sec / len(queries) * 1e6,
+            "found": found, "queries": len(queries)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--titles", type=int, default=5000, help="索引に登録する過去の見出しの数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    report = {"threshold": NEAR_DUP_THRESHOLD, "pairs": check_pairs(), "timing": measure(args.titles)}
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"類似とみなす Jaccard 係数: {NEAR_DUP_THRESHOLD}")
+        for name, r in report["pairs"].items():
+            label = "まとめる" if r["expected"] == "same" else "まとめない"
+            print(f"  [{'OK' if r['ok'] else 'NG'}] {label:5s} {r['jaccard']:.2f}  {name}")
+        t = report["timing"]
+        print(f"\n索引 {t['titles']} 件: 登録 {t['add_us']:.1f} µs/件  検索 {t['find_us']:.1f} µs/件"
+              f"  (類似あり {t['found']} / {t['queries']} 件)")
+    if not all(r["ok"] for r in report["pairs"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク用のローカルHTTPサーバー (フィード / 記事HTML / 画像のスタンドイン)
+- fixtures/ のテンプレートから RSS 2.0 / RSS 1.0 (RDF) フィード、記事HTML (OGP / JSON-LD / 本文画像)、
+  画像レスポンスを生成して返す
+- 127.0.0.1, 127.0.0.2, ... の複数アドレスで待ち受け、別々のホストとして扱わせる
+  (ホスト単位の制御 host_scheduler が本番と同じように働くようにするため)
+- 遅延・失敗 (503)・極端に遅いレスポンスを、パスごとに決定的に注入できる
+  (同じ設定なら毎回同じURLが失敗するので、コミット間で結果を比較できる)
+
+URLの形式 (run はベンチマークの各回を区別する番号で、回ごとにキャッシュが効かないようにする):
+    /r<run>/feeds/rss/<n>.xml       RSS 2.0 フィード (ETag 付き、If-None-Match で 304)
+    /r<run>/feeds/rdf/<n>.rdf       RSS 1.0 (RDF) フィード
+    /r<run>/feeds/page/<n>.html     RSSリンクだけを含むHTML (フィード発見の経路)
+    /r<run>/articles/<variant>/<id>.html   記事HTML (variant: ogp / jsonld / body)
+    /r<run>/images/<name>.jpg       画像 (HEAD / GET)。名前が missing- で始まるものは 404
+
+単体で起動して手動確認することもできる:
+    python benchmarks/bench_server.py [--hosts 4] [--latency-ms 20]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# 生成するデータの規模
+ITEMS_PER_FEED = 20
+# フィードの記事のうちパンダ関連にする割合 (3件に1件)
+PANDA_ITEM_EVERY = 3
+ARTICLE_VARIANTS = ("ogp", "jsonld", "body")
+IMAGE_BYTES = 8 * 1024
+
+PANDA_TITLES = [
+    "上野動物園のジャイアントパンダ、シャンシャンの近況",
+    "アドベンチャーワールドでパンダの赤ちゃんが誕生",
+    "Giant panda cubs make first public appearance",
+    "神戸の王子動物園、パンダの見学方法を変更",
+]
+OTHER_TITLES = [
+    "日経平均、3日ぶりに反発",
+    "新型スマートフォンの予約受付が開始",
+    "週末は全国的に晴れる見込み",
+    "プロ野球、首位攻防戦を制す",
+]
+
+_ROUTE_RE = re.compile(r"^/r(?P<run>\d+)/(?P<kind>feeds|articles|images)/(?P<rest>.+)$")
+
+
+def _load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def _fraction(key: str, salt: str) -> float:
+    """パスから 0〜1 の値を決定的に作る (失敗注入の対象を毎回同じにするため)"""
+    digest = hashlib.sha1(f"{salt}:{key}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+class FaultInjection:
+    """
+    レスポンスに注入する遅延と失敗の設定
+    - latency_ms (+ 0〜jitter_ms): すべてのレスポンスの前に待つ時間
+    - failure_rate: この割合のパスは 503 を返す
+    - slow_rate / slow_ms: この割合のパスは slow_ms だけ余分に待つ (タイムアウトの確認用)
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, failure_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_ms: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay_for(self, path: str) -> float:
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        delay = self.latency_ms + jitter
+        if self.slow_rate and _fraction(path, "slow") < self.slow_rate:
+            delay += self.slow_ms
+        return delay / 1000.0
+
+    def should_fail(self, path: str) -> bool:
+        return bool(self.failure_rate) and _fraction(path, "fail") < self.failure_rate
+
+    def as_dict(self) -> dict:
+        return {
+            "latency_ms": self.latency_ms,
+            "jitter_ms": self.jitter_ms,
+            "failure_rate": self.failure_rate,
+            "slow_rate": self.slow_rate,
+            "slow_ms": self.slow_ms,
+        }
+
+
+class FixtureSite:
+    """テンプレートからフィード・記事・画像のレスポンスを生成する"""
+
+    def __init__(self, hosts: List[str], article_paragraphs: int = 400):
+        self.hosts = hosts
+        self.article_paragraphs = article_paragraphs
+        self.templates = {name: _load_fixture(name) for name in os.listdir(FIXTURES_DIR)}
+        self._image = b"\xff\xd8\xff\xe0" + bytes(IMAGE_BYTES - 4)
+        self._padding = self._article_padding()
+
+    # --- URL ---
+    def host_for(self, n: int) -> str:
+        return self.hosts[n % len(self.hosts)]
+
+    def feed_url(self, run: int, n: int, fmt: str = "rss") -> str:
+        ext = {"rss": "xml", "rdf": "rdf", "page": "html"}[fmt]
+        return f"{self.host_for(n)}/r{run}/feeds/{fmt}/{n}.{ext}"
+
+    def article_url(self, run: int, n: int, i: int) -> str:
+        variant = ARTICLE_VARIANTS[(n + i) % len(ARTICLE_VARIANTS)]
+        # 記事はフィードとは別のホストに置く (ニュースサイトとCDNが別ホストの構成を模す)
+        return f"{self.host_for(n + i + 1)}/r{run}/articles/{variant}/{n}-{i}.html"
+
+    def image_url(self, run: int, name: str, n: int = 0) -> str:
+        return f"{self.host_for(n + 2)}/r{run}/images/{name}.jpg"
+
+    # --- フィード ---
+    def feed(self, run: int, fmt: str, n: int) -> bytes:
+        item_template = self.templates[f"feed_{'rdf' if fmt == 'rdf' else 'rss2'}_item.xml"]
+        now = datetime.now(timezone.utc)
+        items = []
+        for i in range(ITEMS_PER_FEED):
+            is_panda = i % PANDA_ITEM_EVERY == 0
+            titles = PANDA_TITLES if is_panda else OTHER_TITLES
+            published = now - timedelta(minutes=17 * i + n)
+            items.append(item_template.format(
+                title=escape(f"{titles[(n + i) % len(titles)]} ({n}-{i})"),
+                link=escape(self.article_url(run, n, i)),
+                summary=escape("パンダの話題です。" if is_panda else "今日のニュースです。"),
+                pub_date=format_datetime(published),
+                iso_date=published.isoformat(),
+                category="動物" if is_panda else "総合",
+            ))
+        template = self.templates["feed_rdf.xml" if fmt == "rdf" else "feed_rss2.xml"]
+        return template.format(
+            feed_title=escape(f"ベンチマーク用フィード {n}"),
+            base=self.host_for(n),
+            items="\n".join(items),
+        ).encode("utf-8")
+
+    def feed_page(self, run: int, n: int) -> bytes:
+        # HTMLの中からRSSリンクを見つけて取り直す経路 (_discover_rss_link_from_html)
+        return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>ニュース一覧 {n}</title>'
+                f'<link rel="alternate" type="application/rss+xml" href="/r{run}/feeds/rss/{n}.xml">'
+                f'</head><body><p>最新のニュース</p></body></html>').encode("utf-8")
+
+    # --- 記事 ---
+    def _article_padding(self) -> dict:
+        return {
+            "head_padding": "\n".join(f'<link rel="stylesheet" href="/static/css/{i}.css">' for i in range(30))
+                            + "<script>" + "var x = 1;" * 2000 + "</script>",
+            "nav": "".join(f'<a href="/c/{i}">カテゴリ{i}</a>' for i in range(100)),
+            "paragraphs": "\n".join(f"<p>パンダに関する記事の段落 {i}。<span>詳細</span></p>"
+                                    for i in range(self.article_paragraphs)),
+            "footer": "<div>footer</div>" * 200,
+        }
+
+    def article(self, run: int, variant: str, article_id: str) -> Optional[bytes]:
+        template = self.templates.get(f"article_{variant}.html")
+        if template is None:
+            return None
+        n = int(article_id.split("-")[0]) if article_id.split("-")[0].isdigit() else 0
+        return template.format(
+            title=f"パンダの記事 {article_id}",
+            image=self.image_url(run, f"{variant}-{article_id}", n),
+            fallback_image=self.image_url(run, f"fallback-{article_id}", n),
+            dead_image=self.image_url(run, f"missing-{article_id}", n),
+            **self._padding,
+        ).encode("utf-8")
+
+    # --- 画像 ---
+    def image(self, name: str) -> Optional[bytes]:
+        if name.startswith("missing-"):
+            return None
+        return self._image
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "BenchFixture/1.0"
+
+    # 標準エラーへのアクセスログは出さない
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _send(self, status: int, body: bytes, content_type: str, send_body: bool, headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if send_body and body:
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # クライアントが先頭だけ読んで切断した (高速パスの挙動)
+                pass
+
+    def _respond(self, send_body: bool):
+        site: FixtureSite = self.server.site
+        faults: FaultInjection = self.server.faults
+        path = self.path.split("?", 1)[0]
+        self.server.count_request()
+
+        delay = faults.delay_for(path)
+        if delay:
+            time.sleep(delay)
+        if faults.should_fail(path):
+            self._send(503, b"injected failure", "text/plain", send_body)
+            return
+
+        m = _ROUTE_RE.match(path)
+        if not m:
+            self._send(404, b"not found", "text/plain", send_body)
+            return
+        run, kind, rest = int(m.group("run")), m.group("kind"), m.group("rest")
+
+        if kind == "feeds":
+            fmt, _, name = rest.partition("/")
+            n = int(name.split(".")[0]) if name.split(".")[0].isdigit() else 0
+            if fmt == "page":
+                self._send(200, site.feed_page(run, n), "text/html; charset=utf-8", send_body)
+                return
+            if fmt not in ("rss", "rdf"):
+                self._send(404, b"not found", "text/plain", send_body)
+                return
+            etag = '"' + hashlib.sha1(path.encode("utf-8")).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, b"", "application/xml", False, {"ETag": etag})
+                return
+            content_type = "application/rdf+xml" if fmt == "rdf" else "application/rss+xml"
+            self._send(200, site.feed(run, fmt, n), content_type + "; charset=utf-8", send_body, {"ETag": etag})
+        elif kind == "articles":
+            variant, _, name = rest.partition("/")
+            body = site.article(run, variant, name.rsplit(".", 1)[0])
+            if body is None:
+                self._send(404, b"not found", "text/plain", send_body)
+                return
+            self._send(200, body, "text/html; charset=utf-8", send_body)
+        else:
+            body = site.image(rest.rsplit(".", 1)[0])
+            if body is None:
+                self._send(404, b"not found", "text/plain", send_body)
+                return
+            self._send(200, body, "image/jpeg", send_body)
+
+
+class _FixtureHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, site: FixtureSite, faults: FaultInjection, counter: dict, counter_lock):
+        super().__init__(address, _Handler)
+        self.site = site
+        self.faults = faults
+        self._counter = counter
+        self._counter_lock = counter_lock
+
+    def handle_error(self, request, client_address):
+        # クライアント側の切断 (keep-alive の終了や読み込み途中での close) は無視する
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def count_request(self) -> None:
+        with self._counter_lock:
+            self._counter["requests"] += 1
+
+
+class BenchServer:
+    """
+    複数のループバックアドレスでフィクスチャを配信するサーバー群
+    with BenchServer(hosts=4, faults=FaultInjection(latency_ms=20)) as server:
+        server.site.feed_url(0, 1)
+    """
+
+    def __init__(self, hosts: int = 4, faults: Optional[FaultInjection] = None, article_paragraphs: int = 400):
+        self.faults = faults or FaultInjection()
+        self._servers: List[_FixtureHTTPServer] = []
+        self._threads: List[threading.Thread] = []
+        self._counter = {"requests": 0}
+        self._counter_lock = threading.Lock()
+        self._host_count = max(1, hosts)
+        self._article_paragraphs = article_paragraphs
+        self.site: Optional[FixtureSite] = None
+
+    def start(self) -> "BenchServer":
+        base_urls = []
+        for i in range(self._host_count):
+            address = f"127.0.0.{i + 1}"
+            try:
+                server = _FixtureHTTPServer((address, 0), None, self.faults, self._counter, self._counter_lock)
+            except OSError:
+                # 127.0.0.2 以降が使えない環境 (macOS など) では 127.0.0.1 のポート違いで代用する
+                # (この場合 host_scheduler からは1つのホストに見える)
+                server = _FixtureHTTPServer(("127.0.0.1", 0), None, self.faults, self._counter, self._counter_lock)
+            host, port = server.server_address[:2]
+            base_urls.append(f"http://{host}:{port}")
+            self._servers.append(server)
+
+        self.site = FixtureSite(base_urls, article_paragraphs=self._article_paragraphs)
+        for server in self._servers:
+            server.site = self.site
+            thread = threading.Thread(target=server.serve_forever, name="bench-server", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers.clear()
+        self._threads.clear()
+
+    @property
+    def request_count(self) -> int:
+        with self._counter_lock:
+            return self._counter["requests"]
+
+    def __enter__(self) -> "BenchServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", type=int, default=4, help="待ち受けるホスト (ループバックアドレス) の数")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="全レスポンスに加える遅延 (ミリ秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="503 を返すパスの割合")
+    args = parser.parse_args()
+
+    faults = FaultInjection(latency_ms=args.latency_ms, failure_rate=args.failure_rate)
+    with BenchServer(hosts=args.hosts, faults=faults) as server:
+        print("フィクスチャサーバーを起動しました (Ctrl+C で終了)")
+        for n in range(min(args.hosts, 3)):
+            print(f"  {server.site.feed_url(0, n)}")
+            print(f"  {server.site.article_url(0, n, 0)}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+記事URLの正規化 (url_canonical.canonicalize_url) のベンチマーク
+- トラッキング用パラメータ・AMP版・既定ポートなどを含むURLを正規化し、結果が期待どおりか確認する
+  (変えてはいけないURL: 値の無いクエリ、/amp で終わる通常のページ、IPv6 アドレスのホストなど)
+- 1件あたりの正規化の時間を測る
+
+実行方法 (backend ディレクトリから):
+    python benchmarks/bench_url_canonical.py [--urls 20000] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "batch"))
+
+from url_canonical import canonicalize_url  # noqa: E402
+
+# (入力, 期待する正規化の結果)
+CASES = [
+    # ホストの小文字化、既定ポート・フラグメント・トラッキング用パラメータの除去
+    ("https://Example.COM:443/news/1#top", "https://example.com/news/1"),
+    ("https://example.com/a?b=1&utm_medium=rss&c=%E3%81%82", "https://example.com/a?b=1&c=%E3%81%82"),
+    ("https://news.yahoo.co.jp/articles/abc?source=rss", "https://news.yahoo.co.jp/articles/abc"),
+    ("https://user:pw@example.com:8443/p?fbclid=1", "https://user:pw@example.com:8443/p"),
+    # 除くものが無いクエリは元の文字列のまま
+    ("https://example.com/article?12345", "https://example.com/article?12345"),
+    ("https://example.com/a?z=1&a=%20", "https://example.com/a?z=1&a=%20"),
+    # AMP版から通常版へ (末尾の /amp は AMP の印がある場合だけ除く)
+    ("https://example.com/story.amp.html", "https://example.com/story.html"),
+    ("https://example.com/news/2024/amp/?amp=1", "https://example.com/news/2024"),
+    ("https://www-example-com.cdn.ampproject.org/c/s/www.example.com/news/amp", "https://www.example.com/news"),
+    ("https://example.com/amp", "https://example.com/amp"),
+    ("https://example.com/news/2024/amp/", "https://example.com/news/2024/amp/"),
+    # IPv6 アドレスのホストは角括弧を残す
+    ("https://[::1]:8080/x", "https://[::1]:8080/x"),
+    ("http://[::1]:80/a#f", "http://[::1]/a"),
+    ("https://[2001:DB8::1]/news?utm_source=x&id=3", "https://[2001:db8::1]/news?id=3"),
+    # 解析できない・対象外のURLはそのまま
+    ("mailto:panda@example.com", "mailto:panda@example.com"),
+    ("https://[::1/x", "https://[::1/x"),
+]
+
+
+def check_cases() -> dict:
+    """入力ごとに、正規化の結果が期待どおりかを返す"""
+    results = {}
+    for url, expected in CASES:
+        actual = canonicalize_url(url)
+        results[url] = {"expected": expected, "actual": actual, "ok": actual == expected}
+    return results
+
+
+def measure(count: int) -> dict:
+    # canonicalize_url は結果をキャッシュするので、毎回異なるURLにする
+    urls = [f"https://Example.com/news/{i}.amp.html?utm_source=rss&id={i}#top" for i in range(count)]
+    canonicalize_url.cache_clear()
+    started = time.perf_counter()
+    for url in urls:
+        canonicalize_url(url)
+    elapsed = time.perf_counter() - started
+    return {"urls": count, "canonicalize_us": elapsed / count * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=20000, help="速度の計測に使うURLの数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    report = {"cases": check_cases(), "timing": measure(args.urls)}
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for url, r in report["cases"].items():
+            print(f"  [{'OK' if r['ok'] else 'NG'}] {url} → {r['actual']}"
+                  + ("" if r["ok"] else f" (期待: {r['expected']})"))
+        t = report["timing"]
+        print(f"\n{t['urls']} 件: 正規化 {t['canonicalize_us']:.1f} µs/件")
+    if not all(r["ok"] for r in report["cases"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()